@@ -0,0 +1,81 @@
+"""
+Abuse matcher benchmark: per-message cost as the word list grows.
+
+    python -m benchmarks.abuse_matcher
+    python -m benchmarks.abuse_matcher --sizes 100 10000 100000
+
+The shipped list is padded with random synthetic terms (a mix of words and
+three-word phrases). Matching cost should stay flat across sizes because the
+automaton makes one pass over the normalized message.
+"""
+import argparse
+import random
+import string
+import time
+
+from services.abuse_matcher import AbuseMatcher, normalize
+from utils import ABUSIVE
+
+CHATTER = (
+    "hey everyone what time is the meeting tomorrow",
+    "lol that was hilarious 😂 send the link again pls",
+    "Can someone explain how the new update works? I tried restarting but nothing changed.",
+    "good morning!!! have a great day all",
+    "Bhai kal ka plan kya hai, sab log aa rahe ho na?",
+    "check the pinned message for the rules, thanks",
+)
+
+
+def synthetic_terms(count: int, rng: random.Random):
+    def word():
+        return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+    for i in range(count):
+        yield ' '.join(word() for _ in range(3)) if i % 10 == 0 else word()
+
+
+def make_messages(count: int, rng: random.Random):
+    messages = []
+    for _ in range(count):
+        text = rng.choice(CHATTER)
+        if rng.random() < 0.1:
+            text += ' ' + rng.choice(sorted(ABUSIVE))
+        messages.append(text)
+    return messages
+
+
+def bench(matcher: AbuseMatcher, messages) -> float:
+    start = time.perf_counter()
+    for text in messages:
+        matcher.contains(text)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 1000, 10000, 50000],
+                        help="Number of synthetic terms added to the shipped list")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = make_messages(args.messages, rng)
+
+    start = time.perf_counter()
+    for text in messages:
+        normalize(text)
+    normalize_us = (time.perf_counter() - start) / len(messages) * 1e6
+    print(f"normalize only: {normalize_us:.1f} us/message\n")
+
+    print(f"{'terms':>8}{'nodes':>10}{'build s':>10}{'us/message':>12}")
+    for size in args.sizes:
+        terms = list(ABUSIVE) + list(synthetic_terms(size, rng))
+        start = time.perf_counter()
+        matcher = AbuseMatcher(terms)
+        build = time.perf_counter() - start
+        per_message = bench(matcher, messages)
+        print(f"{len(terms):>8}{len(matcher._goto):>10}{build:>10.2f}{per_message:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
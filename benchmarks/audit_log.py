@@ -0,0 +1,106 @@
+"""
+Moderation log benchmark: bulk insert rate, /modlog page latency and pruning at scale.
+
+    python -m benchmarks.audit_log
+    python -m benchmarks.audit_log --rows 20000000 --weeks 26
+
+Fills a temporary SQLite file with --rows entries spread over --weeks weekly
+partitions and --chats chats through the same flush path the bot uses, then
+times the first page, a page deep into the history (via its cursor) and a
+per-user page for a busy chat, and finally drops the weeks past the retention.
+Page times should not move as --rows grows.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from services.audit_log import FLUSH_BATCH, PARTITION_SECONDS, RETENTION_DAYS, SQL_PAGE, AuditLog, _table
+from services.storage import Storage
+
+ACTIONS = ("delete", "delete", "delete", "warn", "mute", "kick", "ban")
+
+
+async def fill(log: AuditLog, rows: int, weeks: int, chats: int, users: int, rng: random.Random) -> float:
+    """Inserts `rows` entries in FLUSH_BATCH transactions, oldest first; returns rows per second."""
+    now = int(time.time())
+    start_ts = now - weeks * PARTITION_SECONDS
+    step = weeks * PARTITION_SECONDS / rows
+    busy = -(10 ** 12)  # A quarter of the traffic is one chat, so its pages hit a large index range
+    start = time.perf_counter()
+    for first in range(0, rows, FLUSH_BATCH):
+        for i in range(first, min(rows, first + FLUSH_BATCH)):
+            chat_id = busy if rng.random() < 0.25 else busy - rng.randint(1, chats)
+            log._queue.append((int(start_ts + i * step), chat_id, rng.randint(1, users), 0,
+                               rng.choice(ACTIONS), "prohibited links"))
+        await log.flush()
+    return rows / (time.perf_counter() - start)
+
+
+async def timed(coro, repeat: int = 20) -> tuple:
+    """(median ms, result of the last run)."""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await coro()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000, result
+
+
+async def run(args) -> None:
+    tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    path = os.path.join(tmp_dir, f"guardian-modlog-{os.getpid()}.db")
+    storage = Storage(path)
+    log = AuditLog()
+    log.setup(storage)
+    rng = random.Random(args.seed)
+    busy = -(10 ** 12)
+    try:
+        rate = await fill(log, args.rows, args.weeks, args.chats, args.users, rng)
+        size = os.path.getsize(path) / 2 ** 20
+        print(f"inserted {args.rows:,} rows in {len(log._partitions)} partitions: {rate:,.0f} rows/s, {size:,.0f} MiB")
+
+        def plan(conn):
+            partition = max(log._partitions)
+            return " | ".join(row[-1] for row in conn.execute(
+                "EXPLAIN QUERY PLAN " + SQL_PAGE.format(table=_table(partition)), (busy, 2 ** 62, 2 ** 62, 15)))
+        print(f"page plan: {await storage.read(plan)}")
+
+        first_ms, page = await timed(lambda: log.page(busy, 15))
+        print(f"first page:       {first_ms:8.3f} ms")
+        cursor = page[-1].ts, page[-1].id
+        for _ in range(args.deep_pages):
+            page = await log.page(busy, 15, before=cursor)
+            cursor = page[-1].ts, page[-1].id
+        deep_ms, page = await timed(lambda: log.page(busy, 15, before=cursor))
+        print(f"page {args.deep_pages + 1:<6}       {deep_ms:8.3f} ms  (back to {time.strftime('%Y-%m-%d', time.gmtime(page[0].ts))})")
+        user_id = rng.randint(1, args.users)
+        user_ms, page = await timed(lambda: log.page(busy, 15, user_id=user_id))
+        print(f"one user's page:  {user_ms:8.3f} ms  ({len(page)} entries)")
+
+        start = time.perf_counter()
+        dropped = await log.prune(RETENTION_DAYS)
+        print(f"prune {RETENTION_DAYS} days:   {(time.perf_counter() - start) * 1000:8.1f} ms  ({dropped} partitions dropped)")
+    finally:
+        await storage.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--weeks", type=int, default=26, help="Weeks the rows are spread over")
+    parser.add_argument("--chats", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--deep-pages", type=int, default=500, help="Pages walked before timing a deep page")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Offline throughput benchmark for the full handler stack.
+
+Feeds generated update streams through a real Dispatcher built by
+register_all_handlers. The Bot uses a fake session that records every API
+call and answers after an injected latency, so nothing reaches Telegram.
+
+    python -m benchmarks.dispatcher                       # fakeredis, all scenarios
+    python -m benchmarks.dispatcher --redis-url redis://localhost:6379/15 --latency 0.03
+    python -m benchmarks.dispatcher --scenario flood --updates 20000 --concurrency 200
+
+Reports updates/s, p50/p99 handler latency, Bot API calls and Redis round trips per update
+(a pipeline or script call counts as one).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetChatAdministrators, GetChatMember, SendMessage, TelegramMethod
+from aiogram.types import Chat, ChatMemberAdministrator, ChatMemberMember, ChatMemberOwner, Message, Update, User
+
+import utils
+from handlers import register_all_handlers
+from services.admin_cache import admin_cache
+from services.deletion_scheduler import deletion_scheduler
+from services.outbound import OutboundScheduler
+from services.warning_counter import warning_counter
+from services.settings import chat_settings
+from services.join_aggregator import join_aggregator
+from services.verdict_cache import verdict_cache
+from services.reputation import reputation
+from services.link_classifier import link_classifier
+from services.flood_limiter import flood_limiter
+from services.username_index import username_index
+from services.message_index import message_index
+from services.audit_log import audit_log
+from services.metrics import REDIS_CALLS_PER_UPDATE, InstrumentedRedis
+from services.redis_batch import BatchedRedisStorage
+
+OWNER_ID = 1
+ADMIN_ID = 10
+BOT_ID = 42
+CHATTER = (
+    "hey everyone what time is the meeting tomorrow",
+    "lol that was hilarious 😂",
+    "Can someone explain how the new update works? I tried restarting but nothing changed.",
+    "good morning!!! have a great day all",
+    "Bhai kal ka plan kya hai, sab log aa rahe ho na?",
+)
+
+
+class FakeSession(BaseSession):
+    """Records API calls and answers them after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = iter(range(10 ** 9, 10 ** 10))
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, GetChatAdministrators):
+            return [
+                ChatMemberOwner(user=User(id=OWNER_ID, is_bot=False, first_name="Owner"), is_anonymous=False),
+                ChatMemberAdministrator.model_construct(
+                    status="administrator", user=User(id=ADMIN_ID, is_bot=False, first_name="Admin"),
+                ),
+            ]
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="Member"))
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=next(self._message_ids), date=int(time.time()),
+                chat=Chat(id=method.chat_id, type="supergroup"), text=method.text,
+            )
+        return True
+
+
+# --- UPDATE STREAMS ---
+class StreamFactory:
+    def __init__(self, chats: int, seed: int):
+        self.rng = random.Random(seed)
+        self.chats = [-(10 ** 12) - i for i in range(chats)]
+        self._ids = iter(range(1, 10 ** 9))
+
+    def _message(self, chat_id: int, user_id: int, text: str) -> dict:
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "text": text,
+            },
+        }
+
+    def _join(self, chat_id: int, user_id: int) -> dict:
+        user = {"id": user_id, "is_bot": False, "first_name": f"Raider{user_id}"}
+        return {
+            "update_id": next(self._ids),
+            "chat_member": {
+                "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+                "from": user, "date": int(time.time()),
+                "old_chat_member": {"status": "left", "user": user},
+                "new_chat_member": {"status": "member", "user": user},
+            },
+        }
+
+    def _user(self) -> int:
+        return self.rng.randint(1000, 10 ** 6)
+
+    def clean(self, n: int) -> List[dict]:
+        return [self._message(self.rng.choice(self.chats), self._user(), self.rng.choice(CHATTER)) for _ in range(n)]
+
+    def links(self, n: int) -> List[dict]:
+        return [self._message(self.rng.choice(self.chats), self._user(),
+                              f"FREE crypto 💰 https://spam{i % 50}.example/claim t.me/joinchat/x{i}") for i in range(n)]
+
+    def abuse(self, n: int) -> List[dict]:
+        words = sorted(utils.ABUSIVE)
+        return [self._message(self.rng.choice(self.chats), self._user(),
+                              f"{self.rng.choice(CHATTER)} {self.rng.choice(words)}") for _ in range(n)]
+
+    def flood(self, n: int) -> List[dict]:
+        updates = []
+        while len(updates) < n:
+            chat_id, user_id = self.rng.choice(self.chats), self._user()
+            updates.extend(self._message(chat_id, user_id, f"spam {i}") for i in range(20))
+        return updates[:n]
+
+    def join_raid(self, n: int) -> List[dict]:
+        return [self._join(self.rng.choice(self.chats), self._user()) for _ in range(n)]
+
+    def admin_commands(self, n: int) -> List[dict]:
+        commands = ("/warn {}", "/checkwarns {}", "/mute {} 10m", "/unmute {}")
+        return [self._message(self.rng.choice(self.chats), ADMIN_ID,
+                              self.rng.choice(commands).format(self._user())) for _ in range(n)]
+
+    def purge(self, n: int) -> List[dict]:
+        """Raid chatter in every chat, then one /purge per chat to clear it in bulk."""
+        chatter = [self._message(self.rng.choice(self.chats), self._user(), self.rng.choice(CHATTER))
+                   for _ in range(n - len(self.chats))]
+        return chatter + [self._message(chat_id, ADMIN_ID, "/purge 1000") for chat_id in self.chats]
+
+
+SCENARIOS: Dict[str, Callable[[StreamFactory, int], List[dict]]] = {
+    "clean": StreamFactory.clean,
+    "links": StreamFactory.links,
+    "abuse": StreamFactory.abuse,
+    "flood": StreamFactory.flood,
+    "join_raid": StreamFactory.join_raid,
+    "admin_commands": StreamFactory.admin_commands,
+    "purge": StreamFactory.purge,
+}
+
+
+# --- RUNNER ---
+async def run_scenario(dp: Dispatcher, bot: Bot, session: FakeSession, updates: List[dict],
+                       concurrency: int) -> dict:
+    parsed = [Update.model_validate(u, context={"bot": bot}) for u in updates]
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    session.calls.clear()
+    redis_calls = REDIS_CALLS_PER_UPDATE._default
+    redis_before = redis_calls.sum, redis_calls.count
+
+    async def feed(update: Update):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(feed(u) for u in parsed))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "updates_per_s": len(parsed) / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "calls_per_update": sum(session.calls.values()) / len(parsed),
+        "redis_per_update": (redis_calls.sum - redis_before[0]) / max(1, redis_calls.count - redis_before[1]),
+        "top_calls": ", ".join(f"{name}={count}" for name, count in session.calls.most_common(3)),
+        "errors": errors,
+    }
+
+
+async def run(args) -> None:
+    if args.redis_url:
+        redis = InstrumentedRedis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+        # Same pool as the fake server, but every command is counted like in production
+        redis = InstrumentedRedis(connection_pool=fakeredis.FakeAsyncRedis(decode_responses=True).connection_pool)
+    await redis.flushdb()
+
+    # SQLite on tmpfs when available, so the disk is not what we measure
+    tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    db_path = os.path.join(tmp_dir, f"guardian-bench-{os.getpid()}.db")
+    utils.storage.path = db_path
+    await utils.init_db()
+
+    session = FakeSession(latency=args.latency)
+    bot = Bot(f"{BOT_ID}:BENCHMARK", session=session)
+    if args.outbound:
+        session.middleware(OutboundScheduler())
+    dp = Dispatcher(storage=BatchedRedisStorage(redis=redis))
+    admin_cache.setup(redis)
+    deletion_scheduler.setup(redis)
+    warning_counter.setup(redis, utils.storage)
+    chat_settings.setup(redis, utils.storage)
+    join_aggregator.setup(redis)
+    verdict_cache.setup(redis)
+    reputation.setup(redis)
+    link_classifier.setup(utils.storage)
+    flood_limiter.setup(redis)
+    username_index.setup(redis)
+    message_index.setup(redis)
+    audit_log.setup(utils.storage)
+    register_all_handlers(dp)
+    await message_index.start()
+    await audit_log.start()  # Its bulk inserts share the SQLite thread with the handlers, as in production
+
+    factory = StreamFactory(args.chats, args.seed)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    print(f"{'scenario':<16}{'updates/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'calls/upd':>11}{'redis/upd':>11}"
+          f"{'errors':>8}  top calls")
+    for name in names:
+        updates = SCENARIOS[name](factory, args.updates)
+        result = await run_scenario(dp, bot, session, updates, args.concurrency)
+        print(f"{name:<16}{result['updates_per_s']:>11.0f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['calls_per_update']:>11.2f}{result['redis_per_update']:>11.2f}"
+              f"{result['errors']:>8}  {result['top_calls']}")
+
+    await message_index.stop()
+    await audit_log.stop()
+    await utils.storage.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    await redis.flushdb()
+    await redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--updates", type=int, default=2000, help="Updates per scenario")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=100, help="Updates in flight (polling runs them as tasks)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every fake API call")
+    parser.add_argument("--outbound", action="store_true", help="Enable the outbound rate-limit scheduler")
+    parser.add_argument("--redis-url", help="Real Redis (database is FLUSHED); default is fakeredis")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
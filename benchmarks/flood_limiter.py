@@ -0,0 +1,142 @@
+"""
+Flood limiter micro-benchmark: legacy list implementation, the Lua sliding window
+on every message, and the hybrid local + Redis limiter.
+
+    python -m benchmarks.flood_limiter --redis-url redis://localhost:6379/15
+    python -m benchmarks.flood_limiter --fake      # fakeredis, no server needed
+
+Reports sequential latency, concurrent throughput, whether a burst of
+concurrent messages from one user is counted exactly, and the local windows'
+memory per tracked user (measured with tracemalloc vs. the limiter's own report).
+"""
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+from datetime import datetime
+
+from redis.asyncio import Redis
+
+from services.flood_limiter import FloodLimiter
+
+LIMIT = 5
+PERIOD = 5
+
+
+async def legacy_hit(redis, chat_id: int, user_id: int) -> int:
+    """The pre-Lua implementation from group_guard, kept verbatim for comparison."""
+    key = f"flood_timestamps:{chat_id}:{user_id}"
+    current_time = datetime.now().timestamp()
+    await redis.rpush(key, current_time)
+    timestamps = [float(ts) for ts in await redis.lrange(key, 0, -1)]
+    valid_timestamps = [ts for ts in timestamps if current_time - ts <= PERIOD]
+    if len(valid_timestamps) > LIMIT:
+        await redis.delete(key)
+        return len(valid_timestamps)
+    await redis.delete(key)
+    if valid_timestamps:
+        await redis.rpush(key, *[str(ts) for ts in valid_timestamps])
+        await redis.expire(key, PERIOD)
+    return len(valid_timestamps)
+
+
+def make_limiter_hit(redis, limiter: FloodLimiter):
+    if redis is not None:
+        limiter.setup(redis)
+
+    async def limiter_hit(_redis, chat_id: int, user_id: int) -> int:
+        return await limiter.hit(chat_id, user_id)
+    return limiter_hit
+
+
+class BrokenRedis:
+    """Every script call fails, as during a Redis outage."""
+
+    def register_script(self, script):
+        async def call(*args, **kwargs):
+            raise ConnectionError("redis is down")
+        return call
+
+
+async def sequential(redis, hit, n: int) -> float:
+    """Average microseconds per call; users rotate so nobody trips the limit."""
+    start = time.perf_counter()
+    for i in range(n):
+        await hit(redis, -100, i % 1000)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def concurrent(redis, hit, n: int, parallel: int) -> float:
+    """Calls per second with `parallel` coroutines in flight."""
+    async def worker(offset: int):
+        for i in range(n // parallel):
+            await hit(redis, -200, offset * 100000 + i % 1000)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(p) for p in range(parallel)))
+    return n / (time.perf_counter() - start)
+
+
+async def burst_accuracy(redis, hit, size: int) -> int:
+    """Sends `size` messages from one user at once; returns the highest count seen."""
+    await redis.delete("flood_timestamps:-300:1", "flood:-300:1")
+    counts = await asyncio.gather(*(hit(redis, -300, 1) for _ in range(size)))
+    return max(counts)
+
+
+async def run(args):
+    if args.fake:
+        import fakeredis
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        redis = Redis.from_url(args.redis_url, decode_responses=True)
+    await redis.flushdb()
+
+    implementations = {
+        "legacy (list)": lambda: legacy_hit,
+        "lua every msg": lambda: make_limiter_hit(redis, FloodLimiter(LIMIT, PERIOD, sync_fraction=0)),
+        "hybrid": lambda: make_limiter_hit(redis, FloodLimiter(LIMIT, PERIOD)),
+        "local only": lambda: make_limiter_hit(None, FloodLimiter(LIMIT, PERIOD)),
+        "redis down": lambda: make_limiter_hit(BrokenRedis(), FloodLimiter(LIMIT, PERIOD)),
+    }
+    logging.getLogger("services.flood_limiter").setLevel(logging.ERROR)
+    print(f"{'implementation':<16}{'us/call':>10}{'calls/s':>12}{'burst count':>14}")
+    for name, make in implementations.items():
+        latency = await sequential(redis, make(), args.n)
+        throughput = await concurrent(redis, make(), args.n, args.parallel)
+        burst = await burst_accuracy(redis, make(), LIMIT + 1)
+        print(f"{name:<16}{latency:>10.1f}{throughput:>12.0f}{burst:>11}/{LIMIT + 1}")
+
+    await redis.flushdb()
+    await redis.aclose()
+    await memory(args.users)
+
+
+async def memory(users: int):
+    """Local windows for `users` distinct (chat, user) pairs, each a few messages deep."""
+    limiter = FloodLimiter(LIMIT, PERIOD, max_users=users)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(users):
+        await limiter.hit(-1000000000000 - user_id % 500, 100000000 + user_id)
+    measured = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    report = limiter.memory()
+    print(f"\nLocal windows at limit {LIMIT}: {users:,} users, measured {measured / users:.0f} B/user "
+          f"({measured / 2**20:.1f} MiB), reported {report['bytes_per_user']} B/user "
+          f"({report['bytes'] / 2**20:.1f} MiB); capped at {report['max_users']:,} users")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15",
+                        help="Database is FLUSHED before and after the run")
+    parser.add_argument("--fake", action="store_true", help="Use fakeredis instead of a server")
+    parser.add_argument("-n", type=int, default=5000, help="Calls per measurement")
+    parser.add_argument("--parallel", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100_000, help="Distinct users for the memory report")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Link classifier benchmark: per-message cost and index build time as deny lists grow.
+
+    python -m benchmarks.link_classifier
+    python -m benchmarks.link_classifier --sizes 1000 100000 1000000
+
+Each size builds a global DomainIndex of N random deny rules plus a small
+per-chat allow list, then classifies a mix of chatter, links to listed and
+unlisted domains and t.me channels. The trie lookup walks the host's labels,
+so its cost should stay flat; the naive column checks every rule with
+endswith() and is only run for sizes up to --naive-max.
+"""
+import argparse
+import random
+import string
+import time
+
+from services.link_classifier import ALLOW, DENY, DomainIndex, LinkPolicy, extract_hosts
+
+CHATTER = (
+    "hey everyone what time is the meeting tomorrow",
+    "see v1.2 release notes in changelog.txt",
+    "Bhai kal ka plan kya hai, sab log aa rahe ho na?",
+    "check the pinned message for the rules, thanks",
+)
+ALLOWED = ("docs.python.org", "github.com", "t.me/ourgroup")
+
+
+def random_domain(rng: random.Random) -> str:
+    name = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(5, 14)))
+    return f"{name}.{rng.choice(('com', 'xyz', 'ru', 'top', 'info', 'click'))}"
+
+
+def make_messages(count: int, denied: list, rng: random.Random) -> list:
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        text = rng.choice(CHATTER)
+        if roll < 0.2:
+            text += f" https://promo.{rng.choice(denied)}/win?ref={rng.randint(1, 9999)}"
+        elif roll < 0.3:
+            text += f" {rng.choice(ALLOWED)}/some/page"
+        elif roll < 0.4:
+            text += f" visit {random_domain(rng)} now"
+        messages.append(text)
+    return messages
+
+
+def naive_forbidden(hosts, rules) -> bool:
+    """What a flat list costs: every host against every rule."""
+    for host in hosts:
+        action = DENY
+        for domain, rule in rules:
+            if host == domain or host.endswith('.' + domain):
+                action = rule
+                break
+        if action == DENY:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000, 1_000_000],
+                        help="Global deny rules")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--naive-max", type=int, default=10_000, help="Largest size the naive scan runs for")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chat_rules = [(host, ALLOW) for host in extract_hosts(" ".join(ALLOWED))]
+    chat_index = DomainIndex(chat_rules)
+
+    start = time.perf_counter()
+    for text in make_messages(args.messages, [random_domain(rng)], rng):
+        extract_hosts(text)
+    extract_us = (time.perf_counter() - start) / args.messages * 1e6
+    print(f"extract_hosts only: {extract_us:.1f} us/message\n")
+
+    print(f"{'rules':>9}{'build s':>10}{'trie us/msg':>13}{'naive us/msg':>14}{'removed':>9}")
+    for size in args.sizes:
+        denied = [random_domain(rng) for _ in range(size)]
+        start = time.perf_counter()
+        policy = LinkPolicy(DomainIndex((domain, DENY) for domain in denied), chat_index, "bench")
+        build = time.perf_counter() - start
+
+        messages = make_messages(args.messages, denied, rng)
+        hosts = [extract_hosts(text) for text in messages]
+        start = time.perf_counter()
+        removed = sum(policy.forbidden(h) for h in hosts)
+        trie_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+        naive = "-"
+        if size <= args.naive_max:
+            rules = chat_rules + [(domain, DENY) for domain in denied]
+            sample = hosts[:max(1, min(len(hosts), 2_000_000 // max(size, 1)))]
+            start = time.perf_counter()
+            for h in sample:
+                naive_forbidden(h, rules)
+            naive = f"{(time.perf_counter() - start) / len(sample) * 1e6:.1f}"
+        print(f"{size:>9}{build:>10.2f}{trie_us:>13.2f}{naive:>14}{removed / len(messages):>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
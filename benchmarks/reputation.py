@@ -0,0 +1,123 @@
+"""
+Reputation sketch benchmark: memory, accuracy at scale and Redis cost per call.
+
+    python -m benchmarks.reputation                 # 1M violators, fakeredis for the latency part
+    python -m benchmarks.reputation --users 5000000 --redis-url redis://localhost:6379/15
+
+Accuracy is measured on an in-memory copy of one epoch's sketch built with the
+same counter_indexes() as the service: N users with violations, then N clean
+users looked up. Reports how many clean users would be treated as suspects or
+muted on join (false positives) and the average overestimate for offenders.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from redis.asyncio import Redis
+
+from services.reputation import (
+    AUTO_RESTRICT_SCORE, DEPTH, EPOCHS, KEY, SUSPECT_SCORE, WIDTH, Reputation, counter_indexes, current_epoch,
+)
+
+
+def violations(rng: random.Random) -> int:
+    """Mostly one-off offenders with a tail of persistent spammers."""
+    roll = rng.random()
+    if roll < 0.90:
+        return 1
+    if roll < 0.99:
+        return rng.randint(2, 3)
+    return rng.randint(5, 20)
+
+
+def accuracy(users: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    sketch = bytearray(DEPTH * WIDTH)
+    truth = []
+    for user_id in range(1, users + 1):
+        count = violations(rng)
+        truth.append(count)
+        for index in counter_indexes(user_id):
+            sketch[index] = min(255, sketch[index] + count)
+
+    overestimate = 0
+    for user_id in range(1, users + 1):
+        estimate = min(sketch[i] for i in counter_indexes(user_id))
+        overestimate += estimate - truth[user_id - 1]
+
+    suspects = muted = 0
+    clean_users = range(users + 1, 2 * users + 1)
+    for user_id in clean_users:
+        estimate = min(sketch[i] for i in counter_indexes(user_id))
+        suspects += estimate >= SUSPECT_SCORE
+        muted += estimate >= AUTO_RESTRICT_SCORE
+    return {
+        "overestimate": overestimate / users,
+        "suspect_fp": suspects / users,
+        "muted_fp": muted / users,
+        "load": sum(1 for b in sketch if b) / len(sketch),
+    }
+
+
+async def latency(redis, n: int) -> tuple:
+    rep = Reputation()
+    rep.setup(redis)
+    start = time.perf_counter()
+    for user_id in range(n):
+        await rep.record(user_id, 1)
+    record_us = (time.perf_counter() - start) / n * 1e6
+
+    rep._scores.clear()
+    start = time.perf_counter()
+    for user_id in range(n):
+        await rep.score(user_id + n)  # Distinct users: every read goes to Redis
+    score_us = (time.perf_counter() - start) / n * 1e6
+
+    memory = 0
+    async for key in redis.scan_iter(match=KEY.format(epoch=current_epoch(), shard="*")):
+        memory += await redis.strlen(key)
+    return record_us, score_us, memory
+
+
+async def run(args):
+    epoch_bytes = DEPTH * WIDTH
+    print(f"Sketch: {DEPTH} x {WIDTH} u8 counters = {epoch_bytes / 2**20:.1f} MiB per epoch, "
+          f"{EPOCHS} epochs = {EPOCHS * epoch_bytes / 2**20:.1f} MiB total (independent of user count)")
+    print(f"At {args.users:,} offenders per epoch: {epoch_bytes / args.users:.1f} bytes per offender "
+          f"({epoch_bytes / 2**20 / (args.users / 1e6):.1f} MiB per million per epoch)")
+
+    start = time.perf_counter()
+    result = accuracy(args.users, args.seed)
+    print(f"\n{args.users:,} offenders in one epoch ({time.perf_counter() - start:.1f}s to simulate):")
+    print(f"  counters in use          {result['load']:.1%}")
+    print(f"  mean overestimate        {result['overestimate']:.3f} violations per offender")
+    print(f"  clean users as suspects  {result['suspect_fp']:.4%} (score >= {SUSPECT_SCORE})")
+    print(f"  clean users muted        {result['muted_fp']:.4%} (score >= {AUTO_RESTRICT_SCORE})")
+
+    if args.fake:
+        import fakeredis
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        redis = Redis.from_url(args.redis_url, decode_responses=True)
+    await redis.flushdb()
+    record_us, score_us, memory = await latency(redis, args.n)
+    print(f"\nRedis ({'fakeredis' if args.fake else args.redis_url}): "
+          f"record {record_us:.0f} us, uncached score {score_us:.0f} us, today's shards {memory / 2**20:.1f} MiB after {args.n} users")
+    await redis.flushdb()
+    await redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000, help="Offenders written into the sketch")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--redis-url", help="Database is FLUSHED before and after the run (default: fakeredis)")
+    parser.add_argument("-n", type=int, default=2000, help="Redis calls per latency measurement")
+    args = parser.parse_args()
+    args.fake = args.redis_url is None
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,45 @@ from aiogram import Dispatcher
 from .moderation import router as moderation_router
 from .group_guard import router as group_guard_router
 from .admin_tag import router as admin_tag_router
+from .settings import router as settings_router
+from .links import router as links_router
+from .modlog import router as modlog_router
 from .welcome import router as welcome_router
-from .filters import router as filters_router
+from .filters import router as filters_router, fallback_router
+from middlewares.admin_roster import AdminRosterMiddleware
+from middlewares.features import FeaturesMiddleware
+from middlewares.message_index import MessageIndexMiddleware
+from middlewares.metrics import HandlerTimingMiddleware, UpdateMetricsMiddleware
+from middlewares.redis_batch import RedisBatchMiddleware
+from middlewares.username_index import UsernameIndexMiddleware
+from middlewares.update_scheduler import UpdateSchedulerMiddleware
+from services.redis_batch import BatchedRedisStorage
 
 def register_all_handlers(dp: Dispatcher):
     """
     Registers all modular routers with the main dispatcher.
     Order is crucial: Guards/Filters first, then commands, then passive handlers.
     """
-    
+
+    # 0. OUTER MIDDLEWARES (run once per update, before any router)
+    # Dispatcher() already added aiogram's FSM middleware; re-adding it last puts the metrics
+    # and the per-update Redis batch in front of it, so its state read joins the prefetch
+    fsm_enabled = dp.fsm in list(dp.update.outer_middleware)
+    if fsm_enabled:
+        dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(UpdateSchedulerMiddleware())  # Per-chat order, global cap, load shedding
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    if isinstance(dp.storage, BatchedRedisStorage):
+        dp.update.outer_middleware(RedisBatchMiddleware(dp.storage.redis, dp.fsm))
+    if fsm_enabled:
+        dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(UsernameIndexMiddleware())  # Learns @username -> id from every update
+    roster_middleware = AdminRosterMiddleware()
+    dp.chat_member.outer_middleware(roster_middleware)
+    dp.my_chat_member.outer_middleware(roster_middleware)
+    dp.message.outer_middleware(MessageIndexMiddleware())  # Recent ids per chat for /purge
+    dp.message.outer_middleware(FeaturesMiddleware())  # One analysis per message for all routers
+
     # 1. GUARDS/FILTERS (Highest Priority for deletion/restriction)
     dp.include_router(group_guard_router) # Flood Control
     dp.include_router(filters_router)     # Content Filter
@@ -20,6 +50,19 @@ def register_all_handlers(dp: Dispatcher):
     # 2. COMMANDS (Medium Priority)
     dp.include_router(moderation_router)
     dp.include_router(admin_tag_router)
+    dp.include_router(settings_router)  # /setflood, /setwarnlimit, /settings
+    dp.include_router(links_router)     # /allowlink, /denylink, /unlistlink, /links
+    dp.include_router(modlog_router)    # /modlog
 
     # 3. PASSIVE/OTHER UPDATES (Low Priority)
     dp.include_router(welcome_router) # Chat Member Updates/Set Welcome Command
+
+    # 4. CATCH-ALL (Must be last: replies to unknown commands)
+    dp.include_router(fallback_router)
+
+    # 5. HANDLER TIMING (inner middleware on every router)
+    timing = HandlerTimingMiddleware()
+    for router in (group_guard_router, filters_router, moderation_router, admin_tag_router,
+                   settings_router, links_router, modlog_router, welcome_router, fallback_router):
+        router.message.middleware(timing)
+        router.chat_member.middleware(timing)
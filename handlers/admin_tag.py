@@ -5,6 +5,7 @@ from aiogram.exceptions import TelegramBadRequest
 
 # Import utilities
 from utils import is_admin
+from services.admin_cache import admin_cache
 
 router = Router()
 
@@ -22,15 +23,15 @@ async def tag_admins(message: Message, bot: Bot):
         await message.reply("❌ Only admins can use /tagall.")
         return
 
-    # Get all administrators
+    # Get all administrators (served from the roster cache)
     members = []
     try:
-        admins = await bot.get_chat_administrators(chat_id)
-        for m in admins:
-            # Check if the user ID is the bot itself or if the user is anonymous
-            if m.user and m.user.id != bot.id:
+        roster = await admin_cache.get_roster(bot, chat_id)
+        for user in roster.users:
+            # Skip the bot itself
+            if user.id != bot.id:
                 # Use mention_html() for correct HTML formatting
-                members.append(m.user.mention_html())
+                members.append(user.mention_html())
     except TelegramBadRequest:
         await message.reply("❌ Bot must be an administrator to fetch the admin list.")
         return
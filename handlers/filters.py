@@ -1,70 +1,103 @@
+from typing import Optional
+
 from aiogram import Router, Bot, F
 from aiogram.types import Message
 from aiogram.exceptions import TelegramBadRequest
+from aiogram.dispatcher.event.bases import SkipHandler
 
 # Import utilities
-from utils import contains_link, contains_abuse, is_admin, delete_later, warn_user, check_for_kick
+from utils import warn_user, check_for_kick
+from services.audit_log import audit_log
+from services.notice_aggregator import notice_aggregator
+from services.verdict_cache import verdict_cache
+from services.reputation import reputation, CONTENT_VIOLATION, SUSPECT_SCORE
+from services.settings import chat_settings
+from services.spam_scorer import spam_scorer
+from services.update_scheduler import update_scheduler, Shed
+from middlewares.features import MessageFeatures
 router = Router()
+# Catch-all lives in its own router so it can be included after the command routers
+fallback_router = Router()
 
 # --- Helper Function (Includes Warning/Kick Logic) ---
-async def delete_and_warn(message: Message, reason: str):
+async def delete_and_warn(message: Message, reason: str, media_id: Optional[str] = None, strict: bool = False):
     user_id = message.from_user.id
     chat_id = message.chat.id
     
-    # 1. Delete and Notify
+    # 1. Delete (enforcement, retried by the outbound scheduler if rate limited)
     try:
         await message.delete() 
-        warning_msg = await message.chat.send_message(
-            f"🚫 **{message.from_user.full_name}**, your message was deleted due to **{reason}** and you received a warning.",
-            parse_mode="Markdown"
-        )
-        await delete_later(warning_msg, 10) 
     except Exception:
         pass
 
-    # 2. Issue Warning and Check for Kick
+    # Reposts of the same media in this chat are removed without waiting for a bad caption
+    if media_id:
+        await verdict_cache.mark_bad_media(chat_id, media_id, reason)
+
+    audit_log.record(chat_id, user_id, "delete", reason)
+
+    # 2. Notify (folded into the chat's rolling moderation summary)
+    notice_aggregator.report(message.bot, chat_id, user_id, message.from_user.full_name,
+                             f"message deleted ({reason}), warned")
+
+    # 3. Issue Warning and Check for Kick (users with a bad record across our chats are kicked at once)
+    await reputation.record(user_id, CONTENT_VIOLATION)
     new_warns = await warn_user(chat_id, user_id)
-    await check_for_kick(message, new_warns)
+    await check_for_kick(message, new_warns, strict)
 
 
 # --- ANTI-SPAM / ANTI-LINK HANDLER ---
-# Processes messages that contain text, photo, or video (to check captions/entities)
-@router.message(
-    F.text | F.caption | F.photo | F.video, 
-    ~F.text.startswith('/') 
-)
-async def content_filter(message: Message, bot: Bot):
+# Processes messages that contain text or media (to check captions/entities and known-bad media)
+@router.message(F.text | F.caption | F.photo | F.video | F.animation | F.document | F.sticker)
+async def content_filter(message: Message, features: MessageFeatures):
     """Checks for prohibited content (links, abuse) and deletes/warns the user."""
     
-    # 1. Primary Check: Skip Admins/Bots
-    if message.from_user.is_bot:
-        return
-    if await is_admin(bot, message.chat.id, message.from_user.id):
-        return
+    # 1. Primary Check: Skip non-groups, commands, Admins/Bots (commands go on to their routers)
+    if not features.is_group or features.is_command or features.is_exempt:
+        raise SkipHandler()
+
+    strict = features.reputation >= SUSPECT_SCORE
 
     # 2. Anti-Link Check
-    if contains_link(message):
-        await delete_and_warn(message, "prohibited links")
+    if features.has_link:
+        await delete_and_warn(message, "prohibited links", features.media_id, strict)
         return
             
     # 3. Anti-Abuse Check
-    if contains_abuse(message):
-        await delete_and_warn(message, "abusive language")
+    if features.abuse_hits:
+        await delete_and_warn(message, "abusive language", features.media_id, strict)
         return
+
+    # 4. Media removed earlier (same file_unique_id, any caption)
+    if features.bad_media:
+        await delete_and_warn(message, features.bad_media, strict=strict)
+        return
+
+    # 5. Spam model (optional): catches what the keyword rules miss, at the chat's threshold
+    if spam_scorer.enabled:
+        threshold = (await chat_settings.get(message.chat.id)).spam_threshold
+        if threshold <= 100:
+            score = await spam_scorer.score(features.normalized)  # Batched with concurrent messages
+            if score is not None and score * 100 >= threshold:
+                # The media is not marked bad: a statistical verdict should not follow the file around
+                await delete_and_warn(message, f"likely spam ({score:.0%})", strict=strict)
+                return
             
 # --- FINAL CATCH-ALL / UNKNOWN COMMAND HANDLER (Lowest Priority) ---
 # NOTE: This must be the LAST handler included in the Dispatcher.
-@router.message()
-async def unknown_command_or_text_handler(message: Message):
+@fallback_router.message()
+async def unknown_command_or_text_handler(message: Message, features: MessageFeatures):
     """Catches unknown commands."""
     
-    if message.chat.type not in ["group", "supergroup"]:
+    if not features.is_group:
         return
             
-    if message.text and message.text.startswith('/'):
+    if features.is_command:
         # Ignore messages from bots/self
-        if message.from_user.is_bot or message.from_user.id == message.bot.id:
+        if features.sender_is_bot:
              return
+        if update_scheduler.shedding(Shed.UNKNOWN_COMMAND):
+            return
              
         await message.reply("Sorry, I don't recognize that command. Use /help to see what I can do.")
         return
@@ -72,3 +105,4 @@ async def unknown_command_or_text_handler(message: Message):
 # Registration function
 def setup_filters(dp: Router):
     dp.include_router(router)
+    dp.include_router(fallback_router)
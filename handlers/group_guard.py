@@ -4,17 +4,18 @@ from datetime import datetime, timedelta
 
 from aiogram import Router, Bot, F
 from aiogram.types import Message, ChatPermissions
-from aiogram.fsm.context import FSMContext
+from aiogram.dispatcher.event.bases import SkipHandler
 
 # Import utilities
-from utils import delete_later, is_admin
+from middlewares.features import MessageFeatures
+from services.audit_log import audit_log
+from services.flood_limiter import flood_limiter
+from services.notice_aggregator import notice_aggregator
+from services.reputation import reputation, FLOOD_VIOLATION, SUSPECT_SCORE
+from services.settings import chat_settings
 
 logger = logging.getLogger(__name__)
 
-# --- FLOOD CONTROL CONSTANTS ---
-RATE_LIMIT_COUNT = 5  # Max messages allowed
-RATE_LIMIT_PERIOD = 5 # In seconds
-
 router = Router()
 
 async def restrict_user_and_notify(message: Message, duration_minutes: int, reason: str):
@@ -29,68 +30,44 @@ async def restrict_user_and_notify(message: Message, duration_minutes: int, reas
             until_date=until_date
         )
         
-        warn = await message.reply(
-            f"🤖 **Action!** User muted for {duration_minutes} minutes due to **{reason}**."
-        )
         await message.delete() 
-        await delete_later(warn, 10)
         
     except Exception as e:
         logger.error(f"❌ Failed to restrict user {message.from_user.id} in {message.chat.id}: {e}")
+        return
+
+    await reputation.record(message.from_user.id, FLOOD_VIOLATION)
+    audit_log.record(message.chat.id, message.from_user.id, "mute", f"{duration_minutes} min, {reason}")
+
+    # The notice is cosmetic: it joins the chat's rolling moderation summary
+    notice_aggregator.report(message.bot, message.chat.id, message.from_user.id, message.from_user.full_name,
+                             f"muted for {duration_minutes} minutes ({reason})")
 
 @router.message(F.text)
-async def flood_control_handler(message: Message, state: FSMContext, bot: Bot):
-    """Handler for persistent flood control using Redis list operations."""
+async def flood_control_handler(message: Message, features: MessageFeatures):
+    """Flood control: a local window per user, shared through Redis only near the limit."""
 
-    # 1. Skip non-group chats, commands, bots, and admins
-    if message.chat.type not in ["group", "supergroup"]:
-        return
-    if message.text and message.text.startswith('/'):
-        return
-    if message.from_user.is_bot:
-        return
-    if await is_admin(bot, message.chat.id, message.from_user.id):
-        return
+    # Messages that are not floods continue to the content filter and commands.
+    # Skip non-group chats, commands, bots, and admins
+    if not features.is_group or features.is_command or features.is_exempt:
+        raise SkipHandler()
 
-    user_id = str(message.from_user.id)
-    chat_id = str(message.chat.id)
-    key = f"flood_timestamps:{chat_id}:{user_id}"
-    
-    # Check if storage is RedisStorage (critical for persistent flood control)
-    if not hasattr(state.storage, 'redis'):
-        logger.warning(f"Flood control for {user_id} in {chat_id} skipped: Redis storage not found.")
-        return
+    user_id = message.from_user.id
+    chat_id = message.chat.id
 
-    redis = state.storage.redis
-    current_time = datetime.now().timestamp()
-    
-    # 1. Add the current timestamp to the list
-    await redis.rpush(key, current_time)
-    
-    # 2. Trim old timestamps: Remove any timestamps older than the limit period.
-    # NOTE: This uses LTRIM to keep only the newest elements, but is complex to do correctly
-    # with time-based filtering in Redis lists alone. 
+    # Limits default to DEFAULT_FLOOD_LIMIT / DEFAULT_FLOOD_PERIOD; chats tune them with /setflood
+    settings = await chat_settings.get(chat_id)  # In-memory after the first message of a chat
+    flood_limit = settings.flood_limit
+    if features.reputation >= SUSPECT_SCORE:
+        flood_limit = max(2, flood_limit // 2)  # Known offenders (in any of our chats) get half the budget
+    count = await flood_limiter.hit(chat_id, user_id, flood_limit, settings.flood_period)
     
-    # A safer, more direct approach: fetch all, filter in Python, save back (as you initially had).
-    # OPTIMIZED FILTERING: Fetch timestamps and filter by time in Python
-    timestamps = [float(ts) for ts in await redis.lrange(key, 0, -1)]
-    valid_timestamps = [ts for ts in timestamps if current_time - ts <= RATE_LIMIT_PERIOD]
-    
-    # 3. Check for flood
-    if len(valid_timestamps) > RATE_LIMIT_COUNT:
-        logger.info(f"🚨 FLOOD DETECTED: User {user_id} in {chat_id}. Count: {len(valid_timestamps)}")
+    if flood_limiter.is_flood(count, flood_limit):
+        logger.info(f"🚨 FLOOD DETECTED: User {user_id} in {chat_id}. Count: {count}")
         await restrict_user_and_notify(message, 15, "message flooding")
-        await redis.delete(key) # Clear the list immediately after action
         return
-    
-    # 4. Save the updated list (Only the valid ones, including the one just added)
-    await redis.delete(key) 
-    if valid_timestamps:
-        await redis.rpush(key, *[str(ts) for ts in valid_timestamps])
-    
-    # 5. Set expiration for automatic cleanup
-    if valid_timestamps:
-        await redis.expire(key, RATE_LIMIT_PERIOD)
+
+    raise SkipHandler()
     
 # Registration function
 def setup_group_guard(dp: Router):
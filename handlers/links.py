@@ -0,0 +1,104 @@
+import os
+
+from aiogram import Router, Bot
+from aiogram.filters import Command
+from aiogram.types import Message
+
+# Import utilities
+from utils import delete_later, is_admin
+from services.link_classifier import link_classifier, parse_domain, ALLOW, DENY, GLOBAL_CHAT_ID
+
+router = Router()
+
+OWNER_ID = int(os.getenv("ADMIN_ID") or 0)  # Only the bot owner may edit the global lists
+LIST_LIMIT = 50                             # Domains shown per list by /links
+
+async def _resolve_scope(message: Message, bot: Bot, args: list) -> tuple:
+    """
+    Returns (chat_id whose rules are edited, remaining args) or (None, args) after replying.
+    `/denylink global example.com` targets the lists every chat shares.
+    """
+    if args and args[0].lower() == "global":
+        if not OWNER_ID or message.from_user.id != OWNER_ID:
+            await message.reply("⚠️ Only the bot owner can change the global link lists.")
+            return None, args
+        return GLOBAL_CHAT_ID, args[1:]
+
+    if message.chat.type not in ["group", "supergroup"]:
+        await message.reply("This command only works in groups.")
+        return None, args
+    if not await is_admin(bot, message.chat.id, message.from_user.id):
+        await message.reply("⚠️ Only admins can change the link lists.")
+        return None, args
+    return message.chat.id, args
+
+async def _set_rule(message: Message, bot: Bot, command: str, action: str):
+    chat_id, args = await _resolve_scope(message, bot, message.text.split()[1:])
+    if chat_id is None:
+        return
+
+    domain = parse_domain(args[0]) if args else None
+    if domain is None:
+        return await message.reply(
+            f"Usage: `/{command} [global] <domain>` (e.g. `example.com` or `t.me/mychannel`)",
+            parse_mode="Markdown"
+        )
+
+    try:
+        await link_classifier.set_rule(chat_id, domain, action)
+        scope = "all chats" if chat_id == GLOBAL_CHAT_ID else "this chat"
+        verb = "allowed" if action == ALLOW else "blocked"
+        await message.reply(f"✅ Links to {domain} (and its subdomains) are now {verb} in {scope}.")
+    except Exception:
+        await message.reply("❌ An error occurred while saving the rule.")
+
+    await delete_later(message, 10)
+
+# --- COMMAND: Allow / Deny a Domain ---
+@router.message(Command("allowlink"))
+async def cmd_allow_link(message: Message, bot: Bot):
+    await _set_rule(message, bot, "allowlink", ALLOW)
+
+@router.message(Command("denylink"))
+async def cmd_deny_link(message: Message, bot: Bot):
+    await _set_rule(message, bot, "denylink", DENY)
+
+# --- COMMAND: Remove a Rule ---
+@router.message(Command("unlistlink"))
+async def cmd_unlist_link(message: Message, bot: Bot):
+    chat_id, args = await _resolve_scope(message, bot, message.text.split()[1:])
+    if chat_id is None:
+        return
+
+    domain = parse_domain(args[0]) if args else None
+    if domain is None:
+        return await message.reply("Usage: `/unlistlink [global] <domain>`", parse_mode="Markdown")
+
+    try:
+        if await link_classifier.remove_rule(chat_id, domain):
+            await message.reply(f"✅ {domain} removed from the link lists.")
+        else:
+            await message.reply(f"ℹ️ {domain} is not on the link lists.")
+    except Exception:
+        await message.reply("❌ An error occurred while removing the rule.")
+
+    await delete_later(message, 10)
+
+# --- COMMAND: Show Lists ---
+@router.message(Command("links"))
+async def cmd_links(message: Message, bot: Bot):
+    chat_id, _ = await _resolve_scope(message, bot, message.text.split()[1:])
+    if chat_id is None:
+        return
+
+    rules = await link_classifier.rules(chat_id)
+    lines = ["🔗 Link rules" + (" (global)" if chat_id == GLOBAL_CHAT_ID else "")]
+    for action, label in ((ALLOW, "Allowed"), (DENY, "Blocked")):
+        domains = sorted(domain for domain, rule in rules if rule == action)
+        shown = ", ".join(domains[:LIST_LIMIT]) or "none"
+        more = f" and {len(domains) - LIST_LIMIT} more" if len(domains) > LIST_LIMIT else ""
+        lines.append(f"{label}: {shown}{more}")
+    if chat_id != GLOBAL_CHAT_ID:
+        lines.append("Other links follow the global lists; unlisted links are removed.")
+    await message.reply("\n".join(lines))
+    await delete_later(message, 10)
@@ -6,8 +6,15 @@ from datetime import datetime, timedelta
 
 # Import utilities
 from utils import is_admin, extract_target_user, delete_later, warn_user, get_warn_count, parse_time
+from services.settings import chat_settings
+from services.reputation import reputation, BAN_VIOLATION, KICK_VIOLATION
+from services.deletion_scheduler import delete_messages
+from services.message_index import message_index
+from services.audit_log import audit_log
 router = Router()
 
+PURGE_MAX = 1000  # Messages one /purge may delete
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     await message.reply("🤖 GroupGuardian active! Use /help for commands.")
@@ -18,7 +25,7 @@ async def cmd_mute(message: Message, bot: Bot):
     if not await is_admin(bot, message.chat.id, message.from_user.id):
         return await message.reply("⚠️ You must be an admin to use this.")
     
-    target = extract_target_user(message)
+    target = await extract_target_user(message)
     if not target:
         return await message.reply("Usage: `/mute @user 10m` (or reply to a user)", parse_mode="Markdown")
     
@@ -34,6 +41,8 @@ async def cmd_mute(message: Message, bot: Bot):
             permissions=ChatPermissions(can_send_messages=False),
             until_date=until_date_timestamp
         )
+        minutes = max(1, round((until_date_timestamp - datetime.now().timestamp()) / 60))
+        audit_log.record(message.chat.id, user_id, "mute", f"{minutes} min", message.from_user.id)
         await message.reply("🔇 User muted.")
     except TelegramBadRequest as e:
         await message.reply(f"❌ Failed to mute user. Error: {e.message}")
@@ -45,7 +54,7 @@ async def cmd_unmute(message: Message, bot: Bot):
     if not await is_admin(bot, message.chat.id, message.from_user.id):
         return await message.reply("⚠️ You must be an admin to use this.")
     
-    target = extract_target_user(message)
+    target = await extract_target_user(message)
     if not target:
         return await message.reply("Usage: `/unmute @user` (or reply to a user)", parse_mode="Markdown")
     
@@ -63,6 +72,7 @@ async def cmd_unmute(message: Message, bot: Bot):
                 can_add_web_page_previews=True
             )
         )
+        audit_log.record(message.chat.id, user_id, "unmute", actor_id=message.from_user.id)
         await message.reply("🔊 User unmuted.")
     except TelegramBadRequest as e:
         await message.reply(f"❌ Failed to unmute user. Error: {e.message}")
@@ -74,11 +84,11 @@ async def cmd_ban(message: Message, bot: Bot):
     if not await is_admin(bot, message.chat.id, message.from_user.id):
         return await message.reply("⚠️ You must be an admin to use this.")
     
-    target = extract_target_user(message)
+    target = await extract_target_user(message)
     if not target:
-        return await message.reply("Usage: `/ban @user` (or reply to a user)", parse_mode="Markdown")
+        return await message.reply("Usage: `/ban @user [1h]` (or reply to a user)", parse_mode="Markdown")
     
-    user_id, _ = target
+    user_id, until = target
     
     if await is_admin(bot, message.chat.id, user_id):
         return await message.reply("⚠️ I cannot ban an admin.")
@@ -88,7 +98,13 @@ async def cmd_ban(message: Message, bot: Bot):
         await bot.ban_chat_member(message.chat.id, user_id)
         # Clear all warnings when banning
         await warn_user(message.chat.id, user_id, reset=True) 
-        await message.reply("⛔ User banned and warnings cleared.")
+        await reputation.record(user_id, BAN_VIOLATION)  # Follows the user into our other chats
+        # The optional time (default 1h) is how far back their messages are removed
+        now = datetime.now().timestamp()
+        recent = await message_index.by_user(message.chat.id, user_id, now - (until - now))
+        deleted = await delete_messages(bot, message.chat.id, recent)
+        audit_log.record(message.chat.id, user_id, "ban", f"{deleted} recent messages removed", message.from_user.id)
+        await message.reply(f"⛔ User banned, warnings cleared and {deleted} recent messages removed.")
     except TelegramBadRequest as e:
         await message.reply(f"❌ Failed to ban user. Error: {e.message}")
         
@@ -99,7 +115,7 @@ async def cmd_unban(message: Message, bot: Bot):
     if not await is_admin(bot, message.chat.id, message.from_user.id):
         return await message.reply("⚠️ You must be an admin to use this.")
     
-    target = extract_target_user(message)
+    target = await extract_target_user(message)
     if not target:
         return await message.reply("Usage: `/unban @user` (or reply to a user)", parse_mode="Markdown")
     
@@ -107,6 +123,7 @@ async def cmd_unban(message: Message, bot: Bot):
     
     try:
         await bot.unban_chat_member(message.chat.id, user_id)
+        audit_log.record(message.chat.id, user_id, "unban", actor_id=message.from_user.id)
         await message.reply("✅ User unbanned.")
     except TelegramBadRequest as e:
         await message.reply(f"❌ Failed to unban user. Error: {e.message}")
@@ -118,7 +135,7 @@ async def cmd_warn(message: Message, bot: Bot):
     if not await is_admin(bot, message.chat.id, message.from_user.id):
         return await message.reply("⚠️ You must be an admin to use this.")
     
-    target = extract_target_user(message)
+    target = await extract_target_user(message)
     if not target:
         return await message.reply("Usage: `/warn @user` (or reply to a user)", parse_mode="Markdown")
     
@@ -131,16 +148,20 @@ async def cmd_warn(message: Message, bot: Bot):
     try:
         # Increment warning count
         warns = await warn_user(chat_id, user_id) 
+        warn_limit = (await chat_settings.get(chat_id)).warn_limit
         
-        if warns >= 3:
+        if warns >= warn_limit:
             # KICK: Temporary ban for 1 minute to ensure kick
             kick_until = datetime.now() + timedelta(minutes=1)
             await bot.ban_chat_member(chat_id, user_id, until_date=kick_until)
             await bot.unban_chat_member(chat_id, user_id) # Allow rejoin
             await warn_user(chat_id, user_id, reset=True)
-            await message.reply(f"❗ **{message.from_user.full_name}** KICKED the user after **{warns}/3** warns.")
+            await reputation.record(user_id, KICK_VIOLATION)
+            audit_log.record(chat_id, user_id, "kick", f"{warns}/{warn_limit} warnings", message.from_user.id)
+            await message.reply(f"❗ **{message.from_user.full_name}** KICKED the user after **{warns}/{warn_limit}** warns.")
         else:
-            await message.reply(f"⚠️ User warned. Current warnings: **{warns}/3**.")
+            audit_log.record(chat_id, user_id, "warn", f"{warns}/{warn_limit}", message.from_user.id)
+            await message.reply(f"⚠️ User warned. Current warnings: **{warns}/{warn_limit}**.")
             
     except TelegramBadRequest as e:
         await message.reply(f"❌ Failed to warn/kick user. Error: {e.message}")
@@ -152,14 +173,40 @@ async def cmd_check_warns(message: Message, bot: Bot):
     if not await is_admin(bot, message.chat.id, message.from_user.id):
         return await message.reply("⚠️ You must be an admin to use this.")
     
-    target = extract_target_user(message)
+    target = await extract_target_user(message)
     if not target:
         return await message.reply("Usage: `/checkwarns @user` (or reply to a user)", parse_mode="Markdown")
     
     user_id, _ = target
     
     warns = await get_warn_count(message.chat.id, user_id)
-    await message.reply(f"✅ User ID `{user_id}` has **{warns}/3** warnings.", parse_mode="Markdown")
+    warn_limit = (await chat_settings.get(message.chat.id)).warn_limit
+    await message.reply(f"✅ User ID `{user_id}` has **{warns}/{warn_limit}** warnings.", parse_mode="Markdown")
     
     await delete_later(message, 10)
 
+@router.message(Command("purge"))
+async def cmd_purge(message: Message, bot: Bot):
+    """/purge N deletes the last N messages; /purge in reply deletes everything from that message on."""
+    if not await is_admin(bot, message.chat.id, message.from_user.id):
+        return await message.reply("⚠️ You must be an admin to use this.")
+
+    parts = message.text.strip().split()
+    if message.reply_to_message:
+        # Message ids of a group are sequential: the range also covers messages the bot never saw
+        first = message.reply_to_message.message_id
+        if message.message_id - first >= PURGE_MAX:
+            return await message.reply(f"⚠️ That message is too far back (max {PURGE_MAX} messages).")
+        message_ids = list(range(message.message_id, first - 1, -1))
+    elif len(parts) == 2 and parts[1].isdigit() and 0 < int(parts[1]) <= PURGE_MAX:
+        # The command itself is the newest recorded message
+        message_ids = await message_index.recent(message.chat.id, int(parts[1]) + 1)
+    else:
+        return await message.reply(f"Usage: `/purge <1-{PURGE_MAX}>` (or reply to the first message to remove)",
+                                   parse_mode="Markdown")
+
+    # Telegram skips ids that are already gone without saying which, so this is an upper bound
+    deleted = max(0, await delete_messages(bot, message.chat.id, message_ids) - 1)  # Not counting the command
+    audit_log.record(message.chat.id, 0, "purge", f"up to {deleted} messages", message.from_user.id)
+    notice = await message.answer(f"🧹 Removed up to {deleted} messages.")
+    await delete_later(notice, 10)
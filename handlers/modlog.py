@@ -0,0 +1,53 @@
+import html
+from datetime import datetime, timezone
+
+from aiogram import Router, Bot
+from aiogram.filters import Command
+from aiogram.types import Message
+
+# Import utilities
+from utils import delete_later, extract_target_user, is_admin
+from services.audit_log import audit_log, parse_cursor
+
+router = Router()
+
+PAGE_SIZE = 15     # Entries per /modlog page
+REASON_WIDTH = 60  # Characters of the reason shown per entry
+
+# --- COMMAND: Moderation Log ---
+@router.message(Command("modlog"))
+async def cmd_modlog(message: Message, bot: Bot):
+    """/modlog [@user] [cursor]: newest actions first; the reply ends with the command for the next page."""
+    if message.chat.type not in ["group", "supergroup"]:
+        return await message.reply("This command only works in groups.")
+    if not await is_admin(bot, message.chat.id, message.from_user.id):
+        return await message.reply("⚠️ Only admins can read the moderation log.")
+
+    args = message.text.split()[1:]
+    before = parse_cursor(args[-1]) if args else None
+    if before is not None:
+        args = args[:-1]
+    user_id = None
+    if args or message.reply_to_message:
+        target = await extract_target_user(message)
+        if not target:
+            return await message.reply("Usage: `/modlog [@user]` (or reply to a user)", parse_mode="Markdown")
+        user_id = target[0]
+
+    entries = await audit_log.page(message.chat.id, PAGE_SIZE, user_id=user_id, before=before)
+    if not entries:
+        await message.reply("📜 No moderation actions logged" + (" for this user." if user_id else "."))
+        return await delete_later(message, 10)
+
+    lines = ["📜 <b>Moderation log</b>" + (f" for <code>{user_id}</code>" if user_id else "")]
+    for entry in entries:
+        when = datetime.fromtimestamp(entry.ts, timezone.utc).strftime("%Y-%m-%d %H:%M")
+        actor = f"admin <code>{entry.actor_id}</code>" if entry.actor_id else "bot"
+        target = f" <code>{entry.user_id}</code>" if entry.user_id else ""
+        reason = f": {html.escape(entry.reason[:REASON_WIDTH])}" if entry.reason else ""
+        lines.append(f"{when} {entry.action}{target} by {actor}{reason}")
+    if len(entries) == PAGE_SIZE:
+        user_arg = f"{user_id} " if user_id else ""
+        lines.append(f"\nOlder: <code>/modlog {user_arg}{entries[-1].cursor}</code>")
+    await message.reply("\n".join(lines), parse_mode="HTML")
+    await delete_later(message, 10)
@@ -0,0 +1,152 @@
+from aiogram import Router, Bot
+from aiogram.filters import Command
+from aiogram.types import Message
+
+# Import utilities
+from utils import delete_later, is_admin
+from services.settings import chat_settings, SPAM_OFF
+from services.spam_scorer import spam_scorer
+
+router = Router()
+
+# --- LIMITS (keep chats from configuring themselves into a broken state) ---
+FLOOD_LIMIT_RANGE = (2, 100)    # Messages
+FLOOD_PERIOD_RANGE = (1, 300)   # Seconds
+WARN_LIMIT_RANGE = (1, 20)
+RAID_LIMIT_RANGE = (5, 200)     # Joins per minute
+SPAM_THRESHOLD_RANGE = (50, 100)  # Spam model score, percent
+
+def _parse_int(value: str, bounds: tuple) -> int:
+    """Returns the value if it is an integer inside bounds, otherwise raises ValueError."""
+    number = int(value)
+    if not bounds[0] <= number <= bounds[1]:
+        raise ValueError(value)
+    return number
+
+async def _check_group_admin(message: Message, bot: Bot) -> bool:
+    if message.chat.type not in ["group", "supergroup"]:
+        await message.reply("This command only works in groups.")
+        return False
+    if not await is_admin(bot, message.chat.id, message.from_user.id):
+        await message.reply("⚠️ Only admins can change chat settings.")
+        return False
+    return True
+
+# --- COMMAND: Flood Limit ---
+@router.message(Command("setflood"))
+async def cmd_set_flood(message: Message, bot: Bot):
+    if not await _check_group_admin(message, bot):
+        return
+
+    parts = message.text.split()
+    try:
+        limit = _parse_int(parts[1], FLOOD_LIMIT_RANGE)
+        period = _parse_int(parts[2], FLOOD_PERIOD_RANGE)
+    except (IndexError, ValueError):
+        return await message.reply(
+            f"Usage: `/setflood <messages> <seconds>` "
+            f"({FLOOD_LIMIT_RANGE[0]}-{FLOOD_LIMIT_RANGE[1]} messages, "
+            f"{FLOOD_PERIOD_RANGE[0]}-{FLOOD_PERIOD_RANGE[1]} seconds)",
+            parse_mode="Markdown"
+        )
+
+    try:
+        await chat_settings.update(message.chat.id, flood_limit=limit, flood_period=period)
+        await message.reply(f"✅ Flood limit set to {limit} messages per {period} seconds.")
+    except Exception:
+        await message.reply("❌ An error occurred while saving the setting.")
+
+    await delete_later(message, 10)
+
+# --- COMMAND: Warning Limit ---
+@router.message(Command("setwarnlimit"))
+async def cmd_set_warn_limit(message: Message, bot: Bot):
+    if not await _check_group_admin(message, bot):
+        return
+
+    parts = message.text.split()
+    try:
+        warn_limit = _parse_int(parts[1], WARN_LIMIT_RANGE)
+    except (IndexError, ValueError):
+        return await message.reply(
+            f"Usage: `/setwarnlimit <warnings>` ({WARN_LIMIT_RANGE[0]}-{WARN_LIMIT_RANGE[1]})",
+            parse_mode="Markdown"
+        )
+
+    try:
+        await chat_settings.update(message.chat.id, warn_limit=warn_limit)
+        await message.reply(f"✅ Users are now kicked after {warn_limit} warnings.")
+    except Exception:
+        await message.reply("❌ An error occurred while saving the setting.")
+
+    await delete_later(message, 10)
+
+# --- COMMAND: Raid Threshold ---
+@router.message(Command("setraid"))
+async def cmd_set_raid(message: Message, bot: Bot):
+    if not await _check_group_admin(message, bot):
+        return
+
+    parts = message.text.split()
+    try:
+        raid_limit = _parse_int(parts[1], RAID_LIMIT_RANGE)
+    except (IndexError, ValueError):
+        return await message.reply(
+            f"Usage: `/setraid <joins per minute>` ({RAID_LIMIT_RANGE[0]}-{RAID_LIMIT_RANGE[1]})",
+            parse_mode="Markdown"
+        )
+
+    try:
+        await chat_settings.update(message.chat.id, raid_limit=raid_limit)
+        await message.reply(f"✅ Raid mode now starts at {raid_limit} joins per minute.")
+    except Exception:
+        await message.reply("❌ An error occurred while saving the setting.")
+
+    await delete_later(message, 10)
+
+# --- COMMAND: Spam Model Threshold ---
+@router.message(Command("setspam"))
+async def cmd_set_spam(message: Message, bot: Bot):
+    if not await _check_group_admin(message, bot):
+        return
+
+    parts = message.text.split()
+    try:
+        threshold = SPAM_OFF if parts[1].lower() == "off" else _parse_int(parts[1], SPAM_THRESHOLD_RANGE)
+    except (IndexError, ValueError):
+        return await message.reply(
+            f"Usage: `/setspam <percent>` ({SPAM_THRESHOLD_RANGE[0]}-{SPAM_THRESHOLD_RANGE[1]}, "
+            f"higher removes less) or `/setspam off`",
+            parse_mode="Markdown"
+        )
+
+    try:
+        await chat_settings.update(message.chat.id, spam_threshold=threshold)
+        if threshold == SPAM_OFF:
+            await message.reply("✅ The spam model no longer removes messages here.")
+        else:
+            await message.reply(f"✅ Messages the spam model scores {threshold}% or higher are now removed.")
+        if not spam_scorer.enabled:
+            await message.reply("ℹ️ No spam model is loaded on this bot yet, so this has no effect for now.")
+    except Exception:
+        await message.reply("❌ An error occurred while saving the setting.")
+
+    await delete_later(message, 10)
+
+# --- COMMAND: Show Settings ---
+@router.message(Command("settings"))
+async def cmd_settings(message: Message, bot: Bot):
+    if not await _check_group_admin(message, bot):
+        return
+
+    settings = await chat_settings.get(message.chat.id)
+    await message.reply(
+        "⚙️ Chat settings\n"
+        f"Flood limit: {settings.flood_limit} messages per {settings.flood_period} seconds\n"
+        f"Warnings before kick: {settings.warn_limit}\n"
+        f"Raid mode at: {settings.raid_limit} joins per minute\n"
+        f"Spam model: {'off' if settings.spam_threshold == SPAM_OFF else f'removes at {settings.spam_threshold}%'}"
+        f"{'' if spam_scorer.enabled else ' (no model loaded)'}\n"
+        f"Welcome message: {settings.welcome_msg}"
+    )
+    await delete_later(message, 10)
@@ -1,10 +1,14 @@
 from aiogram import Router, Bot, F
 from aiogram.types import ChatMemberUpdated, Message
-from aiogram.filters import Command
+from aiogram.filters import Command, ChatMemberUpdatedFilter, JOIN_TRANSITION
 from aiogram.exceptions import TelegramBadRequest
 
 # Import utilities
-from utils import delete_later, get_welcome_message, set_welcome_message, is_admin
+from utils import delete_later, set_welcome_message, is_admin
+from services.join_aggregator import join_aggregator
+from services.notice_aggregator import notice_aggregator
+from services.reputation import reputation, AUTO_RESTRICT_SCORE
+from services.settings import chat_settings
 
 router = Router()
 
@@ -35,30 +39,39 @@ async def cmd_set_welcome(message: Message, bot: Bot):
     await delete_later(message, 10)
 
 
-# --- HANDLER: Send Welcome Message on Join ---
-@router.chat_member(F.new_chat_member.is_member) # Only process status change TO 'member'
-async def on_user_join(event: ChatMemberUpdated):
+# --- COMMAND: Lift Raid Mode ---
+@router.message(Command("raidoff"))
+async def cmd_raid_off(message: Message, bot: Bot):
+    if not await is_admin(bot, message.chat.id, message.from_user.id):
+        return await message.reply("⚠️ You must be an admin to use this.")
+
+    if await join_aggregator.end_raid(message.chat.id):
+        await message.reply("✅ Raid mode lifted. New members are welcomed again; muted joiners stay muted.")
+    else:
+        await message.reply("ℹ️ This chat is not in raid mode.")
+
+    await delete_later(message, 10)
+
+
+# --- HANDLER: Welcome on Join ---
+@router.chat_member(ChatMemberUpdatedFilter(JOIN_TRANSITION)) # left/kicked -> member/restricted
+async def on_user_join(event: ChatMemberUpdated, bot: Bot):
     new = event.new_chat_member
-    chat_id = event.chat.id
     
     # Only greet users, not the bot itself
-    if new.user.id == event.bot.id:
+    if new.user.id == bot.id:
         return
     
-    # 1. Fetch custom message
-    custom_msg = await get_welcome_message(chat_id)
+    # Users with a bad record across our chats (this one included) are muted before they can post
+    if await reputation.score(new.user.id) >= AUTO_RESTRICT_SCORE:
+        await join_aggregator.restrict(bot, event.chat.id, [new.user.id])
+        notice_aggregator.report(bot, event.chat.id, new.user.id, new.user.full_name,
+                                 "muted on join (record of abuse across our chats)")
+        return
 
-    # 2. Format the message
-    user_name = new.user.full_name or new.user.first_name or 'there'
-    # Use HTML for better formatting of the user's name
-    final_msg = custom_msg.replace('{user_name}', f"<b>{user_name}</b>") 
-    
-    # 3. Send and schedule deletion
-    try:
-        sent = await event.bot.send_message(chat_id, final_msg, parse_mode="HTML")
-        await delete_later(sent, 10)
-    except Exception:
-         pass # Silently fail if unable to send/delete
+    # Joins are gathered per chat: one welcome per burst, raid mode on a join flood
+    settings = await chat_settings.get(event.chat.id)
+    await join_aggregator.on_join(bot, event.chat.id, new.user, settings)
 
 # Registration function
 def setup_welcome(dp: Router):
@@ -2,9 +2,35 @@ import asyncio
 import os
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.redis import RedisStorage
-from redis.asyncio import Redis
 from dotenv import load_dotenv
+from redis.asyncio import BlockingConnectionPool
+
+from handlers import register_all_handlers
+from services.admin_cache import admin_cache
+from services.deletion_scheduler import deletion_scheduler
+from services.outbound import OutboundScheduler
+from services.metrics import (
+    AUDIT_LOG_PENDING, FLOOD_LIMITER_BYTES, FLOOD_TRACKED_USERS, InstrumentedRedis, OUTBOUND_DROPPED,
+    OUTBOUND_QUEUE_DEPTH, PENDING_DELETIONS, REGISTRY, UPDATE_BACKLOG,
+)
+from services.warning_counter import warning_counter
+from services.settings import chat_settings
+from services.join_aggregator import join_aggregator
+from services.notice_aggregator import notice_aggregator
+from services.verdict_cache import verdict_cache
+from services.reputation import reputation
+from services.link_classifier import link_classifier
+from services.flood_limiter import flood_limiter
+from services.username_index import username_index
+from services.message_index import message_index
+from services.audit_log import audit_log
+from services.update_scheduler import update_scheduler
+from services.spam_scorer import spam_scorer
+from services.redis_batch import BatchedRedisStorage
+from services.update_queue import UpdateQueue, ingest_polling, run_worker
+from middlewares.metrics import BotApiMetricsMiddleware
+from utils import init_db, storage as db
+from web import build_metrics_app, build_web_app, start_web_app
 
 # Load environment variables (important for local testing, harmless on Railway)
 load_dotenv()
@@ -17,6 +43,49 @@ ADMIN_ID = os.getenv("ADMIN_ID") # Used for specific admin features
 # Redis connection details. We prioritize REDIS_URL which usually contains the IP.
 # If REDIS_URL is not found, we fall back to the Railway service name "redis".
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379") 
+# One pool shared by every service, the FSM storage and the update queue
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_HEALTH_CHECK_INTERVAL = 30  # Seconds a pooled connection may sit idle before it is PINGed on checkout
+REDIS_POOL_TIMEOUT = 5            # Seconds to wait for a free connection before failing the command
+
+# Update delivery: "polling" (default) or "webhook".
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Public HTTPS base URL Telegram should call, e.g. https://guardian.example.com.
+# Leave unset in webhook mode to test locally by POSTing update JSON yourself.
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Required in webhook mode: checked against X-Telegram-Bot-Api-Secret-Token on every POST
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# The web server (/ping, webhook) listens here in every mode
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+# /metrics has its own listener, loopback only unless METRICS_HOST opens it to a private network
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
+# Process role for scale-out:
+# "all" (default) receives and handles updates in this process,
+# "ingest" only receives them (BOT_MODE) and appends them to Redis Streams partitioned by chat,
+# "worker" handles the partitions it owns: partition % WORKER_COUNT == WORKER_INDEX.
+ROLE = os.getenv("ROLE", "all").lower()
+UPDATE_PARTITIONS = int(os.getenv("UPDATE_PARTITIONS", "16"))  # Same value for every process
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+
+# Update scheduler: updates handled at once, and the backlog (waiting updates) at which welcomes,
+# unknown-command replies and moderation summaries are skipped, in that order
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+UPDATE_SHED_BACKLOG = [int(n) for n in os.getenv("UPDATE_SHED_BACKLOG", "200,500,1000").split(",")]
+# Polling stops fetching while this many updates are in flight, so a flood waits at Telegram instead of
+# in memory here (the default leaves room for the last shed threshold to be reached)
+UPDATE_TASK_LIMIT = int(os.getenv("UPDATE_TASK_LIMIT", str(UPDATE_CONCURRENCY + UPDATE_SHED_BACKLOG[-1])))
+
+# Optional spam model (see tools/train_spam.py); needs NumPy. Without the file the scorer stays off
+SPAM_MODEL = os.getenv("SPAM_MODEL", "spam_model.npy")
+
+# Share text verdicts of spam waves between instances through Redis (costs a round trip per long message)
+VERDICT_CACHE_SHARED = os.getenv("VERDICT_CACHE_SHARED", "0") == "1"
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -29,17 +98,61 @@ def setup_redis():
     """Initializes the Redis client using the environment variable."""
     logger.info(f"Initializing Redis connection using URL: {REDIS_URL}")
     
-    # aiogram's RedisStorage can take a Redis object initialized from a URL
-    redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
-    storage = RedisStorage(redis=redis_client)
+    # Bounded pool: a burst waits for a connection instead of opening hundreds of sockets,
+    # and stale connections (idle timeouts, failovers) are detected before they are used
+    pool = BlockingConnectionPool.from_url(
+        REDIS_URL, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT, health_check_interval=REDIS_HEALTH_CHECK_INTERVAL, socket_keepalive=True,
+    )
+    # InstrumentedRedis times every command for /metrics
+    redis_client = InstrumentedRedis(connection_pool=pool)
+    # The FSM state read joins each update's prefetch pipeline (see RedisBatchMiddleware)
+    storage = BatchedRedisStorage(redis=redis_client)
     
     return redis_client, storage
 
+# --- Update Delivery ---
+
+def allowed_updates(dp: Dispatcher) -> list:
+    # my_chat_member has no handler of its own, but the admin roster cache listens to it
+    return [*dp.resolve_used_update_types(), "my_chat_member"]
+
+async def run_polling(bot: Bot, dp: Dispatcher, queue: UpdateQueue = None):
+    # Clear any residual Telegram webhooks or polling conflicts
+    await bot.delete_webhook(drop_pending_updates=True)
+    logger.info("Telegram webhook cleared. Starting polling...")
+    
+    # Start the bot. This is the main blocking call.
+    if queue is not None:
+        await ingest_polling(bot, queue, allowed_updates(dp))
+    else:
+        await dp.start_polling(bot, allowed_updates=allowed_updates(dp), tasks_concurrency_limit=UPDATE_TASK_LIMIT)
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates(dp),
+            drop_pending_updates=True,
+        )
+        logger.info(f"Telegram webhook set to {WEBHOOK_BASE_URL}{WEBHOOK_PATH}.")
+    else:
+        logger.warning("WEBHOOK_BASE_URL not set: webhook not registered with Telegram (local testing mode).")
+
+    # The aiohttp server does the work; wait here until we are cancelled
+    await asyncio.Event().wait()
+
 async def main():
     """Main function to initialize and start the bot."""
     if not BOT_TOKEN:
         logger.error("FATAL: TELEGRAM_BOT_TOKEN not found in environment variables.")
         return
+    if BOT_MODE == "webhook" and ROLE != "worker" and not WEBHOOK_SECRET:
+        # Without it anyone who finds the URL could post forged updates that delete, mute and kick
+        logger.error("FATAL: BOT_MODE=webhook needs WEBHOOK_SECRET (e.g. python -c 'import secrets; "
+                     "print(secrets.token_urlsafe(32))').")
+        return
 
     # 1. Setup Redis and Storage
     redis_client, storage = setup_redis()
@@ -52,32 +165,98 @@ async def main():
         logger.error(f"❌ Redis PING failed on startup. Bot will likely fail later. Error: {e}")
         # We proceed, but logging the failure is important
 
-    # 2. Setup Bot and Dispatcher
+    # 2. Open the SQLite storage (creates tables on first run)
+    await init_db()
+
+    # 3. Setup Bot and Dispatcher
     bot = Bot(token=BOT_TOKEN)
+    # Paces every Bot API call: global and per-chat limits, priorities, retry_after.
+    # The metrics middleware sits inside it so it measures Telegram, not our queue.
+    outbound = OutboundScheduler()
+    bot.session.middleware(outbound)
+    bot.session.middleware(BotApiMetricsMiddleware())
     dp = Dispatcher(storage=storage)
 
-    # 3. Register Routers (Handlers)
-    # You must import and register your handlers here!
-    
-    # Example: If your filters.py has a router named 'filters_router'
-    # from .handlers import filters
-    # dp.include_router(filters.filters_router) 
+    # 4. Register Routers (Handlers) and shared caches
+    admin_cache.setup(redis_client)
+    deletion_scheduler.setup(redis_client)
+    warning_counter.setup(redis_client, db)
+    chat_settings.setup(redis_client, db)
+    join_aggregator.setup(redis_client)
+    verdict_cache.setup(redis_client, share_text=VERDICT_CACHE_SHARED)
+    reputation.setup(redis_client)
+    link_classifier.setup(db)
+    flood_limiter.setup(redis_client)
+    username_index.setup(redis_client)
+    message_index.setup(redis_client)
+    audit_log.setup(db)
+    update_scheduler.configure(UPDATE_CONCURRENCY, UPDATE_SHED_BACKLOG)
+    spam_scorer.setup(SPAM_MODEL)
+    register_all_handlers(dp)
+    queue = UpdateQueue(redis_client, UPDATE_PARTITIONS)
+
+    # Gauges refreshed at scrape time
+    async def collect_gauges():
+        OUTBOUND_QUEUE_DEPTH.set(outbound.depth)
+        OUTBOUND_DROPPED.set(outbound.dropped)
+        PENDING_DELETIONS.set(await deletion_scheduler.pending())
+        flood_memory = flood_limiter.memory()
+        FLOOD_TRACKED_USERS.set(flood_memory["tracked"])
+        FLOOD_LIMITER_BYTES.set(flood_memory["bytes"])
+        AUDIT_LOG_PENDING.set(audit_log.pending)
+        UPDATE_BACKLOG.set(update_scheduler.waiting)
+    REGISTRY.add_collector(collect_gauges)
+
+    # Background worker for delayed deletions (resumes deletions pending from before a restart)
+    # and for flushing warning counters to SQLite; settings changes made on other instances
+    if ROLE != "ingest":
+        await deletion_scheduler.start(bot)
+        await warning_counter.start()
+        await chat_settings.start()
+        await admin_cache.start()  # Admin roster changes made visible by other instances
+        await join_aggregator.start()  # Chats still in raid mode
+        await username_index.start()
+        await message_index.start()  # Shares recent message ids for /purge and ban cleanup
+        await audit_log.start()  # Writes the moderation log in bulk; drops expired weeks
     
     logger.info("Bot handlers and middleware initialized.")
 
-    # 4. Clear old webhooks and start polling
+    # 5. Web server: /ping always, the webhook route only in webhook mode
+    webhook_path = WEBHOOK_PATH if BOT_MODE == "webhook" and ROLE != "worker" else None
+    ingest_queue = queue if ROLE == "ingest" else None
+    app = build_web_app(dp, bot, webhook_path=webhook_path, secret_token=WEBHOOK_SECRET,
+                        ingest_queue=ingest_queue)
+    offset = WORKER_INDEX if ROLE == "worker" else 0  # Several workers can share a host
+    runner = await start_web_app(app, WEB_HOST, PORT + offset)
+    metrics_runner = await start_web_app(build_metrics_app(), METRICS_HOST, METRICS_PORT + offset)
+    logger.info(f"Web server listening on {WEB_HOST}:{PORT + offset}, metrics on "
+                f"{METRICS_HOST}:{METRICS_PORT + offset} (role: {ROLE}).")
+
+    # 6. Receive updates
     try:
-        # Clear any residual Telegram webhooks or polling conflicts
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("Telegram webhook cleared. Starting polling...")
-        
-        # Start the bot. This is the main blocking call.
-        await dp.start_polling(bot)
+        if ROLE == "worker":
+            await run_worker(dp, bot, queue, WORKER_INDEX, WORKER_COUNT)
+        elif BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp, ingest_queue)
         
     finally:
-        # Graceful shutdown
+        # Graceful shutdown (pending deletions stay in Redis for the next start)
+        await runner.cleanup()
+        await metrics_runner.cleanup()
+        await deletion_scheduler.stop()
+        await warning_counter.stop()  # Final flush of dirty counters
+        await chat_settings.stop()
+        await admin_cache.stop()
+        await join_aggregator.stop()
+        await username_index.stop()  # Final flush of newly seen usernames
+        await message_index.stop()
+        await notice_aggregator.stop()
+        await audit_log.stop()  # Final flush of queued log entries
         await bot.session.close()
         await storage.close()
+        await db.close()
         logger.info("Bot stopped gracefully.")
 
 
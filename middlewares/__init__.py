@@ -0,0 +1 @@
+# middlewares/__init__.py
@@ -0,0 +1,20 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import ChatMemberUpdated
+
+from services.admin_cache import admin_cache, is_admin_change
+
+
+class AdminRosterMiddleware(BaseMiddleware):
+    """Drops a chat's cached admin roster as soon as someone is promoted or demoted."""
+
+    async def __call__(
+        self,
+        handler: Callable[[ChatMemberUpdated, Dict[str, Any]], Awaitable[Any]],
+        event: ChatMemberUpdated,
+        data: Dict[str, Any],
+    ) -> Any:
+        if is_admin_change(event.old_chat_member.status, event.new_chat_member.status):
+            await admin_cache.invalidate(event.chat.id)
+        return await handler(event, data)
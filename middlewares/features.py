@@ -0,0 +1,112 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Message
+
+from services.abuse_matcher import normalize
+from services.link_classifier import link_classifier
+from services.reputation import reputation
+from services.verdict_cache import verdict_cache
+from utils import (
+    FILTER_VERSION, entity_urls, forward_origin, is_admin, media_unique_id, message_text, scan_text,
+)
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+
+class MessageFeatures:
+    """Everything the guard and filter routers need to know about one message, computed once."""
+    __slots__ = (
+        'text', '_normalized', 'has_link', 'abuse_hits', 'media_id', 'bad_media', 'forward_origin',
+        'chat_type', 'is_group', 'is_command', 'sender_is_bot', 'sender_is_admin', 'reputation',
+    )
+
+    def __init__(self, text: str, has_link: bool, abuse_hits: Tuple[str, ...],
+                 media_id: Optional[str], bad_media: Optional[str], forward_origin: Optional[str],
+                 chat_type: str, is_command: bool, sender_is_bot: bool, sender_is_admin: bool,
+                 reputation: float = 0.0, normalized: Optional[str] = None):
+        self.text = text
+        self._normalized = normalized  # Already computed if the verdict cache had to scan the text
+        self.has_link = has_link  # A link the chat's allow/deny rules forbid
+        self.abuse_hits = abuse_hits
+        self.media_id = media_id
+        self.bad_media = bad_media  # Why this media was removed before, if it was
+        self.forward_origin = forward_origin
+        self.chat_type = chat_type
+        self.is_group = chat_type in GROUP_CHAT_TYPES
+        self.is_command = is_command
+        self.sender_is_bot = sender_is_bot
+        self.sender_is_admin = sender_is_admin
+        self.reputation = reputation  # Decayed violations across all our chats
+
+    @property
+    def normalized(self) -> str:
+        """Normalized text, computed on first use (verdict cache hits never need it)."""
+        if self._normalized is None:
+            self._normalized = normalize(self.text)
+        return self._normalized
+
+    @property
+    def is_exempt(self) -> bool:
+        """Bots and admins are exempt from all guards and filters."""
+        return self.sender_is_bot or self.sender_is_admin
+
+
+async def analyze(message: Message, bot: Bot) -> MessageFeatures:
+    text = message_text(message)
+    media_id = media_unique_id(message)
+    user = message.from_user
+    sender_is_bot = bool(user and user.is_bot)
+    chat_type = message.chat.type
+
+    sender_is_admin = False
+    score = 0.0
+    if user and not sender_is_bot and chat_type in GROUP_CHAT_TYPES:
+        sender_is_admin = await is_admin(bot, message.chat.id, user.id)
+        if not sender_is_admin:
+            score = await reputation.score(user.id)  # Usually served from the local cache
+
+    forbidden_link, abuse_hits, bad_media = False, (), None
+    normalized = None
+    if chat_type in GROUP_CHAT_TYPES:
+        # Copies of a known payload (same text, entity URLs and link rules) are decided without rescanning
+        urls = entity_urls(message)
+        policy = await link_classifier.policy(message.chat.id)
+        payload = "\0".join([text, *urls]) if urls else text
+
+        def scan(_):
+            # Normalized once: the abuse scan and later the spam scorer share it
+            nonlocal normalized
+            normalized = normalize(text)
+            return scan_text(text, policy, urls, normalized)
+        (forbidden_link, abuse_hits), bad_media = await verdict_cache.check(
+            payload, f"{FILTER_VERSION}:{policy.version}", message.chat.id, media_id, scan,
+        )
+
+    return MessageFeatures(
+        text=text,
+        has_link=forbidden_link,
+        abuse_hits=abuse_hits,
+        media_id=media_id,
+        bad_media=bad_media,
+        forward_origin=forward_origin(message),
+        chat_type=chat_type,
+        is_command=bool(message.text and message.text.startswith('/')),
+        sender_is_bot=sender_is_bot,
+        sender_is_admin=sender_is_admin,
+        reputation=score,
+        normalized=normalized,
+    )
+
+
+class FeaturesMiddleware(BaseMiddleware):
+    """Analyzes each incoming message once and injects it into handler data as `features`."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        data['features'] = await analyze(event, data['bot'])
+        return await handler(event, data)
@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from services.message_index import message_index
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+
+class MessageIndexMiddleware(BaseMiddleware):
+    """Outer message middleware: remembers every group message id for /purge and ban cleanup."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.chat.type in GROUP_CHAT_TYPES:
+            sender_id = event.from_user.id if event.from_user else event.chat.id  # Anonymous admins
+            message_index.record(event.chat.id, event.message_id, sender_id, event.date.timestamp())
+        return await handler(event, data)
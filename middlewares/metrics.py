@@ -0,0 +1,91 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from services.metrics import (
+    BOT_API_CALLS_PER_UPDATE, BOT_API_SECONDS, HANDLER_SECONDS, REDIS_CALLS_PER_UPDATE,
+    UPDATES_IN_FLIGHT, UpdateCalls, current_update,
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: in-flight gauge and API/Redis calls per update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        calls = UpdateCalls()
+        token = current_update.set(calls)
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+            current_update.reset(token)
+            BOT_API_CALLS_PER_UPDATE.observe(calls.api)
+            REDIS_CALLS_PER_UPDATE.observe(calls.redis)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner middleware: latency histogram per handler function."""
+
+    def __init__(self):
+        self._children: Dict[Callable, Any] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data['handler'].callback
+        child = self._children.get(callback)
+        if child is None:
+            child = self._children[callback] = HANDLER_SECONDS.labels(callback.__name__)
+
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            child.observe(time.perf_counter() - start)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware: Bot API latency by method and outcome."""
+
+    OUTCOMES = ("ok", "error", "retry_after")
+
+    def __init__(self):
+        self._children: Dict[type, tuple] = {}
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        children = self._children.get(type(method))
+        if children is None:
+            name = type(method).__name__
+            children = self._children[type(method)] = tuple(
+                BOT_API_SECONDS.labels(name, outcome) for outcome in self.OUTCOMES
+            )
+
+        calls = current_update.get()
+        if calls is not None:
+            calls.api += 1
+
+        outcome = 1
+        start = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+            outcome = 0
+            return result
+        except TelegramRetryAfter:
+            outcome = 2
+            raise
+        finally:
+            children[outcome].observe(time.perf_counter() - start)
@@ -0,0 +1,71 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.types import Update
+
+from services.admin_cache import admin_cache
+from services.join_aggregator import join_aggregator
+from services.redis_batch import BatchedRedisStorage, RedisBatch, command, current_batch
+from services.reputation import reputation
+from services.verdict_cache import verdict_cache
+from utils import media_unique_id
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+
+class RedisBatchMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: one RedisBatch per update.
+
+    Runs before aiogram's FSM middleware, so the FSM state read joins the
+    prefetch pipeline together with the sender's reputation, the media
+    lookup and, for joins, the chat's raid mode. Writes the handlers defer
+    are flushed when the update finishes.
+    """
+
+    def __init__(self, redis, fsm: FSMContextMiddleware):
+        self.redis = redis
+        self.fsm = fsm
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        batch = RedisBatch(self.redis)
+        token = current_batch.set(batch)
+        try:
+            self._prefetch(batch, event, data)
+            await batch.execute()  # Failures are kept per key; each service falls back on its own
+            return await handler(event, data)
+        finally:
+            try:
+                await batch.close()
+            finally:
+                current_batch.reset(token)
+
+    def _prefetch(self, batch: RedisBatch, event: Update, data: Dict[str, Any]) -> None:
+        storage = self.fsm.storage
+        if isinstance(storage, BatchedRedisStorage):
+            context = self.fsm.resolve_event_context(data['bot'], data)
+            if context is not None:
+                state_key = storage.state_key(context.key)
+                batch.prefetch(("fsm", state_key), command('GET', state_key))
+
+        message = event.message
+        if message is not None and message.chat.type in GROUP_CHAT_TYPES:
+            user = message.from_user
+            roster = admin_cache.cached(message.chat.id)
+            if user and not user.is_bot and (roster is None or user.id not in roster.ids):
+                reputation.prefetch(batch, user.id)  # Read by FeaturesMiddleware for non-admins
+            media_id = media_unique_id(message)
+            if media_id:
+                verdict_cache.prefetch(batch, message.chat.id, media_id)
+
+        member = event.chat_member
+        if member is not None and member.old_chat_member.status in ("left", "kicked") \
+                and not member.new_chat_member.user.is_bot:
+            reputation.prefetch(batch, member.new_chat_member.user.id)  # Joins check it before welcoming
+            join_aggregator.prefetch(batch, member.chat.id)
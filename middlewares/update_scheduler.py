@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from services.update_scheduler import update_scheduler
+
+
+class UpdateSchedulerMiddleware(BaseMiddleware):
+    """
+    First outer update middleware: every update, whether it came from polling, the
+    webhook or a stream worker, waits its turn in the update scheduler here.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get('event_chat')  # Set by aiogram's UserContextMiddleware, which runs before this
+        return await update_scheduler.run(chat.id if chat else None, lambda: handler(event, data))
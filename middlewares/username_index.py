@@ -0,0 +1,27 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from services.username_index import username_index
+
+
+class UsernameIndexMiddleware(BaseMiddleware):
+    """Outer update middleware: feeds every user the bot sees into the username index."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        message = event.message or event.edited_message
+        if message is not None:
+            username_index.observe(message.from_user)
+            if message.reply_to_message is not None:
+                username_index.observe(message.reply_to_message.from_user)
+            for user in message.new_chat_members or ():
+                username_index.observe(user)
+        elif event.chat_member is not None:
+            username_index.observe(event.chat_member.new_chat_member.user)
+        return await handler(event, data)
@@ -0,0 +1,148 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List
+
+# Lookalike letters (Cyrillic/Greek), folded to plain Latin
+_HOMOGLYPHS = str.maketrans({
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o',
+    'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x',
+})
+# Digits only stand in for letters inside words with letters ("s3x", not "100 5 3")
+_LEET_DIGITS = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b'})
+# Symbols only stand in for letters when a letter follows ("$hit", "a$$hole", not "hi!")
+_LEET_SYMBOLS = str.maketrans({'@': 'a', '$': 's', '!': 'i', '|': 'l'})
+_leet_symbol_re = re.compile(r"[@$!|]+(?=[^\W_])")
+_token_re = re.compile(r"[^\W_]+")
+_spelling_re = re.compile(r"[^\s/]{1,3}")  # Separator inside a spelled-out word: "f.u.c.k", "f-u-c-k", "f*_*u"
+_repeat_re = re.compile(r"(.)\1+")
+_triple_re = re.compile(r"(.)\1{2,}")
+MIN_SPELLED = 3  # Shorter runs of single letters ("b/c", "B.C.", "a b") are left alone
+# Part of the verdict cache key: bump when normalize() changes what it produces
+NORMALIZE_VERSION = "2"
+
+
+def _collapse(word: str) -> str:
+    """"fuuuck" -> "fuck", but never down to two letters ("cc", "bcc", "mcc" stay), which short terms would match."""
+    short = _repeat_re.sub(r'\1', word)
+    if len(short) > 2 or short == word:
+        return short
+    return _triple_re.sub(r'\1\1', word)
+
+
+def normalize(text: str) -> str:
+    """
+    Folds text into the form the matcher searches: casefolded, accents and
+    homoglyphs removed, words separated by single spaces, letter runs collapsed
+    ("fuuuck" -> "fuck") and words spelled out with punctuation re-joined
+    ("f.u.c.k" -> "fuck"; at least MIN_SPELLED letters, not across spaces or slashes).
+    The result is padded with spaces so whole-word patterns can match at the edges.
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c)).translate(_HOMOGLYPHS)
+    text = _leet_symbol_re.sub(lambda m: m.group().translate(_LEET_SYMBOLS), text)
+
+    tokens = []
+    spelled = []  # pending run of one-character tokens joined by punctuation
+    end = 0
+    for match in _token_re.finditer(text):
+        token = match.group()
+        if len(token) == 1 and spelled and _spelling_re.fullmatch(text, end, match.start()):
+            spelled.append(token)
+        else:
+            _flush_spelled(spelled, tokens)
+            spelled = [token] if len(token) == 1 else []
+            if not spelled:
+                tokens.append(token)
+        end = match.end()
+    _flush_spelled(spelled, tokens)
+
+    words = []
+    for token in tokens:
+        if token.isdigit():
+            words.append(token)  # Numbers are not leetspeak
+        else:
+            words.append(_collapse(token.translate(_LEET_DIGITS)))
+    return ' ' + ' '.join(words) + ' '
+
+
+def _flush_spelled(letters: List[str], tokens: List[str]) -> None:
+    if len(letters) >= MIN_SPELLED:
+        tokens.append(''.join(letters))
+    else:
+        tokens.extend(letters)
+
+
+class AbuseMatcher:
+    """
+    Aho-Corasick automaton over normalized terms.
+    Built once; matching is a single pass over the normalized text, so the cost
+    per message depends on the message length, not on the number of terms.
+    Terms are matched as whole words or whole phrases.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._term: List[int] = [-1]     # index into self.terms ending at this node
+        self._next_out: List[int] = [0]  # nearest node on the fail chain that ends a term
+
+        for term in terms:
+            pattern = normalize(term)
+            if pattern.strip():
+                self._add(pattern, len(self.terms))
+                self.terms.append(term)
+        self._build_links()
+
+    def _add(self, pattern: str, term_index: int) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._term.append(-1)
+                self._next_out.append(0)
+            node = nxt
+        if self._term[node] < 0:
+            self._term[node] = term_index
+
+    def _build_links(self) -> None:
+        queue = list(self._goto[0].values())
+        for node in queue:  # breadth-first; the list grows while we walk it
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[child] = fail
+                self._next_out[child] = fail if self._term[fail] >= 0 else self._next_out[fail]
+
+    def find(self, text: str, first_only: bool = False) -> List[str]:
+        """Returns the terms found in `text` (raw, unnormalized input)."""
+        return self.find_normalized(normalize(text), first_only)
+
+    def find_normalized(self, normalized: str, first_only: bool = False) -> List[str]:
+        goto, fail, term, next_out = self._goto, self._fail, self._term, self._next_out
+        hits = []
+        node = 0
+        for ch in normalized:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            out = node if term[node] >= 0 else next_out[node]
+            while out:
+                hits.append(self.terms[term[out]])
+                if first_only:
+                    return hits
+                out = next_out[out]
+        return hits
+
+    def contains(self, text: str) -> bool:
+        return bool(self.find(text, first_only=True))
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import User
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+ADMIN_CACHE_TTL = 300  # Seconds a roster is trusted before it is fetched again
+FAILURE_TTL = 10       # Seconds a failed get_chat_administrators is not retried for the chat
+ADMIN_STATUSES = ('administrator', 'creator')
+REDIS_KEY = "admins:{chat_id}"
+INVALIDATE_CHANNEL = "admins:invalidate"
+RESUBSCRIBE_DELAY = 5.0
+
+
+class AdminRoster:
+    """Administrators of one chat, as returned by get_chat_administrators."""
+    __slots__ = ('ids', 'users', 'expires_at')
+
+    def __init__(self, users: List[User], expires_at: float):
+        self.users = users
+        self.ids = frozenset(u.id for u in users)
+        self.expires_at = expires_at
+
+
+class AdminCache:
+    """
+    Per-chat admin roster cache.
+    Rosters live in process memory and, when Redis is configured, in a shared
+    hash with a TTL so every instance fills it with a single API call. A
+    roster change drops the chat's copy on every instance through a Redis
+    pub/sub message (the whole cache after a resubscribe, as for settings).
+    """
+
+    def __init__(self, ttl: int = ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        self.redis = None
+        self._rosters: Dict[int, AdminRoster] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._failures: Dict[int, Tuple[float, Exception]] = {}  # chat -> (retry_at, error)
+        self._generation = 0  # Bumped on every invalidation so in-flight loads do not store stale rosters
+        self._task: Optional[asyncio.Task] = None
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+
+    async def get_roster(self, bot: Bot, chat_id: int) -> AdminRoster:
+        roster = self._rosters.get(chat_id)
+        now = time.monotonic()
+        if roster is not None and roster.expires_at > now:
+            return roster
+        failure = self._failures.get(chat_id)
+        if failure is not None:
+            if failure[0] > now:
+                raise failure[1]  # Telegram just failed for this chat; do not ask again on every message
+            del self._failures[chat_id]
+
+        # Single-flight: concurrent misses for one chat share one fetch
+        loading = self._loading.get(chat_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(bot, chat_id))
+            self._loading[chat_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        return await asyncio.shield(loading)
+
+    def cached(self, chat_id: int) -> Optional[AdminRoster]:
+        """The chat's roster if it is in memory and fresh, without loading it."""
+        roster = self._rosters.get(chat_id)
+        return roster if roster is not None and roster.expires_at > time.monotonic() else None
+
+    async def invalidate(self, chat_id: int) -> None:
+        """Drops the chat's roster here, in Redis and on every other instance."""
+        self._drop(chat_id)
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(REDIS_KEY.format(chat_id=chat_id))
+                    pipe.publish(INVALIDATE_CHANNEL, chat_id)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Failed to invalidate admin roster for {chat_id} in Redis: {e}")
+
+    def _drop(self, chat_id: int) -> None:
+        self._generation += 1
+        self._rosters.pop(chat_id, None)
+        self._failures.pop(chat_id, None)
+
+    async def _load(self, bot: Bot, chat_id: int) -> AdminRoster:
+        generation = self._generation
+        users = await self._load_shared(chat_id)
+        if users is None:
+            try:
+                admins = await bot.get_chat_administrators(chat_id)
+            except Exception as e:
+                self._failures[chat_id] = (time.monotonic() + FAILURE_TTL, e)
+                raise
+            users = [m.user for m in admins if m.user]
+            if generation == self._generation:
+                await self._store_shared(chat_id, users)
+
+        roster = AdminRoster(users, time.monotonic() + self.ttl)
+        if generation == self._generation:  # Not invalidated while we were fetching
+            self._rosters[chat_id] = roster
+        return roster
+
+    async def _load_shared(self, chat_id: int) -> Optional[List[User]]:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.hvals(REDIS_KEY.format(chat_id=chat_id))
+        except Exception as e:
+            logger.warning(f"Admin roster read from Redis failed for {chat_id}: {e}")
+            return None
+        if not raw:
+            return None
+        return [User.model_validate_json(u) for u in raw]
+
+    async def _store_shared(self, chat_id: int, users: List[User]) -> None:
+        if self.redis is None or not users:
+            return
+        key = REDIS_KEY.format(chat_id=chat_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping={str(u.id): u.model_dump_json(exclude_none=True) for u in users})
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Admin roster write to Redis failed for {chat_id}: {e}")
+
+
+    # --- INVALIDATION LISTENER ---
+    async def start(self) -> None:
+        if self.redis is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                self._generation += 1
+                self._rosters.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._drop(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Admin roster invalidation listener lost Redis, resubscribing: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                await pubsub.aclose()
+
+
+def is_admin_change(old_status: str, new_status: str) -> bool:
+    """True if a member update can change the chat's admin roster."""
+    return old_status in ADMIN_STATUSES or new_status in ADMIN_STATUSES
+
+
+admin_cache = AdminCache()
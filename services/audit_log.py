@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+PARTITION_SECONDS = 7 * 86400  # One modlog_<n> table per week
+RETENTION_DAYS = 90            # Weeks entirely older than this are dropped
+FLUSH_INTERVAL = 2.0           # Seconds between bulk inserts
+FLUSH_BATCH = 1000             # Queued entries that trigger an early flush
+MAX_QUEUED = 100_000           # Entries kept while SQLite is failing; the oldest are dropped beyond it
+PRUNE_INTERVAL = 3600          # Seconds between retention checks
+
+TABLE_PREFIX = "modlog_"
+# Every partition is its own table with its own indexes; rowid order is insertion order.
+SQL_PARTITION = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        actor_id INTEGER NOT NULL,  -- 0: the bot acted on its own
+        action TEXT NOT NULL,
+        reason TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS {table}_chat_ts ON {table} (chat_id, ts);
+    CREATE INDEX IF NOT EXISTS {table}_chat_user ON {table} (chat_id, user_id, ts);
+"""
+SQL_INSERT = "INSERT INTO {table} (ts, chat_id, user_id, actor_id, action, reason) VALUES (?, ?, ?, ?, ?, ?)"
+# Keyset pages: the (ts, id) of the last row shown is the cursor; both indexes end in (ts, rowid)
+SQL_PAGE = """
+    SELECT id, ts, chat_id, user_id, actor_id, action, reason FROM {table}
+    WHERE chat_id = ? AND (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?
+"""
+SQL_PAGE_USER = """
+    SELECT id, ts, chat_id, user_id, actor_id, action, reason FROM {table}
+    WHERE chat_id = ? AND user_id = ? AND (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?
+"""
+SQL_PARTITIONS = "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'modlog_[0-9]*'"
+
+
+class AuditEntry(NamedTuple):
+    id: int
+    ts: int
+    chat_id: int
+    user_id: int
+    actor_id: int
+    action: str
+    reason: str
+
+    @property
+    def cursor(self) -> str:
+        """Token for the page after this entry."""
+        return f"{self.ts}-{self.id}"
+
+
+def parse_cursor(token: str) -> Optional[Tuple[int, int]]:
+    ts, _, row_id = token.partition('-')
+    if not ts.isdigit() or not row_id.isdigit():
+        return None
+    return int(ts), int(row_id)
+
+
+def _table(partition: int) -> str:
+    return f"{TABLE_PREFIX}{partition}"
+
+
+def _partitions(conn) -> set:
+    """Partition numbers that exist in the database right now."""
+    return {int(name[len(TABLE_PREFIX):]) for name, in conn.execute(SQL_PARTITIONS)}
+
+
+class AuditLog:
+    """
+    Append-only record of every moderation action.
+
+    `record` only appends to an in-memory queue, so handlers never wait on disk.
+    The queue is written with executemany in one transaction every
+    FLUSH_INTERVAL, or as soon as FLUSH_BATCH entries are waiting. Rows are
+    partitioned into one table per week: pages are keyset queries on
+    (chat_id, ts) or (chat_id, user_id, ts) that walk the partitions newest
+    first, so their cost does not grow with the table, and retention drops
+    whole tables instead of deleting millions of rows.
+    """
+
+    def __init__(self):
+        self.storage: Optional[Storage] = None
+        self._queue: List[Tuple[int, int, int, int, str, str]] = []
+        self._partitions: Optional[set] = None  # Partitions this process knows exist; only spares flush a CREATE
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def setup(self, storage: Storage) -> None:
+        self.storage = storage
+
+    def record(self, chat_id: int, user_id: int, action: str, reason: str = "", actor_id: int = 0) -> None:
+        """Queues one entry. Never blocks and never raises."""
+        if self.storage is None:
+            return
+        self._queue.append((int(time.time()), chat_id, user_id, actor_id, action, reason))
+        if len(self._queue) > MAX_QUEUED:
+            excess = len(self._queue) - MAX_QUEUED
+            del self._queue[:excess]
+            self.dropped += excess
+        if len(self._queue) >= FLUSH_BATCH:
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    # --- QUERIES ---
+    async def page(self, chat_id: int, limit: int, user_id: Optional[int] = None,
+                   before: Optional[Tuple[int, int]] = None) -> List[AuditEntry]:
+        """The chat's newest entries (only `user_id`'s if given) older than the `before` cursor."""
+        if self._queue:
+            await self.flush()  # Include what happened in the last few seconds
+        ts, row_id = before or (2 ** 62, 2 ** 62)
+        newest = ts // PARTITION_SECONDS
+
+        def _page(conn):
+            # Listed on the same connection as the pages, so partitions created or dropped by
+            # other processes since are seen (the listing is one read of the schema table)
+            partitions = _partitions(conn)
+            rows = []
+            cursor_ts, cursor_id = ts, row_id
+            for partition in sorted((p for p in partitions if p <= newest), reverse=True):
+                if user_id is None:
+                    sql, params = SQL_PAGE, (chat_id, cursor_ts, cursor_id, limit - len(rows))
+                else:
+                    sql, params = SQL_PAGE_USER, (chat_id, user_id, cursor_ts, cursor_id, limit - len(rows))
+                table = _table(partition)
+                rows += conn.execute(sql.format(table=table), params).fetchall()
+                if len(rows) >= limit:
+                    break
+                cursor_ts, cursor_id = 2 ** 62, 2 ** 62  # Older partitions: every row is before the cursor
+            return rows
+        return [AuditEntry(*row) for row in await self.storage.read(_page)]
+
+    async def _load_partitions(self) -> set:
+        if self._partitions is None:
+            self._partitions = await self.storage.read(_partitions)
+        return self._partitions
+
+    # --- FLUSHING ---
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flush loop and writes everything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.storage is not None:
+            await self.flush()
+
+    async def _run(self) -> None:
+        next_prune = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if time.time() >= next_prune:
+                    await self.prune()
+                    next_prune = time.time() + PRUNE_INTERVAL
+            except Exception as e:
+                logger.error(f"Audit log flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Writes queued entries to their partitions in one transaction. Returns how many were written."""
+        batch, self._queue = self._queue, []
+        if not batch:
+            return 0
+        partitions = await self._load_partitions()
+        by_partition = {}
+        for row in batch:
+            by_partition.setdefault(row[0] // PARTITION_SECONDS, []).append(row)
+
+        def _write(conn):
+            for partition, rows in by_partition.items():
+                table = _table(partition)
+                if partition not in partitions:
+                    for statement in SQL_PARTITION.format(table=table).split(';'):
+                        if statement.strip():
+                            conn.execute(statement)
+                conn.executemany(SQL_INSERT.format(table=table), rows)
+        try:
+            await self.storage.write(_write)
+        except Exception:
+            self._queue[:0] = batch  # Keep them, in order, for the next flush
+            self._partitions = None  # Another process may have dropped one; list them again
+            raise
+        partitions.update(by_partition)
+        return len(batch)
+
+    async def prune(self, retention_days: float = RETENTION_DAYS) -> int:
+        """Drops partitions whose whole week is older than the retention. Returns how many were dropped."""
+        cutoff = time.time() - retention_days * 86400
+
+        def _drop(conn):
+            # Listed inside the write, so partitions other processes created or already dropped count
+            partitions = _partitions(conn)
+            expired = [p for p in partitions if (p + 1) * PARTITION_SECONDS <= cutoff]
+            for partition in expired:
+                conn.execute(f"DROP TABLE IF EXISTS {_table(partition)}")
+            return partitions.difference(expired), len(expired)
+        partitions, dropped = await self.storage.write(_drop)
+        self._partitions = partitions
+        if dropped:
+            logger.info(f"Audit log: dropped {dropped} partitions older than {retention_days} days.")
+        return dropped
+
+
+audit_log = AuditLog()
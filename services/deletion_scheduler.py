@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from services.redis_batch import command, defer
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+REDIS_KEY = "deletions:pending"  # Sorted set: "chat_id:message_id" scored by due time
+CLAIM_BATCH = 1000               # Max deletions claimed from Redis per wakeup
+IDLE_POLL = 5.0                  # Seconds between Redis checks when nothing is due locally
+DELETE_CHUNK = 100               # deleteMessages accepts at most 100 ids
+DELETE_CONCURRENCY = 4           # deleteMessages calls in flight per chat
+COALESCE_SLACK = 1.0             # Deletions due this soon after a wakeup go out with it
+RETRY_DELAY = 5.0                # Seconds before deletions whose batch failed are tried again
+
+# Atomically takes every due entry, so several instances never delete the same message twice.
+CLAIM_DUE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+class DeletionScheduler:
+    """
+    Deletes bot and command messages after a delay without keeping handlers alive.
+
+    Pending deletions are stored in a Redis sorted set keyed by due time, so they
+    survive restarts and are shared by all instances. One background worker
+    sleeps until the earliest due time (local heap), claims everything due and
+    removes it with deleteMessages, one call per chat per 100 messages.
+    Without Redis the heap itself holds the deletions (lost on restart), and
+    so it does for deletions whose ZADD failed: those are still delivered while
+    Redis is down. Deletions whose batch failed are scheduled again.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.bot: Optional[Bot] = None
+        # (due, chat_id, message_id); chat_id 0 marks a wakeup hint for entries held in Redis
+        self._heap: List[Tuple[float, int, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._claim = None
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+        self._claim = redis.register_script(CLAIM_DUE_LUA)
+
+    async def start(self, bot: Bot) -> None:
+        self.bot = bot
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def schedule(self, chat_id: int, message_id: int, delay: float) -> None:
+        due = time.time() + delay
+        if self.redis is None:
+            self._push((due, chat_id, message_id))
+            return
+
+        def keep_local(e: Exception) -> None:
+            logger.warning(f"Could not persist deletion of {message_id} in {chat_id}, keeping it local: {e}")
+            self._push((due, chat_id, message_id))
+
+        # The ZADD goes out with the update's other Redis writes; the wakeup marker is local
+        await defer(self.redis, command('ZADD', REDIS_KEY, due, f"{chat_id}:{message_id}"), on_error=keep_local)
+        self._push((due, 0, 0))
+
+    def _push(self, entry: Tuple[float, int, int]) -> None:
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, entry)
+        if earliest is None or entry[0] < earliest:
+            self._wakeup.set()
+
+    async def pending(self) -> int:
+        """Deletions not yet performed (Redis set plus entries kept only in memory)."""
+        local = sum(1 for _, chat_id, _ in self._heap if chat_id)
+        if self.redis is None:
+            return local
+        return local + await self.redis.zcard(REDIS_KEY)
+
+    # --- WORKER ---
+    async def _run(self) -> None:
+        while True:
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else IDLE_POLL
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(timeout, IDLE_POLL))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self._drain()
+            except Exception as e:
+                logger.error(f"Deletion worker error: {e}")
+
+    async def _drain(self) -> None:
+        now = time.time() + COALESCE_SLACK
+        by_chat: Dict[int, List[int]] = defaultdict(list)
+
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            if chat_id:
+                by_chat[chat_id].append(message_id)
+
+        if self.redis is not None:
+            try:
+                await self._claim_shared(now, by_chat)
+            except Exception as e:
+                # The local entries popped above still go out; Redis is tried again at the next poll
+                logger.warning(f"Could not claim deletions from Redis: {e}")
+
+        if by_chat:
+            await asyncio.gather(*(self._delete(chat_id, message_ids) for chat_id, message_ids in by_chat.items()))
+
+    async def _claim_shared(self, now: float, by_chat: Dict[int, List[int]]) -> None:
+        claimed = await self._claim(keys=[REDIS_KEY], args=[now, CLAIM_BATCH], client=self.redis)
+        for member in claimed:
+            chat_id, message_id = member.split(':')
+            by_chat[int(chat_id)].append(int(message_id))
+
+        if len(claimed) >= CLAIM_BATCH:
+            self._wakeup.set()
+        else:
+            # Entries scheduled before a restart or by other instances need a hint too
+            earliest = await self.redis.zrange(REDIS_KEY, 0, 0, withscores=True)
+            if earliest and (not self._heap or earliest[0][1] < self._heap[0][0]):
+                heapq.heappush(self._heap, (earliest[0][1], 0, 0))
+
+    async def _delete(self, chat_id: int, message_ids: List[int]) -> None:
+        try:
+            await delete_messages(self.bot, chat_id, message_ids)
+        except Exception as e:
+            # Claimed entries are no longer in Redis: put them back rather than lose them
+            logger.warning(f"Deleting {len(message_ids)} messages in {chat_id} failed, retrying later: {e}")
+            await self._requeue(chat_id, message_ids)
+
+    async def _requeue(self, chat_id: int, message_ids: List[int]) -> None:
+        due = time.time() + RETRY_DELAY
+        if self.redis is not None:
+            try:
+                await self.redis.zadd(REDIS_KEY, {f"{chat_id}:{message_id}": due for message_id in message_ids})
+                self._push((due, 0, 0))
+                return
+            except Exception as e:
+                logger.warning(f"Could not persist {len(message_ids)} retried deletions in {chat_id}: {e}")
+        for message_id in message_ids:
+            self._push((due, chat_id, message_id))
+
+
+async def delete_messages(bot: Bot, chat_id: int, message_ids: List[int],
+                          concurrency: int = DELETE_CONCURRENCY) -> int:
+    """
+    Deletes messages in chunks of 100 through the batch deleteMessages API, at most
+    `concurrency` chunks in flight. Returns how many ids were in chunks Telegram accepted.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete_chunk(chunk: List[int]) -> int:
+        async with semaphore:
+            try:
+                await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                return len(chunk)
+            except Exception as e:
+                logger.debug(f"Batch delete of {len(chunk)} messages in {chat_id} failed: {e}")
+                return 0
+
+    chunks = [message_ids[start:start + DELETE_CHUNK] for start in range(0, len(message_ids), DELETE_CHUNK)]
+    if len(chunks) == 1:
+        return await delete_chunk(chunks[0])
+    return sum(await asyncio.gather(*(delete_chunk(chunk) for chunk in chunks)))
+
+
+deletion_scheduler = DeletionScheduler()
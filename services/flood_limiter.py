@@ -0,0 +1,193 @@
+import logging
+import os
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from services.metrics import FLOOD_CHECKS
+from services.redis_batch import run, script_command
+from services.settings import DEFAULT_FLOOD_LIMIT, DEFAULT_FLOOD_PERIOD
+
+logger = logging.getLogger(__name__)
+_LOCAL = FLOOD_CHECKS.labels("local")
+_REDIS = FLOOD_CHECKS.labels("redis")
+_FALLBACK = FLOOD_CHECKS.labels("fallback")
+
+# --- CONFIGURATION ---
+MAX_TRACKED_USERS = 100_000  # (chat, user) windows kept in process; least recently active are evicted first
+SYNC_FRACTION = 0.6          # Redis is consulted once a user's local count reaches this share of the limit
+RETRY_AFTER = 5.0            # Seconds Redis is left alone after it failed; enforcement stays local meanwhile
+
+# Sliding window over a sorted set, evaluated atomically on the Redis server.
+# KEYS[1] = window key
+# ARGV    = now_ms, period_ms, limit, then (timestamp_ms, member) for every message not yet synced
+# Returns the number of messages in the window including these.
+# Once the limit is exceeded the window is cleared, so the user starts fresh after the mute.
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+for i = 4, #ARGV, 2 do
+    redis.call('ZADD', key, ARGV[i], ARGV[i + 1])
+end
+-- Trimmed after adding: unsynced messages can already be older than the window.
+-- A message exactly `period` old is out, as in the local window.
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - period)
+local count = redis.call('ZCARD', key)
+
+if count > limit then
+    redis.call('DEL', key)
+else
+    redis.call('PEXPIRE', key, period)
+end
+return count
+"""
+
+KEY_PREFIX = "flood"
+
+
+class _Window:
+    """The last `limit + 1` message times of one user in one chat, as a ring of doubles."""
+    __slots__ = ('stamps', 'head', 'pending', 'expires')
+
+    def __init__(self, capacity: int):
+        self.stamps = array('d', bytes(8 * capacity))
+        self.head = 0        # Slot the next message goes into (the oldest one)
+        self.pending = 0     # Newest messages Redis has not seen yet
+        self.expires = 0.0   # When every stored message has left the window
+
+    def add(self, now: float, period: float) -> int:
+        """Stores `now` and returns how many stored messages are inside the window."""
+        stamps = self.stamps
+        stamps[self.head] = now
+        self.head = (self.head + 1) % len(stamps)
+        self.pending = min(self.pending + 1, len(stamps))
+        self.expires = now + period
+        cutoff = now - period
+        return sum(1 for stamp in stamps if stamp > cutoff)
+
+    def unsynced(self):
+        """(timestamp, slot) of the messages not yet sent to Redis, oldest first."""
+        size = len(self.stamps)
+        for back in range(self.pending, 0, -1):
+            slot = (self.head - back) % size
+            yield self.stamps[slot], slot
+
+    def clear(self) -> None:
+        for slot in range(len(self.stamps)):
+            self.stamps[slot] = 0.0
+        self.pending = 0
+
+
+class FloodLimiter:
+    """
+    Two-tier flood limiter.
+
+    Every (chat, user) gets a small ring buffer of recent message times in
+    process, which answers the common case (a user far below the limit) with
+    no I/O. Once a user's local count reaches SYNC_FRACTION of the limit, the
+    messages Redis has not seen are sent in one script call and the shared
+    sliding window decides, so instances that see the same chat still agree.
+    Without Redis (or while it is failing) the local window alone enforces the
+    limit. Memory is bounded: at most MAX_TRACKED_USERS windows of limit + 1
+    doubles, idle windows are dropped as soon as they expire.
+    """
+
+    def __init__(self, limit: int, period: float, max_users: int = MAX_TRACKED_USERS,
+                 sync_fraction: float = SYNC_FRACTION):
+        self.limit = limit
+        self.period = period
+        self.max_users = max_users
+        self.sync_fraction = sync_fraction  # 0 consults Redis on every message
+        self.redis = None
+        self._script = None
+        self._windows: "OrderedDict[Tuple[int, int], _Window]" = OrderedDict()
+        self._redis_down_until = 0.0
+        self._instance = os.urandom(4).hex()  # Keeps sorted-set members unique across instances
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+        self._script = redis.register_script(SLIDING_WINDOW_LUA)
+
+    async def hit(self, chat_id: int, user_id: int,
+                  limit: Optional[int] = None, period: Optional[float] = None) -> int:
+        """
+        Records one message and returns how many the user sent inside the window.
+        `limit`/`period` override the defaults for chats that tuned them.
+        """
+        limit = limit or self.limit
+        period = period or self.period
+        now = time.time()
+        self._evict_idle(now)
+
+        key = (chat_id, user_id)
+        window = self._windows.get(key)
+        if window is None or len(window.stamps) != limit + 1:
+            window = self._windows[key] = _Window(limit + 1)  # New user, or the chat changed its limit
+            if len(self._windows) > self.max_users:
+                self._windows.popitem(last=False)
+        self._windows.move_to_end(key)
+        count = window.add(now, period)
+
+        # A flood is always synced too, so the shared window is cleared along with the local one
+        if count < limit * self.sync_fraction or self.redis is None:
+            _LOCAL.inc()
+            return self._local_result(window, count, limit)
+        if now < self._redis_down_until:
+            _FALLBACK.inc()
+            return self._local_result(window, count, limit)
+
+        args = [int(now * 1000), int(period * 1000), limit]
+        for stamp, slot in window.unsynced():
+            args += [int(stamp * 1000), f"{self._instance}:{stamp!r}:{slot}"]
+        try:
+            redis_key = f"{KEY_PREFIX}:{chat_id}:{user_id}"
+            shared = int((await run(self.redis, script_command(self._script, [redis_key], args)))[0])
+        except Exception as e:
+            logger.warning(f"Flood limiter falling back to local windows for {RETRY_AFTER:.0f}s: {e}")
+            self._redis_down_until = now + RETRY_AFTER
+            _FALLBACK.inc()
+            return self._local_result(window, count, limit)
+        _REDIS.inc()
+        window.pending = 0
+        count = max(count, shared)
+        if count > limit:
+            window.clear()
+        return count
+
+    def is_flood(self, count: int, limit: Optional[int] = None) -> bool:
+        return count > (limit or self.limit)
+
+    @staticmethod
+    def _local_result(window: _Window, count: int, limit: int) -> int:
+        if count > limit:
+            window.clear()  # Start fresh after the mute, like the shared window
+        return count
+
+    def _evict_idle(self, now: float) -> None:
+        """Least recently active windows sit at the front; drop those whose messages all expired."""
+        windows = self._windows
+        while windows:
+            key, window = next(iter(windows.items()))
+            if window.expires > now:
+                break
+            del windows[key]
+
+    # --- MEMORY REPORT ---
+    def memory(self) -> dict:
+        """Tracked windows and their approximate footprint, including the dict entry and key tuple."""
+        tracked = len(self._windows)
+        per_user = 0
+        if tracked:
+            key, window = next(reversed(self._windows.items()))
+            per_user = (sys.getsizeof(window) + sys.getsizeof(window.stamps) + sys.getsizeof(key)
+                        + sum(sys.getsizeof(part) for part in key) + 120)  # ~120: OrderedDict link + dict slot
+        return {"tracked": tracked, "bytes_per_user": per_user, "bytes": tracked * per_user,
+                "max_users": self.max_users}
+
+
+flood_limiter = FloodLimiter(DEFAULT_FLOOD_LIMIT, DEFAULT_FLOOD_PERIOD)
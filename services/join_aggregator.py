@@ -0,0 +1,268 @@
+import asyncio
+import html
+import logging
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from aiogram import Bot
+from aiogram.types import ChatPermissions, User
+
+from services.deletion_scheduler import deletion_scheduler
+from services.outbound import low_priority
+from services.redis_batch import MISSING, RedisBatch, active_batch, command, run
+from services.settings import ChatSettings
+from services.update_scheduler import update_scheduler, Shed
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+WELCOME_WINDOW = 5.0        # Seconds of joins folded into one welcome message
+WELCOME_NAMES = 3           # Names listed before "and N others"
+WELCOME_LIFETIME = 10       # Seconds before the welcome is deleted
+RAID_WINDOW = 60.0          # A chat is raided when `raid_limit` joins fall inside this many seconds
+RAID_MUTE = timedelta(hours=24)  # Raid joiners stay muted this long unless admins unmute them earlier
+RESTRICT_CONCURRENCY = 8    # restrictChatMember calls in flight at once
+MAX_TRACKED_CHATS = 10_000  # Per-chat join state kept in memory (least recently joined are dropped)
+RAID_CHATS_KEY = "raid:chats"  # Redis set of chats in raid mode, shared by all instances (survives restarts)
+
+
+class JoinRing:
+    """
+    The last `size` joins of one chat in two fixed-size arrays.
+    The slot about to be overwritten is always the oldest join, so the rate
+    check is a single subtraction and memory never grows with the raid.
+    """
+    __slots__ = ('times', 'user_ids', 'next')
+
+    def __init__(self, size: int):
+        self.times = array('d', [float('-inf')]) * size
+        self.user_ids = array('q', [0]) * size
+        self.next = 0
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def add(self, now: float, user_id: int) -> bool:
+        """Records a join; True when the ring now holds `size` joins within RAID_WINDOW."""
+        self.times[self.next] = now
+        self.user_ids[self.next] = user_id
+        self.next = (self.next + 1) % len(self.times)
+        return now - self.times[self.next] <= RAID_WINDOW
+
+    def recent(self, now: float) -> List[int]:
+        return [uid for t, uid in zip(self.times, self.user_ids) if now - t <= RAID_WINDOW]
+
+    def clear(self) -> None:
+        for i in range(len(self.times)):
+            self.times[i] = float('-inf')
+
+
+class ChatJoins:
+    """Join state of one chat: the rate ring and the welcome being gathered."""
+    __slots__ = ('ring', 'names', 'others', 'flush_handle')
+
+    def __init__(self, ring_size: int):
+        self.ring = JoinRing(ring_size)
+        self.names: List[str] = []
+        self.others = 0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+
+class JoinAggregator:
+    """
+    Coalesces joins per chat and detects join raids.
+
+    Outside a raid, joins within WELCOME_WINDOW share one welcome message.
+    When `raid_limit` joins land within RAID_WINDOW the chat enters raid mode:
+    welcomes stop, everyone who joined inside the window is muted at once
+    (at most RESTRICT_CONCURRENCY calls in flight), and so is every later
+    joiner until an admin sends /raidoff.
+
+    Raid mode is shared through a Redis set. Every join checks it with a
+    SISMEMBER that rides in the update's prefetch pipeline, so a raid started
+    or lifted on another instance applies to the next join here; `raid_chats`
+    is this process's last known answer, used when Redis fails.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.raid_chats: Set[int] = set()
+        self._chats: "OrderedDict[int, ChatJoins]" = OrderedDict()
+        self._restrict_slots = asyncio.Semaphore(RESTRICT_CONCURRENCY)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+
+    async def start(self) -> None:
+        """Restores raid mode for chats that were raided before a restart."""
+        if self.redis is not None:
+            self.raid_chats = {int(chat_id) for chat_id in await self.redis.smembers(RAID_CHATS_KEY)}
+
+    def prefetch(self, batch: RedisBatch, chat_id: int) -> None:
+        """Queues the chat's raid-mode check on the update's pipeline (joins read it in `in_raid`)."""
+        if self.redis is not None:
+            batch.prefetch(("raid", chat_id), command('SISMEMBER', RAID_CHATS_KEY, chat_id))
+
+    async def in_raid(self, chat_id: int) -> bool:
+        """Whether the chat is in raid mode on any instance; this process's view if Redis fails."""
+        if self.redis is None:
+            return chat_id in self.raid_chats
+        batch = active_batch()
+        shared = batch.result(("raid", chat_id)) if batch is not None else MISSING
+        if shared is MISSING:
+            try:
+                shared, = await run(self.redis, command('SISMEMBER', RAID_CHATS_KEY, chat_id))
+            except Exception as e:
+                shared = e
+        if isinstance(shared, Exception):
+            logger.warning(f"Shared raid mode unavailable for {chat_id}, using this instance's: {shared}")
+            return chat_id in self.raid_chats
+        if shared:
+            self.raid_chats.add(chat_id)
+        else:
+            self.raid_chats.discard(chat_id)
+        return bool(shared)
+
+    async def stop(self) -> None:
+        for joins in self._chats.values():
+            if joins.flush_handle is not None:
+                joins.flush_handle.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    # --- JOINS ---
+    async def on_join(self, bot: Bot, chat_id: int, user: User, settings: ChatSettings) -> None:
+        now = time.monotonic()
+        joins = self._get_chat(chat_id, settings.raid_limit)
+        raided = joins.ring.add(now, user.id)
+
+        if await self.in_raid(chat_id):
+            await self.restrict(bot, chat_id, [user.id])
+            return
+
+        if raided:
+            await self._start_raid(bot, chat_id, joins.ring.recent(now))
+            return
+        if update_scheduler.shedding(Shed.WELCOME):
+            return  # The join still counted toward raid detection above
+
+        if len(joins.names) < WELCOME_NAMES:
+            joins.names.append(user.full_name or user.first_name or 'there')
+        else:
+            joins.others += 1
+        if joins.flush_handle is None:
+            joins.flush_handle = asyncio.get_running_loop().call_later(
+                WELCOME_WINDOW, self._spawn_welcome, bot, chat_id, settings.welcome_msg
+            )
+
+    def _get_chat(self, chat_id: int, ring_size: int) -> ChatJoins:
+        joins = self._chats.get(chat_id)
+        if joins is None:
+            joins = self._chats[chat_id] = ChatJoins(ring_size)
+            if len(self._chats) > MAX_TRACKED_CHATS:
+                _, evicted = self._chats.popitem(last=False)
+                if evicted.flush_handle is not None:
+                    evicted.flush_handle.cancel()
+        else:
+            self._chats.move_to_end(chat_id)
+            if len(joins.ring) != ring_size:  # /setraid changed the threshold
+                joins.ring = JoinRing(ring_size)
+        return joins
+
+    # --- WELCOMES ---
+    def _spawn_welcome(self, bot: Bot, chat_id: int, template: str) -> None:
+        task = asyncio.create_task(self._send_welcome(bot, chat_id, template))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_welcome(self, bot: Bot, chat_id: int, template: str) -> None:
+        joins = self._chats.get(chat_id)
+        if joins is None:
+            return
+        names, others = joins.names, joins.others
+        joins.names, joins.others, joins.flush_handle = [], 0, None
+        if not names or chat_id in self.raid_chats:
+            return
+
+        final_msg = template.replace('{user_name}', format_names(names, others))
+        try:
+            with low_priority():
+                sent = await bot.send_message(chat_id, final_msg, parse_mode="HTML")
+            await deletion_scheduler.schedule(chat_id, sent.message_id, WELCOME_LIFETIME)
+        except Exception:
+            pass  # Welcomes are cosmetic
+
+    # --- RAID MODE ---
+    async def _start_raid(self, bot: Bot, chat_id: int, user_ids: List[int]) -> None:
+        self.raid_chats.add(chat_id)
+        joins = self._chats[chat_id]
+        if joins.flush_handle is not None:
+            joins.flush_handle.cancel()
+        joins.names, joins.others, joins.flush_handle = [], 0, None
+        logger.warning(f"🚨 JOIN RAID in {chat_id}: {len(user_ids)} joins within {RAID_WINDOW:.0f}s.")
+
+        if self.redis is not None:
+            try:
+                await self.redis.sadd(RAID_CHATS_KEY, chat_id)
+            except Exception as e:
+                logger.warning(f"Could not persist raid mode for {chat_id}: {e}")
+
+        await self.restrict(bot, chat_id, user_ids)
+        try:
+            await bot.send_message(
+                chat_id,
+                f"🚨 <b>Raid detected:</b> {len(user_ids)} joins in under {RAID_WINDOW:.0f} seconds. "
+                f"New members are muted until an admin sends /raidoff.",
+                parse_mode="HTML"
+            )
+        except Exception:
+            pass
+
+    async def end_raid(self, chat_id: int) -> bool:
+        """Lifts raid mode on every instance; returns False if the chat was not in it. Muted joiners stay muted."""
+        raided = chat_id in self.raid_chats
+        self.raid_chats.discard(chat_id)
+        if self.redis is not None:
+            removed, = await run(self.redis, command('SREM', RAID_CHATS_KEY, chat_id))
+            raided = raided or bool(removed)  # Possibly started by another instance
+        if not raided:
+            return False
+        joins = self._chats.get(chat_id)
+        if joins is not None:
+            joins.ring.clear()  # The raid's own joins must not re-trigger it
+        return True
+
+    async def restrict(self, bot: Bot, chat_id: int, user_ids: List[int]) -> None:
+        """Mutes joiners for RAID_MUTE, at most RESTRICT_CONCURRENCY calls at a time."""
+        until_date = datetime.now() + RAID_MUTE
+
+        async def restrict_one(user_id: int) -> None:
+            async with self._restrict_slots:
+                try:
+                    await bot.restrict_chat_member(
+                        chat_id=chat_id,
+                        user_id=user_id,
+                        permissions=ChatPermissions(can_send_messages=False),
+                        until_date=until_date
+                    )
+                except Exception as e:
+                    logger.error(f"❌ Failed to restrict joiner {user_id} in {chat_id}: {e}")
+
+        await asyncio.gather(*(restrict_one(user_id) for user_id in user_ids))
+
+
+def format_names(names: List[str], others: int) -> str:
+    """'<b>A</b>, <b>B</b> and <b>C</b>' or '<b>A</b>, <b>B</b>, <b>C</b> and 12 others'."""
+    bold = [f"<b>{html.escape(name)}</b>" for name in names]
+    if others:
+        return f"{', '.join(bold)} and {others} other{'s' if others > 1 else ''}"
+    if len(bold) == 1:
+        return bold[0]
+    return f"{', '.join(bold[:-1])} and {bold[-1]}"
+
+
+join_aggregator = JoinAggregator()
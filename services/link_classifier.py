@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.settings import chat_settings
+from services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+GLOBAL_CHAT_ID = 0          # link_rules / settings row holding the lists that apply to every chat
+ALLOW, DENY = "allow", "deny"
+DEFAULT_ACTION = DENY       # Links matching no list are forbidden (the filter's original behaviour)
+INDEX_CACHE_SIZE = 5_000    # Compiled per-chat indexes kept in memory
+TELEGRAM_HOSTS = ("t.me", "telegram.me", "telegram.dog")
+
+# Bare "name.tld" without a scheme or path only counts as a link for these TLDs,
+# so "file.txt" or "v1.2" are not links while "spam.xyz" is.
+COMMON_TLDS = frozenset("""
+    com net org info biz io co me ru su ua by kz in pk bd uk us de fr it es nl pl tr ir br ar mx
+    cn jp kr vn id th ph my sg au nz ca xyz top site online live club shop store app dev link
+    click pro vip win bet cc tk ml ga cf gq ly gg to tv fm ai so sh ws la am
+""".split())
+# Common TLDs that are also everyday words: "ok.so what", "there.me too", "name.my name" are a missing
+# space, not a link. Bare hosts on these need a scheme or path (or Telegram's own url entity).
+AMBIGUOUS_TLDS = frozenset("am by in it me my so to us id ai top win pro live link club shop site store app".split())
+
+SQL_RULES = "SELECT domain, action FROM link_rules WHERE chat_id = ?"
+SQL_ADD = """
+    INSERT INTO link_rules (chat_id, domain, action) VALUES (?, ?, ?)
+    ON CONFLICT (chat_id, domain) DO UPDATE SET action = excluded.action
+"""
+SQL_REMOVE = "DELETE FROM link_rules WHERE chat_id = ? AND domain = ?"
+
+# One pass over the text: optional scheme (userinfo only after one), a dotted host, optional port and path.
+# A host glued to a word or "@" ("bob@gmail.com") is not the start of a link.
+_url_re = re.compile(
+    r"(?<![\w@.-])(?:(?P<scheme>(?:https?|ftp)://)(?:[^\s/@:]+(?::[^\s/@]*)?@)?)?"
+    r"(?P<host>(?:[^\W_](?:[\w-]{0,61}[^\W_])?\.)+(?P<tld>[^\W\d_]{2,63}|xn--[\w-]+))\.?"
+    r"(?::\d{1,5})?(?P<path>/[^\s]*)?",
+    re.IGNORECASE,
+)
+PATTERN_VERSION = f"{_url_re.pattern}|{' '.join(sorted(COMMON_TLDS))}|{' '.join(sorted(AMBIGUOUS_TLDS))}"
+
+
+def normalize_host(host: str, path: str = "") -> Optional[str]:
+    """Lowercase IDNA host without 'www.'; t.me/name becomes name.t.me so channels are plain suffixes."""
+    host = host.strip('.').lower()
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    if host.startswith('www.'):
+        host = host[4:]
+    if host in TELEGRAM_HOSTS and path:
+        name = path.lstrip('/').split('/', 1)[0].split('?', 1)[0].lower()
+        if name and name != 'joinchat' and not name.startswith('+'):
+            host = f"{name}.{host}"
+    return host or None
+
+
+def extract_hosts(text: str, entity_urls: Iterable[str] = ()) -> List[str]:
+    """Normalized hosts of every link in the text and in the message's url/text_link entities."""
+    hosts = []
+    for i, source in enumerate((text, *entity_urls)):
+        for match in _url_re.finditer(source):
+            scheme, path, tld = match.group('scheme'), match.group('path'), match.group('tld').lower()
+            if not scheme and not path and not i and (tld not in COMMON_TLDS or tld in AMBIGUOUS_TLDS):
+                continue  # "file.txt", "e.g.", "ok.so": not a link unless Telegram itself marked it as one
+            host = normalize_host(match.group('host'), path or "")
+            if host:
+                hosts.append(host)
+    return hosts
+
+
+class DomainIndex:
+    """
+    Suffix trie over reversed host labels: 'ads.example.com' is com -> example -> ads.
+    A lookup walks the host's labels right to left once, so its cost depends on
+    the host's depth, not on how many domains are listed; the deepest rule wins.
+    """
+    __slots__ = ('root', 'size')
+
+    def __init__(self, rules: Iterable[Tuple[str, str]] = ()):
+        self.root: Dict[str, dict] = {}
+        self.size = 0
+        for domain, action in rules:
+            self.add(domain, action)
+
+    def add(self, domain: str, action: str) -> None:
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[''] = action  # '' can never be a label, so it marks the end of a rule
+        self.size += 1
+
+    def lookup(self, host: str) -> Optional[str]:
+        node, action = self.root, None
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            action = node.get('', action)
+        return action
+
+
+EMPTY_INDEX = DomainIndex()
+
+
+class LinkPolicy:
+    """The global and (if any) per-chat index that decide links for one chat."""
+    __slots__ = ('global_index', 'chat_index', 'version')
+
+    def __init__(self, global_index: DomainIndex, chat_index: Optional[DomainIndex], version: str):
+        self.global_index = global_index
+        self.chat_index = chat_index
+        self.version = version  # Part of the verdict cache key
+
+    def action(self, host: str) -> str:
+        """Chat lists override global ones; unlisted hosts get DEFAULT_ACTION."""
+        if self.chat_index is not None:
+            action = self.chat_index.lookup(host)
+            if action is not None:
+                return action
+        return self.global_index.lookup(host) or DEFAULT_ACTION
+
+    def forbidden(self, hosts: Iterable[str]) -> bool:
+        return any(self.action(host) == DENY for host in hosts)
+
+
+class LinkClassifier:
+    """
+    Per-chat link allow/deny lists, compiled once into DomainIndex tries.
+
+    Rules live in the SQLite `link_rules` table (chat 0 holds the global lists).
+    Each change stamps a new `link_version` into the chat's settings row, which
+    invalidates the settings cache on every instance; a compiled index is reused
+    until the version it was built for changes.
+    """
+
+    def __init__(self, size: int = INDEX_CACHE_SIZE):
+        self.size = size
+        self.storage: Optional[Storage] = None
+        self._indexes: "OrderedDict[int, Tuple[int, DomainIndex]]" = OrderedDict()
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+
+    def setup(self, storage: Storage) -> None:
+        self.storage = storage
+
+    async def policy(self, chat_id: int) -> LinkPolicy:
+        global_version = (await chat_settings.get(GLOBAL_CHAT_ID)).link_version
+        chat_version = (await chat_settings.get(chat_id)).link_version if chat_id != GLOBAL_CHAT_ID else 0
+        global_index = await self._index(GLOBAL_CHAT_ID, global_version)
+        if not chat_version:
+            # No chat rules: every such chat shares one verdict cache entry per payload
+            return LinkPolicy(global_index, None, f"g{global_version}")
+        chat_index = await self._index(chat_id, chat_version)
+        return LinkPolicy(global_index, chat_index, f"g{global_version}:c{chat_id}:{chat_version}")
+
+    async def _index(self, chat_id: int, version: int) -> DomainIndex:
+        cached = self._indexes.get(chat_id)
+        if cached is not None and cached[0] == version:
+            self._indexes.move_to_end(chat_id)
+            return cached[1]
+        if not version:
+            return EMPTY_INDEX  # Never had rules
+
+        key = (chat_id, version)
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = asyncio.ensure_future(self._build(chat_id, version))
+            self._loading[key] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(loading)
+
+    async def _build(self, chat_id: int, version: int) -> DomainIndex:
+        rules = await self.storage.read(lambda conn: conn.execute(SQL_RULES, (chat_id,)).fetchall())
+        index = DomainIndex(rules)
+        self._indexes[chat_id] = (version, index)
+        self._indexes.move_to_end(chat_id)
+        if len(self._indexes) > self.size:
+            self._indexes.popitem(last=False)
+        return index
+
+    # --- RULE MANAGEMENT ---
+    async def set_rule(self, chat_id: int, domain: str, action: str) -> None:
+        await self.storage.write(lambda conn: conn.execute(SQL_ADD, (chat_id, domain, action)))
+        await self._bump(chat_id)
+
+    async def remove_rule(self, chat_id: int, domain: str) -> bool:
+        removed = await self.storage.write(lambda conn: conn.execute(SQL_REMOVE, (chat_id, domain)).rowcount)
+        if removed:
+            await self._bump(chat_id)
+        return bool(removed)
+
+    async def rules(self, chat_id: int) -> List[Tuple[str, str]]:
+        return await self.storage.read(lambda conn: conn.execute(SQL_RULES, (chat_id,)).fetchall())
+
+    async def _bump(self, chat_id: int) -> None:
+        await chat_settings.update(chat_id, link_version=time.time_ns() // 1000)
+
+
+def parse_domain(value: str) -> Optional[str]:
+    """Normalizes a domain (or URL, or t.me/channel) typed by an admin; None if it is not one."""
+    match = _url_re.fullmatch(value.strip())
+    if match is None:
+        return None
+    return normalize_host(match.group('host'), match.group('path') or "")
+
+
+link_classifier = LinkClassifier()
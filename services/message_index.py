@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from services.redis_batch import command, run
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+RING_SIZE = 1000     # Recent messages remembered per chat
+MAX_CHATS = 2_000    # Chats tracked in process (without Redis); the least recently active are dropped first
+MAX_AGE = 48 * 3600  # Telegram only lets bots delete messages younger than 48h
+REDIS_KEY = "msgs:{chat_id}"  # Zset of "message_id:user_id:timestamp" scored by message id, capped at RING_SIZE
+FLUSH_INTERVAL = 1.0          # Seconds between batched writes to Redis
+FLUSH_CHATS = 500             # Chats per pipeline
+MAX_PENDING = 100_000         # Records queued while Redis is down; newer ones are dropped beyond this
+
+
+class _Ring:
+    """The last RING_SIZE (message_id, user_id, timestamp) of one chat, as parallel arrays."""
+    __slots__ = ('message_ids', 'user_ids', 'stamps', 'head')
+
+    def __init__(self):
+        # The arrays grow with the chat up to RING_SIZE, so quiet chats stay small
+        self.message_ids = array('q')
+        self.user_ids = array('q')
+        self.stamps = array('d')
+        self.head = 0  # Slot of the oldest message once the ring is full
+
+    def add(self, message_id: int, user_id: int, stamp: float) -> None:
+        if len(self.message_ids) < RING_SIZE:
+            self.message_ids.append(message_id)
+            self.user_ids.append(user_id)
+            self.stamps.append(stamp)
+            return
+        head = self.head
+        self.message_ids[head] = message_id
+        self.user_ids[head] = user_id
+        self.stamps[head] = stamp
+        self.head = (head + 1) % RING_SIZE
+
+    def newest_first(self):
+        """Slots from the newest message back to the oldest."""
+        size = len(self.message_ids)
+        for back in range(1, size + 1):
+            yield (self.head - back) % size
+
+
+class MessageIndex:
+    """
+    Recent message ids per chat, so bulk cleanup does not need one call per message.
+
+    Every group message is recorded in a ring of RING_SIZE entries per chat.
+    With Redis, records are also queued and added every FLUSH_INTERVAL to a
+    capped sorted set per chat (one pipeline for all chats), scored by message
+    id so that processes flushing at different times still agree on the order;
+    it expires with the last message Telegram would still let us delete.
+    /purge and ban cleanup read that set, so they see messages handled by any
+    process (webhook, polling or stream workers) and survive restarts. Without
+    Redis, or when it fails, they fall back to this process's rings.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self._chats: "OrderedDict[int, _Ring]" = OrderedDict()
+        self._pending: List[Tuple[int, str]] = []  # (chat_id, entry) not yet in Redis, oldest first
+        self._task: Optional[asyncio.Task] = None
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+
+    def record(self, chat_id: int, message_id: int, user_id: int, stamp: Optional[float] = None) -> None:
+        stamp = stamp if stamp is not None else time.time()
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            ring = self._chats[chat_id] = _Ring()
+            if len(self._chats) > MAX_CHATS:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(chat_id)
+        ring.add(message_id, user_id, stamp)
+        if self.redis is not None and len(self._pending) < MAX_PENDING:
+            self._pending.append((chat_id, f"{message_id}:{user_id}:{int(stamp)}"))
+
+    async def recent(self, chat_id: int, count: int) -> List[int]:
+        """Ids of the chat's last `count` messages still young enough to delete, newest first."""
+        shared = await self._shared(chat_id, count)
+        if shared is not None:
+            cutoff = time.time() - MAX_AGE
+            return [message_id for message_id, _, stamp in shared if stamp >= cutoff]
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            return []
+        cutoff = time.time() - MAX_AGE
+        ids = []
+        for slot in ring.newest_first():
+            if len(ids) >= count or ring.stamps[slot] < cutoff:
+                break
+            ids.append(ring.message_ids[slot])
+        return ids
+
+    async def by_user(self, chat_id: int, user_id: int, since: float) -> List[int]:
+        """Ids of the messages `user_id` sent in the chat after `since` (a timestamp), newest first."""
+        since = max(since, time.time() - MAX_AGE)
+        shared = await self._shared(chat_id, RING_SIZE)
+        if shared is not None:
+            return [message_id for message_id, sender, stamp in shared if sender == user_id and stamp >= since]
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            return []
+        ids = []
+        for slot in ring.newest_first():
+            if ring.stamps[slot] < since:
+                break
+            if ring.user_ids[slot] == user_id:
+                ids.append(ring.message_ids[slot])
+        return ids
+
+
+    async def _shared(self, chat_id: int, count: int) -> Optional[List[Tuple[int, int, int]]]:
+        """The chat's newest `count` records from Redis, or None without Redis or if it fails."""
+        if self.redis is None:
+            return None
+        try:
+            await self.flush()  # Include what this process recorded since the last flush
+            entries, = await run(self.redis, command('ZREVRANGE', REDIS_KEY.format(chat_id=chat_id), 0, count - 1))
+        except Exception as e:
+            logger.warning(f"Shared message index unavailable for {chat_id}, using this process's: {e}")
+            return None
+        records = []
+        for entry in entries:
+            message_id, user_id, stamp = entry.split(':')
+            records.append((int(message_id), int(user_id), int(stamp)))
+        return records
+
+    # --- FLUSHING ---
+    async def start(self) -> None:
+        if self.redis is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.redis is not None:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Message index flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Adds queued records to the chats' Redis sets. Returns how many were written."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        by_chat: Dict[int, List[str]] = defaultdict(list)
+        for chat_id, entry in pending:
+            by_chat[chat_id].append(entry)  # Arrival order, so the newest RING_SIZE are at the end
+        chats = list(by_chat.items())
+        written = 0
+        try:
+            for start in range(0, len(chats), FLUSH_CHATS):
+                cmds = []
+                for chat_id, entries in chats[start:start + FLUSH_CHATS]:
+                    key = REDIS_KEY.format(chat_id=chat_id)
+                    scored = [part for entry in entries[-RING_SIZE:] for part in (entry.split(':', 1)[0], entry)]
+                    cmds += [command('ZADD', key, *scored), command('ZREMRANGEBYRANK', key, 0, -RING_SIZE - 1),
+                             command('EXPIRE', key, MAX_AGE)]
+                await run(self.redis, *cmds)
+                written = start + FLUSH_CHATS
+        except Exception:
+            # Keep what was not written for the next flush, ahead of anything recorded since
+            self._pending[:0] = [(chat_id, entry) for chat_id, entries in chats[written:] for entry in entries]
+            raise
+        return len(pending)
+
+
+message_index = MessageIndex()
@@ -0,0 +1,256 @@
+"""
+Minimal Prometheus instrumentation, cheap enough to leave on in production.
+
+Label values are resolved once into preallocated children (`labels(...)` is
+called at setup time or cached by the caller), so the hot path is a bisect and
+two additions with no allocation. The registry renders the text exposition
+format for the /metrics route.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+            cumulative += count
+            le = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]) -> None:
+        """Async callback run at scrape time to refresh gauges that need I/O or live state."""
+        self.collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                await collector()
+            except Exception:
+                pass
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- METRICS ---
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "guardian_handler_seconds", "Time spent in each handler.", ("handler",)))
+UPDATES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "guardian_updates_in_flight", "Updates received and not yet finished (update queue depth)."))
+BOT_API_SECONDS = REGISTRY.register(Histogram(
+    "guardian_bot_api_seconds", "Bot API call latency by method and outcome.", ("method", "outcome")))
+BOT_API_CALLS_PER_UPDATE = REGISTRY.register(Histogram(
+    "guardian_bot_api_calls_per_update", "Bot API calls made while handling one update.", buckets=COUNT_BUCKETS))
+OUTBOUND_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "guardian_outbound_queue_depth", "Bot API calls waiting for a rate-limit token."))
+OUTBOUND_DROPPED = REGISTRY.register(Gauge(
+    "guardian_outbound_dropped", "Low-priority Bot API calls dropped since start."))
+REDIS_SECONDS = REGISTRY.register(Histogram(
+    "guardian_redis_seconds", "Redis command latency by command.", ("command",)))
+REDIS_CALLS_PER_UPDATE = REGISTRY.register(Histogram(
+    "guardian_redis_calls_per_update", "Redis round trips made while handling one update.", buckets=COUNT_BUCKETS))
+SQLITE_SECONDS = REGISTRY.register(Histogram(
+    "guardian_sqlite_seconds", "SQLite time on the storage thread.", ("op",)))
+SQLITE_BATCH_SIZE = REGISTRY.register(Histogram(
+    "guardian_sqlite_commit_batch_size", "Writes per group commit.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 512)))
+PENDING_DELETIONS = REGISTRY.register(Gauge(
+    "guardian_pending_deletions", "Scheduled message deletions not yet performed."))
+VERDICT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "guardian_verdict_cache_lookups_total", "Content verdict cache lookups by tier and result.", ("tier", "result")))
+FLOOD_CHECKS = REGISTRY.register(Counter(
+    "guardian_flood_checks_total", "Flood checks by the tier that decided them (local, redis, fallback).", ("tier",)))
+FLOOD_TRACKED_USERS = REGISTRY.register(Gauge(
+    "guardian_flood_tracked_users", "(chat, user) windows held by the local flood limiter."))
+FLOOD_LIMITER_BYTES = REGISTRY.register(Gauge(
+    "guardian_flood_limiter_bytes", "Approximate memory of the local flood limiter windows."))
+UPDATE_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "guardian_update_queue_seconds", "Time an update waited for its chat and a global slot before handling."))
+UPDATE_BACKLOG = REGISTRY.register(Gauge(
+    "guardian_update_backlog", "Updates received and waiting for the update scheduler."))
+UPDATES_SHED = REGISTRY.register(Counter(
+    "guardian_updates_shed_total", "Cosmetic work skipped under backlog, by kind.", ("kind",)))
+SPAM_SCORE_BATCH_SIZE = REGISTRY.register(Histogram(
+    "guardian_spam_score_batch_size", "Messages scored together by the spam model.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+AUDIT_LOG_PENDING = REGISTRY.register(Gauge(
+    "guardian_audit_log_pending", "Moderation log entries queued and not yet written to SQLite."))
+
+
+# --- PER-UPDATE CALL COUNTING ---
+class UpdateCalls:
+    __slots__ = ('api', 'redis')
+
+    def __init__(self):
+        self.api = 0
+        self.redis = 0
+
+
+current_update: ContextVar[Optional[UpdateCalls]] = ContextVar("current_update", default=None)
+
+
+class InstrumentedRedis(Redis):
+    """Redis client that times every command (pipelines count as one round trip)."""
+
+    _command_children: Dict[str, _HistogramChild] = {}
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _observe_redis(str(args[0]), time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def _observe_redis(command: str, seconds: float) -> None:
+    child = InstrumentedRedis._command_children.get(command)
+    if child is None:
+        child = InstrumentedRedis._command_children[command] = REDIS_SECONDS.labels(command.upper())
+    child.observe(seconds)
+    calls = current_update.get()
+    if calls is not None:
+        calls.redis += 1
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            _observe_redis("PIPELINE", time.perf_counter() - start)
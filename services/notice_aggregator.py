@@ -0,0 +1,133 @@
+import asyncio
+import html
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from services.deletion_scheduler import deletion_scheduler
+from services.outbound import low_priority
+from services.update_scheduler import update_scheduler, Shed
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+NOTICE_WINDOW = 2.0         # Seconds of violations gathered before the summary is sent or edited
+SUMMARY_LIFETIME = 15       # Seconds the summary stays up after its last update
+EDIT_MARGIN = 3             # Stop editing a summary this close to its deletion (and start a new one)
+MAX_LINES = 10              # Distinct user/action lines shown; the rest are counted
+MAX_TRACKED_CHATS = 10_000  # Per-chat summaries kept in memory (least recently used are dropped)
+
+
+class ChatNotices:
+    """The rolling summary of one chat: its lines and the message showing them."""
+    __slots__ = ('lines', 'overflow', 'message_id', 'expires_at', 'flush_handle')
+
+    def __init__(self):
+        self.lines: Dict[Tuple[int, str], List] = {}  # (user_id, action) -> [name, count]
+        self.overflow = 0
+        self.message_id: Optional[int] = None
+        self.expires_at = 0.0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+
+class NoticeAggregator:
+    """
+    One rolling moderation summary per chat instead of a notice per violation.
+
+    Callers perform the enforcement (delete, restrict, kick) themselves and then
+    report it here. Reports within NOTICE_WINDOW are rendered together; while the
+    previous summary is still visible it is edited in place, so a spam wave costs
+    one send plus an edit every NOTICE_WINDOW rather than one message per spammer.
+    Summaries are sent at low priority and deleted SUMMARY_LIFETIME after their
+    last update.
+    """
+
+    def __init__(self):
+        self._chats: "OrderedDict[int, ChatNotices]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def stop(self) -> None:
+        for notices in self._chats.values():
+            if notices.flush_handle is not None:
+                notices.flush_handle.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    def report(self, bot: Bot, chat_id: int, user_id: int, name: str, action: str) -> None:
+        """Adds "<name>: <action>" to the chat's next summary."""
+        if update_scheduler.shedding(Shed.NOTICE):
+            return
+        notices = self._chats.get(chat_id)
+        if notices is None:
+            notices = self._chats[chat_id] = ChatNotices()
+            if len(self._chats) > MAX_TRACKED_CHATS:
+                _, evicted = self._chats.popitem(last=False)
+                if evicted.flush_handle is not None:
+                    evicted.flush_handle.cancel()
+        else:
+            self._chats.move_to_end(chat_id)
+
+        # A summary that is gone (or about to be) starts over with a new message
+        if notices.message_id is not None and time.monotonic() >= notices.expires_at:
+            notices.lines, notices.overflow, notices.message_id = {}, 0, None
+
+        line = notices.lines.get((user_id, action))
+        if line is not None:
+            line[1] += 1
+        elif len(notices.lines) < MAX_LINES:
+            notices.lines[(user_id, action)] = [name, 1]
+        else:
+            notices.overflow += 1
+
+        if notices.flush_handle is None:
+            notices.flush_handle = asyncio.get_running_loop().call_later(
+                NOTICE_WINDOW, self._spawn_flush, bot, chat_id
+            )
+
+    def _spawn_flush(self, bot: Bot, chat_id: int) -> None:
+        task = asyncio.create_task(self._flush(bot, chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, bot: Bot, chat_id: int) -> None:
+        notices = self._chats.get(chat_id)
+        if notices is None:
+            return
+        notices.flush_handle = None
+        text = render_summary(notices)
+
+        try:
+            with low_priority():
+                if notices.message_id is not None:
+                    try:
+                        await bot.edit_message_text(text, chat_id=chat_id, message_id=notices.message_id,
+                                                    parse_mode="HTML")
+                    except TelegramBadRequest as e:
+                        if "not modified" not in e.message:
+                            notices.message_id = None  # Deleted by an admin; send a fresh one
+                if notices.message_id is None:
+                    sent = await bot.send_message(chat_id, text, parse_mode="HTML")
+                    notices.message_id = sent.message_id
+            notices.expires_at = time.monotonic() + SUMMARY_LIFETIME - EDIT_MARGIN
+            # Rescheduling the same message moves its deletion back
+            await deletion_scheduler.schedule(chat_id, notices.message_id, SUMMARY_LIFETIME)
+        except Exception as e:
+            # Dropped under load or failed: the lines stay and go out with the next report
+            logger.debug(f"Moderation summary for {chat_id} not sent: {e}")
+
+
+def render_summary(notices: ChatNotices) -> str:
+    lines = ["🛡 <b>Moderation</b>"]
+    for (_, action), (name, count) in notices.lines.items():
+        times = f" ×{count}" if count > 1 else ""
+        lines.append(f"• <b>{html.escape(name)}</b>: {action}{times}")
+    if notices.overflow:
+        lines.append(f"… and {notices.overflow} more")
+    return "\n".join(lines)
+
+
+notice_aggregator = NoticeAggregator()
@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.methods import (
+    BanChatMember, BanChatSenderChat, CopyMessage, DeleteMessage, DeleteMessages, EditMessageCaption,
+    EditMessageText, ForwardMessage, RestrictChatMember, SendAnimation, SendDocument, SendMessage,
+    SendPhoto, SendSticker, SendVideo, TelegramMethod, UnbanChatMember,
+)
+
+from services.update_scheduler import yield_turn
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+GLOBAL_RATE = 30.0      # Requests per second across all chats (Telegram: ~30 msg/s)
+GLOBAL_BURST = 30
+CHAT_RATE = 20 / 60     # Messages per second into one group (Telegram: 20 msg/min)
+CHAT_BURST = 5
+LOW_DROP_DEPTH = 50     # Queue depth at which low-priority requests are dropped
+MAX_RETRIES = 3         # Attempts after a retry_after before giving up
+
+
+class Priority(IntEnum):
+    ENFORCEMENT = 0  # Deletes, restrictions, bans
+    NORMAL = 1       # Command replies and everything not marked otherwise
+    LOW = 2          # Cosmetic notices and welcomes; dropped under pressure
+
+
+ENFORCEMENT_METHODS = (
+    DeleteMessage, DeleteMessages, RestrictChatMember, BanChatMember, UnbanChatMember, BanChatSenderChat,
+)
+# Methods that post into a chat and count toward Telegram's per-group limit
+CHAT_LIMITED_METHODS = (
+    SendMessage, SendPhoto, SendVideo, SendAnimation, SendDocument, SendSticker, CopyMessage, ForwardMessage,
+    EditMessageText, EditMessageCaption,
+)
+
+_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def low_priority():
+    """Marks Bot API calls made inside the block as cosmetic (droppable)."""
+    token = _priority.set(Priority.LOW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundDropped(TelegramAPIError):
+    """Raised instead of sending a low-priority request when the queue is too deep."""
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Empties the bucket so nothing passes for `seconds` (honors retry_after)."""
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'chat_id', 'method', 'future')
+
+    def __init__(self, priority: Priority, seq: int, chat_id: Optional[int], method: TelegramMethod,
+                 future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.future = future
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Bot session middleware that paces every Bot API call.
+
+    Calls pass through a global token bucket, and messages into a group also
+    through that group's bucket. When tokens run out, callers queue by priority:
+    enforcement first, cosmetic notices last. Low-priority calls are dropped once
+    the queue is LOW_DROP_DEPTH deep. A retry_after from Telegram pauses the
+    bucket of the call's chat (the global one only for calls without a chat)
+    and the call is retried instead of being lost.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self.dropped = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        if isinstance(method, ENFORCEMENT_METHODS):
+            priority = Priority.ENFORCEMENT
+        else:
+            priority = _priority.get()
+        target_chat = getattr(method, 'chat_id', None)
+        if not isinstance(target_chat, int):
+            target_chat = None
+        chat_id = target_chat if isinstance(method, CHAT_LIMITED_METHODS) else None
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(method, priority, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if target_chat is not None:
+                    # Flood control of one chat: only that chat waits, and the retry goes through its bucket
+                    self._chat_bucket(target_chat).pause(e.retry_after)
+                    chat_id = target_chat
+                else:
+                    self.global_bucket.pause(e.retry_after)
+                logger.warning(f"Telegram asked to retry {type(method).__name__} after {e.retry_after}s "
+                               f"(attempt {attempt + 1}/{MAX_RETRIES + 1}).")
+                if attempt == MAX_RETRIES:
+                    raise
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    # --- TOKEN ACQUISITION ---
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self._prune_chat_buckets()
+            bucket = self.chat_buckets[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+        return bucket
+
+    def _prune_chat_buckets(self) -> None:
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.is_full(now)]:
+            del self.chat_buckets[chat_id]
+
+    async def _acquire(self, method: TelegramMethod, priority: Priority, chat_id: Optional[int]) -> None:
+        # Fast path: nobody is waiting and both buckets have a token
+        if not self._queue and self._try_take(chat_id, time.monotonic()) == 0:
+            return
+
+        if len(self._queue) >= LOW_DROP_DEPTH:
+            if priority == Priority.LOW:
+                self.dropped += 1
+                raise OutboundDropped(method, "Dropped: outbound queue is too deep")
+            self._evict_low()
+
+        waiter = _Waiter(priority, next(self._seq), chat_id, method, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self._changed.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        if priority != Priority.ENFORCEMENT:
+            yield_turn()  # A reply waiting on a rate limit must not hold back the chat's next update
+        await waiter.future
+
+    def _try_take(self, chat_id: Optional[int], now: float) -> float:
+        """Takes tokens if possible; otherwise returns how long to wait."""
+        wait = self.global_bucket.wait_time(now)
+        if wait:
+            return wait
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            wait = bucket.wait_time(now)
+            if wait:
+                return wait
+            bucket.take()
+        self.global_bucket.take()
+        return 0.0
+
+    def _evict_low(self) -> None:
+        low = [w for w in self._queue if w.priority == Priority.LOW]
+        if low:
+            victim = max(low)  # Newest cosmetic request goes first
+            self._queue.remove(victim)
+            heapq.heapify(self._queue)
+            self.dropped += 1
+            victim.future.set_exception(OutboundDropped(victim.method, "Dropped: outbound queue is too deep"))
+
+    async def _pump(self) -> None:
+        """Hands out tokens to queued callers in priority order."""
+        while self._queue:
+            self._changed.clear()
+            now = time.monotonic()
+            next_wake = None
+            for waiter in sorted(self._queue):
+                wait = self._try_take(waiter.chat_id, now)
+                if wait == 0:
+                    self._queue.remove(waiter)
+                    if not waiter.future.done():
+                        waiter.future.set_result(None)
+                    continue
+                next_wake = wait if next_wake is None else min(next_wake, wait)
+                if self.global_bucket.wait_time(now):
+                    break  # Global limit reached; a group bucket does not block other groups
+            heapq.heapify(self._queue)
+
+            if self._queue:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=next_wake)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,179 @@
+import logging
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.exceptions import NoScriptError, ResponseError
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+# One Redis command: the raw arguments, plus the Script object for EVALSHA (to reload after NOSCRIPT)
+Command = Tuple[tuple, Any]
+
+
+def command(*args) -> Command:
+    return args, None
+
+
+def script_command(script, keys: List, args: List) -> Command:
+    """EVALSHA of a registered script. Queued directly, so the pipeline skips redis-py's SCRIPT EXISTS check."""
+    return ('EVALSHA', script.sha, len(keys), *keys, *args), script
+
+
+class RedisBatch:
+    """
+    The Redis traffic of one update, sent in as few round trips as possible.
+
+    Before the handlers run, the middleware queues the reads it can predict
+    (FSM state, the sender's reputation, known-bad media) with `prefetch`;
+    they go out in one pipeline and services find the answers with `result`
+    or receive them in a callback.
+    Best-effort writes whose reply nobody waits for are queued with `defer`
+    and ride along with the next read the update makes, or go out in one
+    pipeline when the update finishes.
+    """
+    __slots__ = ('redis', 'open', '_reads', '_writes', '_values')
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.open = True
+        self._reads: List[Tuple[Any, Command, Optional[Callable[[Any], None]]]] = []
+        self._writes: List[Tuple[Command, Optional[Callable[[Exception], None]]]] = []
+        self._values: Dict[Any, Any] = {}
+
+    def prefetch(self, key, cmd: Command, on_result: Optional[Callable[[Any], None]] = None) -> None:
+        """Queues a read; its reply (or exception) is kept under `key` and passed to `on_result`."""
+        self._reads.append((key, cmd, on_result))
+
+    def result(self, key, default=MISSING):
+        """A prefetched reply (an exception if that command failed), or `default` if it was not prefetched."""
+        return self._values.get(key, default)
+
+    def defer(self, cmd: Command, on_error: Optional[Callable[[Exception], None]] = None) -> None:
+        self._writes.append((cmd, on_error))
+
+    async def execute(self, *cmds: Command) -> list:
+        """Runs the queued reads and writes together with `cmds` in one pipeline; returns the replies to `cmds`."""
+        reads, self._reads = self._reads, []
+        writes, self._writes = self._writes, []
+        queued = [cmd for _, cmd, _ in reads] + [cmd for cmd, _ in writes] + list(cmds)
+        if not queued:
+            return []
+        try:
+            replies = await _pipeline(self.redis, queued)
+        except Exception as e:
+            replies = [e] * len(queued)
+
+        for (key, _, on_result), reply in zip(reads, replies):
+            self._values[key] = reply
+            if on_result is not None:
+                on_result(reply)
+        failed = [(cmd, on_error, reply) for (cmd, on_error), reply in zip(writes, replies[len(reads):])
+                  if isinstance(reply, Exception)]
+        if failed:
+            logger.warning(f"{len(failed)} deferred Redis writes failed, first {failed[0][0][0][0]}: {failed[0][2]}")
+            for _, on_error, reply in failed:
+                if on_error is not None:
+                    on_error(reply)
+        own = replies[len(reads) + len(writes):]
+        for reply in own:
+            if isinstance(reply, Exception):
+                raise reply
+        return own
+
+    async def close(self) -> None:
+        """Flushes what is still queued; later calls from this update's context go straight to Redis."""
+        self.open = False
+        if self._reads or self._writes:
+            await self.execute()
+
+
+current_batch: ContextVar[Optional[RedisBatch]] = ContextVar("current_batch", default=None)
+
+
+def active_batch() -> Optional[RedisBatch]:
+    batch = current_batch.get()
+    return batch if batch is not None and batch.open else None
+
+
+async def run(redis, *cmds: Command) -> list:
+    """Sends `cmds` now, along with whatever the current update has queued. Returns their replies."""
+    batch = active_batch()
+    if batch is not None:
+        return await batch.execute(*cmds)
+    replies = await _pipeline(redis, list(cmds))
+    for reply in replies:
+        if isinstance(reply, Exception):
+            raise reply
+    return replies
+
+
+async def defer(redis, *cmds: Command, on_error: Optional[Callable[[Exception], None]] = None) -> None:
+    """
+    Queues best-effort writes on the current update, or sends them now outside one.
+    Errors are passed to `on_error` (or logged), never raised.
+    """
+    batch = active_batch()
+    if batch is not None:
+        for cmd in cmds:
+            batch.defer(cmd, on_error)
+        return
+    try:
+        await run(redis, *cmds)
+    except Exception as e:
+        if on_error is not None:
+            on_error(e)
+        else:
+            logger.warning(f"Redis write {cmds[0][0][0]} failed: {e}")
+
+
+async def _pipeline(redis, cmds: List[Command]) -> list:
+    """One round trip (two if a script must be reloaded). Per-command errors are returned, not raised."""
+    if len(cmds) == 1:
+        replies = [await _single(redis, cmds[0][0])]
+    else:
+        async with redis.pipeline(transaction=False) as pipe:
+            for args, _ in cmds:
+                pipe.execute_command(*args)
+            replies = await pipe.execute(raise_on_error=False)
+
+    missing = [i for i, reply in enumerate(replies) if isinstance(reply, NoScriptError)]
+    if missing:
+        # Redis restarted or was flushed: load each script once, then rerun only what never ran
+        for script in {cmds[i][1] for i in missing}:
+            script.sha = await redis.script_load(script.script)
+        retry = await _pipeline(redis, [_with_current_sha(cmds[i]) for i in missing])
+        for i, reply in zip(missing, retry):
+            replies[i] = reply
+    return replies
+
+
+async def _single(redis, args: tuple):
+    try:
+        return await redis.execute_command(*args)
+    except ResponseError as e:  # Like a pipeline: the command failed, the connection is fine
+        return e
+
+
+def _with_current_sha(cmd: Command) -> Command:
+    """The same EVALSHA with the script's sha after a reload."""
+    args, script = cmd
+    return ('EVALSHA', script.sha, *args[2:]), script
+
+
+class BatchedRedisStorage(RedisStorage):
+    """FSM storage whose state read comes from the update's prefetch pipeline when there is one."""
+
+    def state_key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key, "state")
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        batch = active_batch()
+        if batch is not None:
+            value = batch.result(("fsm", self.state_key(key)))
+            if value is not MISSING and not isinstance(value, Exception):
+                return value.decode() if isinstance(value, bytes) else value
+        return await super().get_state(key)
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from services.redis_batch import RedisBatch, command, defer, run, script_command
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Count-min sketch: DEPTH rows of WIDTH saturating 8-bit counters per epoch, stored in
+# SHARD_BYTES strings that Redis allocates on first write. Memory is bounded at
+# DEPTH * WIDTH bytes per epoch (6 MiB) and EPOCHS epochs (24 MiB), whether one thousand
+# or ten million users have violations. See benchmarks/reputation.py for the measured
+# overestimate at one million violators.
+DEPTH = 3
+WIDTH = 1 << 21
+SHARD_BYTES = 1 << 16
+EPOCH_SECONDS = 86400       # One sketch per day...
+EPOCHS = 4                  # ...the last four are read
+DECAY = 0.5                 # Weight of an epoch relative to the next newer one
+KEY = "rep:{epoch}:{shard}"
+
+# Violation weights
+CONTENT_VIOLATION = 1       # Message deleted by the content filter
+FLOOD_VIOLATION = 1         # Muted for flooding
+KICK_VIOLATION = 2          # Kicked at the warning limit
+BAN_VIOLATION = 3           # Banned by an admin
+
+# Scores (decayed violation counts) that change how a user is treated in every chat
+SUSPECT_SCORE = 3           # Halved flood limit, first content violation kicks
+AUTO_RESTRICT_SCORE = 6     # Muted as soon as they join
+
+LOCAL_SIZE = 50_000         # Users whose score is kept in process
+LOCAL_TTL = 60.0            # Seconds a cached score is trusted
+
+# KEYS = the user's DEPTH shard keys for each epoch, newest epoch first.
+# ARGV = the counter offset inside each of those DEPTH shards.
+# Returns the minimum counter of each epoch (the count-min estimate).
+ESTIMATE_LUA = """
+local depth = #ARGV
+local out = {}
+for epoch = 0, #KEYS / depth - 1 do
+    local low = 255
+    for row = 1, depth do
+        local value = redis.call('BITFIELD', KEYS[epoch * depth + row], 'GET', 'u8', '#' .. ARGV[row])[1]
+        if value < low then low = value end
+    end
+    out[epoch + 1] = low
+end
+return out
+"""
+
+
+def counter_indexes(user_id: int) -> List[int]:
+    """The user's counter in each row, as indexes into the epoch's DEPTH * WIDTH counters."""
+    digest = hashlib.blake2b(user_id.to_bytes(8, 'little', signed=True), digest_size=4 * DEPTH).digest()
+    return [row * WIDTH + int.from_bytes(digest[4 * row:4 * row + 4], 'little') % WIDTH for row in range(DEPTH)]
+
+
+def shard_key(epoch: int, index: int) -> str:
+    return KEY.format(epoch=epoch, shard=index // SHARD_BYTES)
+
+
+def current_epoch(now: float = None) -> int:
+    return int((now if now is not None else time.time()) // EPOCH_SECONDS)
+
+
+class Reputation:
+    """
+    Cross-chat violation score per user, in a fixed amount of Redis memory.
+
+    Each day's violations go into a count-min sketch (overestimates, never
+    underestimates). A score is the sum of the last EPOCHS days, each day
+    weighted DECAY times the next, so old offences fade and whole epochs
+    expire on their own. Reads cost one script call (usually part of the
+    update's prefetch pipeline) and are cached locally for LOCAL_TTL; a user's
+    own violations refresh their cached score.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self._script = None
+        self._scores: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()  # user -> (score, expires_at)
+        self._loading: Dict[int, asyncio.Future] = {}  # Prefetched lookups still in flight
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+        self._script = redis.register_script(ESTIMATE_LUA)
+
+    def prefetch(self, batch: RedisBatch, user_id: int) -> None:
+        """
+        Queues the score lookup on the update's prefetch pipeline unless it is cached
+        or already in flight (a flood of one user's messages shares one lookup).
+        """
+        if self.redis is None or user_id in self._loading:
+            return
+        cached = self._scores.get(user_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return
+        loading = self._loading[user_id] = asyncio.get_running_loop().create_future()
+
+        def on_result(counts) -> None:
+            self._loading.pop(user_id, None)
+            if isinstance(counts, Exception):
+                logger.warning(f"Reputation lookup for {user_id} failed: {counts}")
+                loading.set_result(None)
+            else:
+                loading.set_result(self._remember(user_id, self._combine(counts)))
+        batch.prefetch(("reputation", user_id), self._estimate(user_id), on_result)
+
+    async def score(self, user_id: int) -> float:
+        if self.redis is None:
+            return 0.0
+        cached = self._scores.get(user_id)
+        if cached is not None and cached[1] > time.monotonic():
+            self._scores.move_to_end(user_id)
+            return cached[0]
+
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            score = await asyncio.shield(loading)
+            if score is not None:
+                return score
+            return cached[0] if cached is not None else 0.0  # The prefetch failed; Redis is unlikely to answer now
+
+        try:
+            counts, = await run(self.redis, self._estimate(user_id))
+        except Exception as e:
+            logger.warning(f"Reputation lookup for {user_id} failed: {e}")
+            return cached[0] if cached is not None else 0.0
+        return self._remember(user_id, self._combine(counts))
+
+    async def record(self, user_id: int, weight: int) -> None:
+        """Adds a violation of `weight` to today's sketch."""
+        if self.redis is None:
+            return
+        epoch = current_epoch()
+        expires_at = (epoch + EPOCHS) * EPOCH_SECONDS
+        cmds = []
+        for index in counter_indexes(user_id):
+            key = shard_key(epoch, index)
+            cmds.append(command('BITFIELD', key, 'OVERFLOW', 'SAT', 'INCRBY', 'u8', f'#{index % SHARD_BYTES}', weight))
+            cmds.append(command('EXPIREAT', key, expires_at))
+        # Sent with the update's next Redis call or when it finishes; best effort either way
+        await defer(self.redis, *cmds)
+        self._scores.pop(user_id, None)  # Next read sees the new count
+
+    def _estimate(self, user_id: int):
+        epoch = current_epoch()
+        indexes = counter_indexes(user_id)
+        keys = [shard_key(epoch - age, index) for age in range(EPOCHS) for index in indexes]
+        return script_command(self._script, keys, [index % SHARD_BYTES for index in indexes])
+
+    @staticmethod
+    def _combine(counts) -> float:
+        return sum(int(count) * DECAY ** age for age, count in enumerate(counts))
+
+    def _remember(self, user_id: int, score: float) -> float:
+        self._scores[user_id] = (score, time.monotonic() + LOCAL_TTL)
+        self._scores.move_to_end(user_id)
+        if len(self._scores) > LOCAL_SIZE:
+            self._scores.popitem(last=False)
+        return score
+
+
+reputation = Reputation()
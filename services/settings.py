@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# --- DEFAULTS (used when a chat has not changed a setting) ---
+DEFAULT_WELCOME = "👋 Welcome to the group, {user_name}! Please read the rules."
+DEFAULT_FLOOD_LIMIT = 5    # Max messages allowed...
+DEFAULT_FLOOD_PERIOD = 5   # ...within this many seconds
+DEFAULT_WARN_LIMIT = 3     # Warnings before a kick
+DEFAULT_RAID_LIMIT = 30    # Joins per minute that switch a chat into raid mode
+DEFAULT_SPAM_THRESHOLD = 90  # Spam model score (percent) at which a message is removed
+SPAM_OFF = 101               # Stored threshold above any score: the chat turned the model off
+
+# --- CONFIGURATION ---
+CACHE_SIZE = 10_000        # Chats kept in memory (least recently used are evicted)
+INVALIDATE_CHANNEL = "settings:invalidate"
+RESUBSCRIBE_DELAY = 5.0
+
+# Columns added to the original `settings (chat_id, welcome_msg)` table. NULL means "default".
+COLUMNS = {
+    "flood_limit": "INTEGER",
+    "flood_period": "INTEGER",
+    "warn_limit": "INTEGER",
+    "raid_limit": "INTEGER",
+    "link_version": "INTEGER",  # Bumped whenever the chat's link allow/deny rules change
+    "spam_threshold": "INTEGER",
+}
+FIELDS = ("welcome_msg", *COLUMNS)
+
+SQL_GET = f"SELECT {', '.join(FIELDS)} FROM settings WHERE chat_id = ?"
+
+
+class ChatSettings:
+    """Effective settings of one chat (defaults filled in)."""
+    __slots__ = ('welcome_msg', 'flood_limit', 'flood_period', 'warn_limit', 'raid_limit', 'link_version',
+                 'spam_threshold')
+
+    def __init__(self, welcome_msg: Optional[str] = None, flood_limit: Optional[int] = None,
+                 flood_period: Optional[int] = None, warn_limit: Optional[int] = None,
+                 raid_limit: Optional[int] = None, link_version: Optional[int] = None,
+                 spam_threshold: Optional[int] = None):
+        self.welcome_msg = welcome_msg or DEFAULT_WELCOME
+        self.flood_limit = flood_limit or DEFAULT_FLOOD_LIMIT
+        self.flood_period = flood_period or DEFAULT_FLOOD_PERIOD
+        self.warn_limit = warn_limit or DEFAULT_WARN_LIMIT
+        self.raid_limit = raid_limit or DEFAULT_RAID_LIMIT
+        self.link_version = link_version or 0  # 0: the chat never had link rules
+        self.spam_threshold = spam_threshold or DEFAULT_SPAM_THRESHOLD
+
+
+DEFAULT_SETTINGS = ChatSettings()
+
+
+async def migrate(storage: Storage) -> None:
+    """Adds the columns newer than the original table to an existing database."""
+    def _migrate(conn):
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(settings)")}
+        for name, sql_type in COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE settings ADD COLUMN {name} {sql_type}")
+    await storage.write(_migrate)
+
+
+class SettingsCache:
+    """
+    Per-chat settings read through a bounded in-process LRU.
+
+    A cache hit costs no I/O. Misses read the `settings` table once (concurrent
+    misses for one chat share the read). Writes go to SQLite, then every
+    instance drops its copy through a Redis pub/sub message. After a
+    (re)subscribe the whole cache is cleared, because messages published while
+    disconnected are lost.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.redis = None
+        self.storage: Optional[Storage] = None
+        self._cache: "OrderedDict[int, ChatSettings]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._generation = 0  # Bumped on every invalidation so in-flight loads do not cache stale rows
+        self._task: Optional[asyncio.Task] = None
+
+    def setup(self, redis, storage: Storage) -> None:
+        self.redis = redis
+        self.storage = storage
+
+    # --- READS ---
+    async def get(self, chat_id: int) -> ChatSettings:
+        settings = self._cache.get(chat_id)
+        if settings is not None:
+            self._cache.move_to_end(chat_id)
+            return settings
+
+        loading = self._loading.get(chat_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(chat_id))
+            self._loading[chat_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, chat_id: int) -> ChatSettings:
+        generation = self._generation
+        row = await self.storage.read(lambda conn: conn.execute(SQL_GET, (chat_id,)).fetchone())
+        settings = ChatSettings(*row) if row else DEFAULT_SETTINGS
+        if generation == self._generation:
+            self._cache[chat_id] = settings
+            if len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return settings
+
+    # --- WRITES ---
+    async def update(self, chat_id: int, **fields) -> None:
+        """Stores the given fields (None restores the default) and invalidates every instance."""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+        names = list(fields)
+        sql = (
+            f"INSERT INTO settings (chat_id, {', '.join(names)}) VALUES (?{', ?' * len(names)}) "
+            f"ON CONFLICT (chat_id) DO UPDATE SET {', '.join(f'{n} = excluded.{n}' for n in names)}"
+        )
+        await self.storage.write(lambda conn: conn.execute(sql, (chat_id, *fields.values())))
+        await self.invalidate(chat_id)
+
+    async def invalidate(self, chat_id: int) -> None:
+        self._drop(chat_id)
+        if self.redis is not None:
+            try:
+                await self.redis.publish(INVALIDATE_CHANNEL, chat_id)
+            except Exception as e:
+                logger.warning(f"Could not publish settings invalidation for {chat_id}: {e}")
+
+    def _drop(self, chat_id: int) -> None:
+        self._generation += 1
+        self._cache.pop(chat_id, None)
+
+    # --- INVALIDATION LISTENER ---
+    async def start(self) -> None:
+        if self.redis is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                self._generation += 1
+                self._cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._drop(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Settings invalidation listener lost Redis, resubscribing: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                await pubsub.aclose()
+
+
+chat_settings = SettingsCache()
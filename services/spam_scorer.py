@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without NumPy the scorer stays disabled
+    np = None
+
+from services.metrics import SPAM_SCORE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+HASH_BITS = 20            # 2^20 hashed features (4 MiB of float32 weights)
+NGRAM_SIZES = (2, 3, 4)   # Character n-grams over the UTF-8 bytes of the normalized text
+MAX_BYTES = 1024          # Longer texts are scored on their first MAX_BYTES
+MIN_CHARS = 12            # Shorter texts are not scored
+BATCH_WINDOW = 0.003      # Seconds messages are gathered into one scoring batch
+MAX_BATCH = 256           # A batch is scored at once when this many messages are waiting
+
+_FNV_OFFSET = 0x811C9DC5
+_FNV_PRIME = 0x01000193
+
+
+# --- FEATURES ---
+def featurize(texts: Sequence[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Hashed n-grams of a whole batch at once: (feature index, row of the text it came from).
+    The texts are concatenated into one byte buffer and every n-gram size is one
+    FNV-1a pass over all positions; n-grams crossing into the next text are dropped.
+    """
+    encoded = [text.encode()[:MAX_BYTES] for text in texts]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    buf = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    ends = np.cumsum(lengths)
+    row_of = np.repeat(np.arange(len(encoded)), lengths)  # Text of every byte position
+
+    indexes, rows = [], []
+    for n in NGRAM_SIZES:
+        positions = len(buf) - n + 1
+        if positions <= 0:
+            continue
+        h = np.full(positions, _FNV_OFFSET ^ n, dtype=np.uint32)
+        for k in range(n):
+            h ^= buf[k:k + positions]
+            h *= np.uint32(_FNV_PRIME)
+        row = row_of[:positions]
+        inside = np.arange(n, positions + n) <= ends[row]
+        h = h[inside]
+        indexes.append((h ^ (h >> 16)) & np.uint32((1 << HASH_BITS) - 1))
+        rows.append(row[inside])
+    if not indexes:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    return np.concatenate(indexes), np.concatenate(rows)
+
+
+def raw_scores(weights: "np.ndarray", texts: Sequence[str]) -> "np.ndarray":
+    """Sum of the texts' feature weights, scaled by 1/sqrt(feature count) so length does not decide."""
+    indexes, rows = featurize(texts)
+    sums = np.bincount(rows, weights=weights[indexes], minlength=len(texts))
+    counts = np.bincount(rows, minlength=len(texts))
+    return sums / np.sqrt(np.maximum(counts, 1))
+
+
+# --- MODEL ---
+class SpamModel:
+    """
+    Hashed n-gram Naive Bayes: one weight (log spam/ham ratio) per feature,
+    plus a calibration (scale, bias) that turns the summed weights into a probability.
+    """
+
+    def __init__(self, weights: "np.ndarray", scale: float, bias: float):
+        self.weights = weights
+        self.scale = scale
+        self.bias = bias
+
+    def score_batch(self, texts: Sequence[str]) -> "np.ndarray":
+        """Spam probability of every text, in one vectorized pass."""
+        return _sigmoid(self.scale * raw_scores(self.weights, texts) + self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "SpamModel":
+        """Maps the weights read-only (shared page cache, no parse); the sidecar .json holds the rest."""
+        with open(_meta_path(path)) as f:
+            meta = json.load(f)
+        if meta["hash_bits"] != HASH_BITS or tuple(meta["ngram_sizes"]) != NGRAM_SIZES:
+            raise ValueError(f"{path} was trained with other features ({meta['hash_bits']} bits, "
+                             f"n-grams {meta['ngram_sizes']})")
+        weights = np.load(path, mmap_mode='r')
+        if weights.shape != (1 << HASH_BITS,):
+            raise ValueError(f"{path} holds {weights.shape} weights, expected {1 << HASH_BITS}")
+        return cls(weights, meta["scale"], meta["bias"])
+
+    def save(self, path: str, **info) -> None:
+        np.save(path, np.asarray(self.weights, dtype=np.float32))
+        with open(_meta_path(path), "w") as f:
+            json.dump({"hash_bits": HASH_BITS, "ngram_sizes": list(NGRAM_SIZES),
+                       "scale": self.scale, "bias": self.bias, **info}, f, indent=2)
+
+
+def _meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _sigmoid(z: "np.ndarray") -> "np.ndarray":
+    return 0.5 * (1.0 + np.tanh(0.5 * z))  # Same as 1 / (1 + e^-z), without overflow
+
+
+def train(texts: Sequence[str], labels: Sequence[int], calibration: Tuple[Sequence[str], Sequence[int]],
+          alpha: float = 0.5) -> SpamModel:
+    """
+    Naive Bayes weights from (texts, labels), then Platt scaling fitted on the
+    held-out `calibration` texts so scores are probabilities the thresholds mean.
+    Texts must already be normalized the way the bot normalizes them.
+    """
+    size = 1 << HASH_BITS
+    indexes, rows = featurize(texts)
+    is_spam = np.asarray(labels, dtype=bool)[rows]
+    spam = np.bincount(indexes[is_spam], minlength=size) + alpha
+    ham = np.bincount(indexes[~is_spam], minlength=size) + alpha
+    weights = (np.log(spam / spam.sum()) - np.log(ham / ham.sum())).astype(np.float32)
+
+    # Two-parameter logistic regression (Newton's method) on the held-out raw scores, with
+    # Platt's smoothed targets so a cleanly separated calibration set still gives finite odds
+    x = raw_scores(weights, calibration[0])
+    y = np.asarray(calibration[1], dtype=np.float64)
+    positives = y.sum()
+    y = np.where(y > 0, (positives + 1) / (positives + 2), 1 / (len(y) - positives + 2))
+    def loss(scale, bias):
+        z = scale * x + bias
+        return np.sum(np.logaddexp(0.0, z) - y * z)
+
+    scale, bias = 0.0, float(np.log((positives + 1) / (len(y) - positives + 1)))
+    current = loss(scale, bias)
+    for _ in range(100):
+        p = _sigmoid(scale * x + bias)
+        g = np.array([np.dot(p - y, x), np.sum(p - y)])
+        w = p * (1 - p) + 1e-12
+        hessian = np.array([[np.dot(w, x * x), np.dot(w, x)], [np.dot(w, x), np.sum(w)]]) + np.eye(2) * 1e-9
+        step = np.linalg.solve(hessian, g)
+        t = 1.0
+        while t > 1e-10 and loss(scale - t * step[0], bias - t * step[1]) > current:
+            t /= 2  # Backtrack: a full Newton step can overshoot far from the optimum
+        scale, bias = scale - t * step[0], bias - t * step[1]
+        previous, current = current, loss(scale, bias)
+        if previous - current < 1e-9 * max(1.0, current):
+            break
+    return SpamModel(weights, float(scale), float(bias))
+
+
+# --- SCORING SERVICE ---
+class SpamScorer:
+    """
+    Statistical second opinion for messages the keyword rules let through.
+
+    Messages that arrive within BATCH_WINDOW of each other are scored together:
+    one featurize pass and one weighted bincount for the whole batch instead of
+    a Python loop per message. Disabled (every score is None) when NumPy or the
+    model file is missing.
+    """
+
+    def __init__(self):
+        self.model: Optional[SpamModel] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def setup(self, path: str) -> None:
+        if not os.path.exists(path):
+            logger.info(f"Spam scorer disabled: no model at {path}.")
+            return
+        if np is None:
+            logger.warning(f"Spam scorer disabled: {path} exists but NumPy is not installed (pip install numpy).")
+            return
+        try:
+            self.model = SpamModel.load(path)
+            logger.info(f"Spam scorer loaded {path}.")
+        except Exception as e:
+            logger.error(f"Spam scorer disabled: could not load {path}: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    async def score(self, text: str) -> Optional[float]:
+        """Spam probability of normalized `text`, or None if it is not scored."""
+        if self.model is None or len(text.strip()) < MIN_CHARS:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= MAX_BATCH:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        SPAM_SCORE_BATCH_SIZE.observe(len(batch))
+        try:
+            scores = self.model.score_batch([text for text, _ in batch]).tolist()
+        except Exception as e:
+            logger.error(f"Spam scoring failed for a batch of {len(batch)}: {e}")
+            scores = [None] * len(batch)
+        for (_, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(score)
+
+
+spam_scorer = SpamScorer()
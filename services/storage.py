@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from services.metrics import SQLITE_BATCH_SIZE, SQLITE_SECONDS
+
+logger = logging.getLogger(__name__)
+_READ_SECONDS = SQLITE_SECONDS.labels("read")
+_COMMIT_SECONDS = SQLITE_SECONDS.labels("commit")
+
+# --- CONFIGURATION ---
+GROUP_COMMIT_WINDOW = 0.002  # Seconds to gather concurrent writes into one transaction
+GROUP_COMMIT_MAX = 512       # Flush early once this many writes are waiting
+STATEMENT_CACHE = 256        # Prepared statements kept by the connection
+
+Operation = Callable[[sqlite3.Connection], Any]
+
+
+class Storage:
+    """
+    One long-lived SQLite connection (WAL mode) owned by a dedicated thread.
+
+    Reads run directly on that thread. Writes are group-committed: everything
+    that arrives within GROUP_COMMIT_WINDOW shares one transaction (and one
+    fsync), with a savepoint per write so a failing write only fails its caller.
+    Statements are plain SQL constants, so sqlite3's statement cache keeps them prepared.
+    """
+
+    def __init__(self, path: str, schema: str = ""):
+        self.path = path
+        self.schema = schema
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._opening: Optional[asyncio.Future] = None
+        self._pending: List[Tuple[Operation, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    # --- LIFECYCLE ---
+    async def open(self) -> None:
+        if self._conn is not None:
+            return
+        if self._opening is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+            self._opening = asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+        await asyncio.shield(self._opening)
+
+    def _connect(self) -> None:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,  # Transactions are managed explicitly
+            cached_statements=STATEMENT_CACHE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        if self.schema:
+            conn.executescript(self.schema)
+        self._conn = conn
+        logger.info(f"SQLite storage opened at {self.path} (WAL).")
+
+    async def close(self) -> None:
+        if self._conn is None:
+            return
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()  # Must not fire once the thread is gone; flushed here instead
+            self._flush_handle = None
+        if self._pending:
+            await self._flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._conn.close)
+        self._executor.shutdown(wait=True)
+        self._conn = None
+        self._opening = None
+
+    # --- OPERATIONS ---
+    async def read(self, op: Operation) -> Any:
+        """Runs `op(connection)` on the storage thread outside any write transaction."""
+        await self.open()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed_read, op)
+
+    def _timed_read(self, op: Operation) -> Any:
+        start = time.perf_counter()
+        try:
+            return op(self._conn)
+        finally:
+            _READ_SECONDS.observe(time.perf_counter() - start)
+
+    async def write(self, op: Operation) -> Any:
+        """Queues `op(connection)` for the next group commit and returns its result."""
+        await self.open()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((op, future))
+
+        if len(self._pending) >= GROUP_COMMIT_MAX:
+            self._schedule_flush(now=True)
+        elif self._flush_handle is None:
+            self._schedule_flush()
+        return await future
+
+    def _schedule_flush(self, now: bool = False) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        delay = 0 if now else GROUP_COMMIT_WINDOW
+        self._flush_handle = loop.call_later(delay, lambda: asyncio.ensure_future(self._flush()))
+
+    async def _flush(self) -> None:
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self._commit_batch, [op for op, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _commit_batch(self, ops: List[Operation]) -> List[Any]:
+        conn = self._conn
+        results = []
+        start = time.perf_counter()
+        SQLITE_BATCH_SIZE.observe(len(ops))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op in ops:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append(op(conn))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append(e)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            _COMMIT_SECONDS.observe(time.perf_counter() - start)
+        return results
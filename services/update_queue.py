@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from redis.exceptions import RedisError, ResponseError
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+STREAM_KEY = "updates:{partition}"
+CONSUMER_GROUP = "guardian-workers"
+STREAM_MAXLEN = 100000      # Approximate cap per partition stream
+READ_COUNT = 100            # Entries per XREADGROUP
+READ_BLOCK_MS = 5000
+RECLAIM_IDLE_MS = 60000     # Entries unacked this long belong to a dead consumer
+RECLAIM_INTERVAL = 30.0     # Seconds between pending-entry reclaim passes
+RETRY_MIN = 0.5             # First wait after a Redis error, doubled per failure in a row...
+RETRY_MAX = 30.0            # ...up to this many seconds
+
+# Update fields that carry the chat, checked in order
+_CHAT_CARRIERS = (
+    "message", "edited_message", "channel_post", "edited_channel_post", "chat_member",
+    "my_chat_member", "chat_join_request", "message_reaction", "message_reaction_count", "chat_boost",
+)
+
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+# Transient failures of Redis (resets, failovers, timeouts) that a loop waits out instead of dying
+REDIS_FAILURES = (RedisError, OSError)
+
+
+def retry_delay(failures: int) -> float:
+    return min(RETRY_MAX, RETRY_MIN * 2 ** (failures - 1))
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """Chat an update belongs to (falls back to the sender, then the update id)."""
+    for field in _CHAT_CARRIERS:
+        event = update.get(field)
+        if event and "chat" in event:
+            return event["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback and callback.get("message"):
+        return callback["message"]["chat"]["id"]
+    for event in update.values():
+        if isinstance(event, dict) and "from" in event:
+            return event["from"]["id"]
+    return update.get("update_id", 0)
+
+
+class UpdateQueue:
+    """
+    Raw updates partitioned by chat across Redis Streams.
+
+    Every chat maps to one partition and every partition is consumed by one
+    worker at a time. Within a read batch each chat's updates are handled in
+    stream order while different chats run concurrently, so a slow chat does
+    not hold up the others in its partition. A chat's entries are acked when
+    its run finishes; entries left pending by a crashed worker are picked up
+    again (own pending on restart, XAUTOCLAIM for others).
+    """
+
+    def __init__(self, redis, partitions: int):
+        self.redis = redis
+        self.partitions = partitions
+
+    def key(self, partition: int) -> str:
+        return STREAM_KEY.format(partition=partition)
+
+    def partition_for(self, update: Dict[str, Any]) -> int:
+        return update_chat_id(update) % self.partitions
+
+    # --- PRODUCER ---
+    async def publish(self, updates: List[Dict[str, Any]]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for update in updates:
+                pipe.xadd(self.key(self.partition_for(update)), {"u": json.dumps(update)},
+                          maxlen=STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+
+    # --- CONSUMER ---
+    async def ensure_groups(self) -> None:
+        for partition in range(self.partitions):
+            await self._ensure_group(self.key(partition))
+
+    async def _ensure_group(self, key: str) -> None:
+        try:
+            await self.redis.xgroup_create(key, CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def consume(self, partition: int, consumer: str, handle: UpdateHandler) -> None:
+        """
+        Handles one partition forever, in stream order. Redis errors are logged and
+        waited out with capped exponential backoff; entries handled but not acked
+        stay pending and are reclaimed by XAUTOCLAIM once idle.
+        """
+        key = self.key(partition)
+        last_reclaim = None
+        read_from = "0"  # Our own pending entries first (left over from before a restart)
+        failures = 0
+
+        while True:
+            try:
+                if last_reclaim is None or time.monotonic() - last_reclaim > RECLAIM_INTERVAL:
+                    await self._reclaim(key, consumer, handle)
+                    last_reclaim = time.monotonic()
+                response = await self.redis.xreadgroup(
+                    CONSUMER_GROUP, consumer, {key: read_from}, count=READ_COUNT, block=READ_BLOCK_MS,
+                )
+                entries = response[0][1] if response else []
+                if read_from == "0" and not entries:
+                    read_from = ">"
+                await self._handle_entries(key, entries, handle)
+                failures = 0
+            except REDIS_FAILURES as e:
+                failures += 1
+                delay = retry_delay(failures)
+                logger.error(f"Consuming {key} failed ({e}); retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                if isinstance(e, ResponseError):  # NOGROUP, no such key: the stream may be gone
+                    await self._recreate_group(key)
+
+    async def _recreate_group(self, key: str) -> None:
+        """The stream or its group may be gone (e.g. a failover to an empty replica): create it if so."""
+        try:
+            await self._ensure_group(key)
+        except REDIS_FAILURES as e:
+            logger.error(f"Recreating the consumer group of {key} failed: {e}")
+
+    async def _reclaim(self, key: str, consumer: str, handle: UpdateHandler) -> None:
+        start = "0-0"
+        while True:
+            response = await self.redis.xautoclaim(
+                key, CONSUMER_GROUP, consumer, min_idle_time=RECLAIM_IDLE_MS, start_id=start, count=READ_COUNT,
+            )
+            start, entries = response[0], response[1]
+            if entries:
+                logger.info(f"Reclaimed {len(entries)} pending updates from {key}.")
+            await self._handle_entries(key, entries, handle)
+            if start in ("0-0", b"0-0"):
+                return
+
+    async def _handle_entries(self, key: str, entries: list, handle: UpdateHandler) -> None:
+        """Handles a batch: one sequential run per chat, the chats concurrently, each acked as it finishes."""
+        if not entries:
+            return
+        by_chat: Dict[int, list] = {}
+        trimmed = []
+        for entry_id, fields in entries:
+            if not fields:  # Trimmed away while pending
+                trimmed.append(entry_id)
+                continue
+            update = json.loads(fields["u"])
+            by_chat.setdefault(update_chat_id(update), []).append((entry_id, update))
+
+        async def run_chat(chat_entries: list) -> None:
+            for entry_id, update in chat_entries:
+                try:
+                    await handle(update)
+                except Exception as e:
+                    logger.error(f"Update {entry_id} from {key} failed: {e}")
+            await self.redis.xack(key, CONSUMER_GROUP, *[entry_id for entry_id, _ in chat_entries])
+
+        runs = [run_chat(chat_entries) for chat_entries in by_chat.values()]
+        if trimmed:
+            runs.append(self.redis.xack(key, CONSUMER_GROUP, *trimmed))
+        # Every chat finishes before a failed ack is raised; its entries stay pending for XAUTOCLAIM
+        for result in await asyncio.gather(*runs, return_exceptions=True):
+            if isinstance(result, BaseException):
+                raise result
+
+
+# --- ROLES ---
+async def ingest_polling(bot: Bot, queue: UpdateQueue, allowed_updates: Optional[List[str]]) -> None:
+    """
+    Long-polls Telegram and appends every update to the streams. The offset only
+    moves past a batch once it is published, so a Redis outage holds the updates
+    at Telegram (retried with capped backoff) instead of losing them.
+    """
+    offset = None
+    pending = []
+    failures = 0
+    while True:
+        if not pending:
+            try:
+                pending = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+            except Exception as e:
+                logger.error(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+        if not pending:
+            continue
+        try:
+            await queue.publish([u.model_dump(mode="json", by_alias=True, exclude_none=True) for u in pending])
+        except REDIS_FAILURES as e:
+            failures += 1
+            delay = retry_delay(failures)
+            logger.error(f"Publishing {len(pending)} updates failed ({e}); retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+            continue
+        failures = 0
+        offset = pending[-1].update_id + 1
+        pending = []
+
+
+async def run_worker(dp: Dispatcher, bot: Bot, queue: UpdateQueue, index: int, count: int) -> None:
+    """Consumes the partitions owned by worker `index` of `count` (partition % count == index)."""
+    await queue.ensure_groups()
+    owned = [p for p in range(queue.partitions) if p % count == index]
+    consumer = f"worker-{index}"
+    logger.info(f"Worker {index}/{count} consuming partitions {owned}.")
+
+    async def handle(raw: Dict[str, Any]) -> None:
+        await dp.feed_update(bot, Update.model_validate(raw, context={"bot": bot}))
+
+    await asyncio.gather(*(queue.consume(p, consumer, handle) for p in owned))
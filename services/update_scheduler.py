@@ -0,0 +1,137 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from services.metrics import UPDATE_QUEUE_SECONDS, UPDATES_SHED
+
+# --- CONFIGURATION ---
+MAX_CONCURRENCY = 64                # Updates handled at once across all chats
+SHED_BACKLOG = (200, 500, 1000)     # Waiting updates at which each kind of Shed work stops, in Shed order
+
+
+class Shed(IntEnum):
+    """Work that may be skipped under backlog, in the order it is given up. Enforcement is never on this list."""
+    WELCOME = 0          # Welcome messages for new members
+    UNKNOWN_COMMAND = 1  # "I don't recognize that command" replies
+    NOTICE = 2           # Moderation summaries (the action itself still happens)
+
+
+class _ChatSlot:
+    """FIFO lock of one chat, with the number of updates holding or waiting for it."""
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class _Turn:
+    """The chat lock and global slot one running update holds; given back once, early or at the end."""
+    __slots__ = ('lock', 'slots')
+
+    def __init__(self, lock: Optional[asyncio.Lock], slots: asyncio.Semaphore):
+        self.lock = lock
+        self.slots = slots
+
+    def release(self) -> None:
+        if self.slots is None:
+            return
+        self.slots.release()
+        if self.lock is not None:
+            self.lock.release()
+        self.lock = self.slots = None
+
+
+_turn: ContextVar[Optional[_Turn]] = ContextVar("update_turn", default=None)
+
+
+def yield_turn() -> None:
+    """
+    Lets the chat's next update (and another chat's, for the global slot) start
+    while the current one keeps running. Called before waits that have nothing
+    to do with ordering, such as outbound rate limits on a reply, so a
+    rate-limited reply does not hold back the next message's enforcement.
+    """
+    turn = _turn.get()
+    if turn is not None:
+        turn.release()
+
+
+class UpdateScheduler:
+    """
+    Sits between the update feed and the routers.
+
+    Updates of one chat run one at a time in arrival order, so a spam wave in
+    one group queues behind itself instead of occupying every slot. At most
+    `concurrency` updates run at once overall; the rest wait, and the time they
+    wait is recorded. While more than SHED_BACKLOG[kind] updates are waiting,
+    `shedding(kind)` tells cosmetic work to skip itself, cheapest to lose
+    first, so the backlog drains at the speed of enforcement alone. An update
+    that has to wait for something unrelated to ordering (a rate-limited reply)
+    gives its turn back early with `yield_turn()`.
+    """
+
+    def __init__(self, concurrency: int = MAX_CONCURRENCY, shed_backlog: Sequence[int] = SHED_BACKLOG):
+        self.waiting = 0
+        self._chats: Dict[int, _ChatSlot] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._shed_counters = [UPDATES_SHED.labels(kind.name.lower()) for kind in Shed]
+        self.configure(concurrency, shed_backlog)
+
+    def configure(self, concurrency: int, shed_backlog: Sequence[int]) -> None:
+        if len(shed_backlog) != len(Shed) or list(shed_backlog) != sorted(shed_backlog):
+            raise ValueError(f"shed_backlog needs {len(Shed)} ascending thresholds, got {list(shed_backlog)}")
+        self.concurrency = concurrency
+        self.shed_backlog: List[int] = list(shed_backlog)
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def run(self, chat_id: Optional[int], handle: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs `handle()` after the chat's earlier updates, once a global slot is free."""
+        received = time.perf_counter()
+        started = False
+        self.waiting += 1
+        slot = None
+        if chat_id is not None:
+            slot = self._chats.get(chat_id)
+            if slot is None:
+                slot = self._chats[chat_id] = _ChatSlot()
+            slot.users += 1
+        try:
+            if slot is not None:
+                await slot.lock.acquire()
+            try:
+                slots = self._slots
+                await slots.acquire()
+            except BaseException:
+                if slot is not None:
+                    slot.lock.release()
+                raise
+            started = True
+            self.waiting -= 1
+            UPDATE_QUEUE_SECONDS.observe(time.perf_counter() - received)
+            turn = _Turn(slot.lock if slot is not None else None, slots)
+            token = _turn.set(turn)
+            try:
+                return await handle()
+            finally:
+                _turn.reset(token)
+                turn.release()
+        finally:
+            if not started:
+                self.waiting -= 1  # Cancelled while still queued
+            if slot is not None:
+                slot.users -= 1
+                if not slot.users:
+                    del self._chats[chat_id]
+
+    def shedding(self, kind: Shed) -> bool:
+        """True while the backlog is past `kind`'s threshold; counts every skip."""
+        if self.waiting < self.shed_backlog[kind]:
+            return False
+        self._shed_counters[kind].inc()
+        return True
+
+
+update_scheduler = UpdateScheduler()
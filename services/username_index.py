@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram.types import User
+
+from services.redis_batch import command, run, script_command
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+HASH_KEY = "usernames"            # username -> "user_id:last_seen"
+SEEN_KEY = "usernames:seen"       # Sorted set: username scored by last_seen, for trimming
+MAX_SHARED = 1_000_000            # Usernames kept in Redis; the least recently seen are dropped
+LOCAL_SIZE = 100_000              # Usernames kept in process
+REFRESH_AFTER = 3600              # Seconds before a known (username, id) pair is written again
+FLUSH_INTERVAL = 2.0              # Seconds between batched writes to Redis
+FLUSH_BATCH = 500                 # Usernames per script call
+
+# KEYS = hash, seen set. ARGV = max size, then (username, user_id, last_seen) triples.
+# Writes the batch, then drops the least recently seen usernames beyond the max size.
+FLUSH_LUA = """
+local max = tonumber(ARGV[1])
+for i = 2, #ARGV, 3 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1] .. ':' .. ARGV[i + 2])
+    redis.call('ZADD', KEYS[2], ARGV[i + 2], ARGV[i])
+end
+local excess = redis.call('ZCARD', KEYS[2]) - max
+if excess > 0 then
+    local oldest = redis.call('ZPOPMIN', KEYS[2], excess)
+    for i = 1, #oldest, 2 do
+        redis.call('HDEL', KEYS[1], oldest[i])
+    end
+end
+return excess
+"""
+
+
+class UsernameIndex:
+    """
+    @username -> user id, learned passively from the updates the bot sees.
+
+    The Bot API cannot look a user up by username, so moderation commands used
+    to need a reply or a text_mention. Every sender, joining member and replied-to
+    user is recorded here. An entry seen in the last REFRESH_AFTER seconds
+    costs one dict lookup; new or changed entries are queued and written to a
+    bounded Redis hash in one script call every FLUSH_INTERVAL, shared by all
+    instances. Lookups hit the local LRU first, then one HGET.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self._script = None
+        self._local: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()  # username -> (user_id, last_seen)
+        self._pending: Dict[str, Tuple[int, int]] = {}  # username -> (user_id, last_seen) not yet in Redis
+        self._task: Optional[asyncio.Task] = None
+
+    def setup(self, redis) -> None:
+        self.redis = redis
+        self._script = redis.register_script(FLUSH_LUA)
+
+    def observe(self, user: Optional[User]) -> None:
+        """Records who holds `user.username` right now. Synchronous; one dict lookup when nothing changed."""
+        if user is None or not user.username or user.is_bot:
+            return
+        username = user.username.lower()
+        now = time.time()
+        known = self._local.get(username)
+        if known is not None and known[0] == user.id and now - known[1] < REFRESH_AFTER:
+            return
+        self._remember(username, user.id, now)
+        if self.redis is not None and len(self._pending) < LOCAL_SIZE:  # Bounded while Redis is down
+            self._pending[username] = (user.id, int(now))
+
+    async def resolve(self, username: str) -> Optional[int]:
+        """User id last seen with `username` (with or without the @), or None if it was never seen."""
+        username = username.lstrip('@').lower()
+        known = self._local.get(username)
+        if known is not None:
+            self._local.move_to_end(username)
+            return known[0]
+        if self.redis is None:
+            return None
+        try:
+            value, = await run(self.redis, command('HGET', HASH_KEY, username))
+        except Exception as e:
+            logger.warning(f"Username lookup for @{username} failed: {e}")
+            return None
+        if value is None:
+            return None
+        user_id, _, last_seen = value.partition(':')
+        self._remember(username, int(user_id), float(last_seen))
+        return int(user_id)
+
+    def _remember(self, username: str, user_id: int, last_seen: float) -> None:
+        self._local[username] = (user_id, last_seen)
+        self._local.move_to_end(username)
+        if len(self._local) > LOCAL_SIZE:
+            self._local.popitem(last=False)
+
+    # --- FLUSHING ---
+    async def start(self) -> None:
+        if self.redis is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.redis is not None:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Username index flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Writes queued usernames to Redis. Returns how many were written."""
+        pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        written = 0
+        try:
+            for start in range(0, len(items), FLUSH_BATCH):
+                args = [MAX_SHARED]
+                for username, (user_id, last_seen) in items[start:start + FLUSH_BATCH]:
+                    args += [username, user_id, last_seen]
+                await run(self.redis, script_command(self._script, [HASH_KEY, SEEN_KEY], args))
+                written = start + FLUSH_BATCH
+        except Exception:
+            # Keep what was not written (newer observations win) for the next flush
+            for username, entry in items[written:]:
+                self._pending.setdefault(username, entry)
+            raise
+        return len(items)
+
+
+username_index = UsernameIndex()
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from services.metrics import VERDICT_CACHE_LOOKUPS
+from services.redis_batch import MISSING, RedisBatch, active_batch, command, defer
+
+logger = logging.getLogger(__name__)
+_LOCAL_HIT = VERDICT_CACHE_LOOKUPS.labels("local", "hit")
+_LOCAL_MISS = VERDICT_CACHE_LOOKUPS.labels("local", "miss")
+_SHARED_HIT = VERDICT_CACHE_LOOKUPS.labels("shared", "hit")
+_SHARED_MISS = VERDICT_CACHE_LOOKUPS.labels("shared", "miss")
+_MEDIA_HIT = VERDICT_CACHE_LOOKUPS.labels("media", "hit")
+
+# --- CONFIGURATION ---
+LOCAL_SIZE = 50_000          # Text verdicts kept in process (least recently used are evicted)
+MEDIA_SIZE = 10_000          # Known-bad media kept in process
+SHARED_MIN_LENGTH = 48       # Shorter texts are cheaper to rescan than to look up in Redis
+SHARED_TTL = 3600            # Seconds a bad verdict or media id lives in Redis
+TEXT_KEY = "verdict:text:{digest}"
+MEDIA_KEY = "verdict:media:{chat_id}:{file_unique_id}"  # Per chat: verdicts depend on its rules
+
+# (text contains a link, abusive terms found)
+Verdict = Tuple[bool, Tuple[str, ...]]
+CLEAN: Verdict = (False, ())
+
+
+def _encode(verdict: Verdict) -> str:
+    return f"{int(verdict[0])}|{','.join(verdict[1])}"
+
+
+def _decode(value: str) -> Verdict:
+    link, _, hits = value.partition('|')
+    return link == '1', tuple(hits.split(',')) if hits else ()
+
+
+class VerdictCache:
+    """
+    Memoized content verdicts for copy-paste spam.
+
+    Text verdicts are keyed by a 128-bit BLAKE2b digest of the filter version
+    and the raw text plus caption, so an identical copy skips normalization
+    and matching entirely. Every verdict is kept in a local LRU; bad ones can
+    also be shared through Redis with a TTL, so a wave seen by one instance is
+    already known to the others. Media whose message was deleted is indexed by
+    chat and file_unique_id, which catches the same picture reposted with new
+    text; it is per chat because the verdict came from that chat's link rules.
+
+    A Redis round trip costs more than rescanning one text locally, so the
+    shared text tier only pays when many instances see the same wave; it is
+    off unless `share_text` is set. The media index is always shared, and
+    its lookup is usually answered by the update's prefetch pipeline.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.share_text = False
+        self._local: "OrderedDict[bytes, Verdict]" = OrderedDict()
+        self._media: "OrderedDict[Tuple[int, str], Tuple[str, float]]" = OrderedDict()  # -> (reason, expires_at)
+
+    def setup(self, redis, share_text: bool = False) -> None:
+        self.redis = redis
+        self.share_text = share_text
+
+    def prefetch(self, batch: RedisBatch, chat_id: int, media_id: str) -> None:
+        """Queues the shared media lookup on the update's prefetch pipeline unless it is known locally."""
+        if self.redis is not None and self._local_media(chat_id, media_id) is None:
+            batch.prefetch(("media", chat_id, media_id),
+                           command('GET', MEDIA_KEY.format(chat_id=chat_id, file_unique_id=media_id)))
+
+    async def check(self, text: str, version: str, chat_id: int, media_id: Optional[str],
+                    scan: Callable[[str], Verdict]) -> Tuple[Verdict, Optional[str]]:
+        """
+        Returns the text verdict and, if the media is known to be bad in this chat, the reason it was removed.
+        At most one Redis round trip; `scan(text)` runs only when no tier knows the text.
+        """
+        digest = hashlib.blake2b(f"{version}\0{text}".encode(), digest_size=16).digest()
+        verdict = self._local.get(digest)
+        if verdict is not None:
+            self._local.move_to_end(digest)
+            _LOCAL_HIT.inc()
+        else:
+            _LOCAL_MISS.inc()
+
+        bad_media = self._local_media(chat_id, media_id) if media_id else None
+        if bad_media is not None:
+            _MEDIA_HIT.inc()
+
+        # One MGET covers whatever the local tier could not answer
+        keys = []
+        shared_text = (verdict is None and self.share_text and self.redis is not None
+                       and len(text) >= SHARED_MIN_LENGTH)
+        if shared_text:
+            keys.append(TEXT_KEY.format(digest=digest.hex()))
+        shared_media = media_id is not None and bad_media is None and self.redis is not None
+        prefetched = MISSING
+        if shared_media:
+            batch = active_batch()
+            prefetched = batch.result(("media", chat_id, media_id)) if batch is not None else MISSING
+            if isinstance(prefetched, Exception):
+                prefetched = None  # Redis failed for the prefetch; do not ask again for this message
+            if prefetched is not MISSING:
+                shared_media = False
+                if prefetched is not None:
+                    bad_media = prefetched
+                    self._remember_media(chat_id, media_id, bad_media)
+                    _MEDIA_HIT.inc()
+            else:
+                keys.append(MEDIA_KEY.format(chat_id=chat_id, file_unique_id=media_id))
+        if keys:
+            try:
+                values = await self.redis.mget(keys)
+            except Exception as e:
+                logger.warning(f"Shared verdict cache unavailable: {e}")
+                values = [None] * len(keys)
+            if shared_text:
+                value = values.pop(0)
+                if value is not None:
+                    verdict = _decode(value)
+                    _SHARED_HIT.inc()
+                else:
+                    _SHARED_MISS.inc()
+            if shared_media and values[0] is not None:
+                bad_media = values[0]
+                self._remember_media(chat_id, media_id, bad_media)
+                _MEDIA_HIT.inc()
+
+        if verdict is None:
+            verdict = scan(text)
+            if verdict != CLEAN and shared_text:
+                await defer(self.redis, command('SET', TEXT_KEY.format(digest=digest.hex()), _encode(verdict),
+                                                'EX', SHARED_TTL))
+        self._local[digest] = verdict
+        if len(self._local) > LOCAL_SIZE:
+            self._local.popitem(last=False)
+        return verdict, bad_media
+
+    # --- MEDIA ---
+    async def mark_bad_media(self, chat_id: int, media_id: str, reason: str) -> None:
+        """Remembers media from a message removed in `chat_id` so reposts there are removed without rescanning."""
+        self._remember_media(chat_id, media_id, reason)
+        if self.redis is not None:
+            await defer(self.redis, command('SET', MEDIA_KEY.format(chat_id=chat_id, file_unique_id=media_id),
+                                            reason, 'EX', SHARED_TTL))
+
+    def _local_media(self, chat_id: int, media_id: str) -> Optional[str]:
+        key = (chat_id, media_id)
+        entry = self._media.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._media[key]
+            return None
+        return entry[0]
+
+    def _remember_media(self, chat_id: int, media_id: str, reason: str) -> None:
+        key = (chat_id, media_id)
+        self._media[key] = (reason, time.monotonic() + SHARED_TTL)
+        self._media.move_to_end(key)
+        if len(self._media) > MEDIA_SIZE:
+            self._media.popitem(last=False)
+
+
+verdict_cache = VerdictCache()
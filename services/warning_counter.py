@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import uuid
+from typing import List, Optional, Tuple
+
+from services.redis_batch import command, run, script_command
+from services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+HASH_KEY = "warns:{chat_id}"   # user_id -> count
+DIRTY_KEY = "warns:dirty"      # "chat_id:user_id" members changed since the last flush
+FLUSH_LOCK_KEY = "warns:flush_lock"
+FLUSH_INTERVAL = 5.0           # Seconds between flushes to SQLite
+FLUSH_BATCH = 1000             # Dirty counters written per transaction
+FLUSH_LOCK_TTL = 30
+HASH_TTL = 7 * 86400           # A chat's counters leave Redis after this long without warnings; SQLite seeds them again
+
+# KEYS: hash, dirty set. ARGV: user_id, dirty member, seed from SQLite ('' if not read yet), hash TTL.
+# Returns the new count, or nil when the counter is cold and must be seeded from SQLite first.
+INCREMENT_LUA = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    if ARGV[3] == '' then
+        return false
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+end
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return count
+"""
+
+# Drops a counter the flush wrote as zero, unless a warning arrived since. KEYS: hash. ARGV: user_id.
+DROP_ZERO_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == '0' then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# Merges a change recorded while Redis was down. KEYS: hash, dirty set. ARGV: user_id, dirty member, delta, reset,
+# hash TTL.
+# Returns 1 if merged, 0 if Redis has no counter (the change goes to SQLite instead).
+MERGE_LUA = """
+if ARGV[4] == '1' then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+elseif redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[3])
+else
+    return 0
+end
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+SQL_UPSERT = """
+    INSERT INTO warnings (chat_id, user_id, count) VALUES (?, ?, ?)
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET count = excluded.count
+"""
+SQL_DELETE = "DELETE FROM warnings WHERE chat_id = ? AND user_id = ?"
+SQL_GET = "SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?"
+SQL_GET_OFFLINE = """
+    SELECT CASE WHEN d.reset THEN 0 ELSE coalesce((SELECT count FROM warnings w
+                                          WHERE w.chat_id = d.chat_id AND w.user_id = d.user_id), 0) END + d.delta
+    FROM warning_deltas d WHERE d.chat_id = ? AND d.user_id = ?
+"""
+# ARGV order: chat_id, user_id, delta, reset. A later reset replaces earlier deltas; an earlier reset stays.
+SQL_ADD_DELTA = """
+    INSERT INTO warning_deltas (chat_id, user_id, delta, reset) VALUES (?, ?, ?, ?)
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET
+        delta = CASE WHEN excluded.reset THEN excluded.delta ELSE delta + excluded.delta END,
+        reset = max(reset, excluded.reset)
+"""
+SQL_TAKE_DELTAS = "DELETE FROM warning_deltas RETURNING chat_id, user_id, delta, reset"
+SQL_APPLY_DELTA = """
+    INSERT INTO warnings (chat_id, user_id, count) VALUES (?, ?, ?)
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET count = count + excluded.count
+"""
+
+
+class WarningCounter:
+    """
+    Write-behind warning counters.
+
+    Increments are one atomic HINCRBY (via a script) in Redis, shared by all
+    instances. Changed counters are marked dirty and written to the SQLite
+    `warnings` table in batched transactions every FLUSH_INTERVAL and at
+    shutdown. A counter Redis does not hold is seeded from SQLite first (one
+    more round trip, only on that miss), so counts survive a cold Redis.
+    Redis keeps only live counters: a reset writes 0, which the flush deletes
+    from both sides once SQLite has it, and a chat's hash expires HASH_TTL
+    after its last warning. A Redis lock keeps flushes from interleaving.
+
+    While Redis is unreachable, warnings and resets are recorded as deltas in
+    SQLite (`warning_deltas`). The next flush merges them into the Redis
+    counters first, so neither side overwrites the other.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.storage: Optional[Storage] = None
+        self._script = None
+        self._merge_script = None
+        self._drop_zero_script = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock_token = uuid.uuid4().hex
+
+    def setup(self, redis, storage: Storage) -> None:
+        self.redis = redis
+        self.storage = storage
+        self._script = redis.register_script(INCREMENT_LUA)
+        self._merge_script = redis.register_script(MERGE_LUA)
+        self._drop_zero_script = redis.register_script(DROP_ZERO_LUA)
+
+    @property
+    def enabled(self) -> bool:
+        return self.redis is not None
+
+    # --- COUNTERS ---
+    async def increment(self, chat_id: int, user_id: int) -> int:
+        keys = [HASH_KEY.format(chat_id=chat_id), DIRTY_KEY]
+        member = f"{chat_id}:{user_id}"
+        count, = await run(self.redis, script_command(self._script, keys, [user_id, member, '', HASH_TTL]))
+        if count is None:
+            seed = await self._read_sqlite(chat_id, user_id)
+            count, = await run(self.redis, script_command(self._script, keys, [user_id, member, seed, HASH_TTL]))
+        return int(count)
+
+    async def reset(self, chat_id: int, user_id: int) -> None:
+        # A 0, not HDEL: until the flush deletes the SQLite row, a missing field would be re-seeded from it
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(HASH_KEY.format(chat_id=chat_id), str(user_id), 0)
+            pipe.expire(HASH_KEY.format(chat_id=chat_id), HASH_TTL)
+            pipe.sadd(DIRTY_KEY, f"{chat_id}:{user_id}")
+            await pipe.execute()
+
+    async def get(self, chat_id: int, user_id: int) -> int:
+        count, = await run(self.redis, command('HGET', HASH_KEY.format(chat_id=chat_id), str(user_id)))
+        if count is None:
+            return await self._read_sqlite(chat_id, user_id)
+        return int(count)
+
+    async def _read_sqlite(self, chat_id: int, user_id: int) -> int:
+        def _get(conn):
+            result = conn.execute(SQL_GET, (chat_id, user_id)).fetchone()
+            return result[0] if result else 0
+        return await self.storage.read(_get)
+
+    # --- REDIS UNAVAILABLE ---
+    async def record_offline(self, chat_id: int, user_id: int, reset: bool = False) -> int:
+        """Records a warning (or a reset) for the next flush to merge; returns the count as SQLite knows it."""
+        def _record(conn):
+            conn.execute(SQL_ADD_DELTA, (chat_id, user_id, 0 if reset else 1, int(reset)))
+            return conn.execute(SQL_GET_OFFLINE, (chat_id, user_id)).fetchone()[0]
+        return await self.storage.write(_record)
+
+    async def get_offline(self, chat_id: int, user_id: int) -> int:
+        def _get(conn):
+            result = conn.execute(SQL_GET_OFFLINE, (chat_id, user_id)).fetchone()
+            if result is None:
+                result = conn.execute(SQL_GET, (chat_id, user_id)).fetchone()
+            return result[0] if result else 0
+        return await self.storage.read(_get)
+
+    async def _merge_offline(self) -> int:
+        """Moves deltas recorded while Redis was down into the counters. Runs under the flush lock."""
+        deltas = await self.storage.write(lambda conn: conn.execute(SQL_TAKE_DELTAS).fetchall())
+        if not deltas:
+            return 0
+        try:
+            merged = await run(self.redis, *(
+                script_command(self._merge_script, [HASH_KEY.format(chat_id=chat_id), DIRTY_KEY],
+                               [user_id, f"{chat_id}:{user_id}", delta, reset, HASH_TTL])
+                for chat_id, user_id, delta, reset in deltas
+            ))
+        except Exception:
+            await self.storage.write(lambda conn: conn.executemany(SQL_ADD_DELTA, deltas))  # Try again next time
+            raise
+
+        # Counters Redis does not hold: SQLite is their only copy, and seeds them later
+        cold = [row for row, done in zip(deltas, merged) if not done]
+
+        def _apply(conn):
+            for chat_id, user_id, delta, reset in cold:
+                if reset and not delta:
+                    conn.execute(SQL_DELETE, (chat_id, user_id))
+                elif reset:
+                    conn.execute(SQL_UPSERT, (chat_id, user_id, delta))
+                else:
+                    conn.execute(SQL_APPLY_DELTA, (chat_id, user_id, delta))
+        if cold:
+            await self.storage.write(_apply)
+        logger.info(f"Merged {len(deltas)} warning changes recorded while Redis was unavailable.")
+        return len(deltas)
+
+    # --- FLUSHING ---
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flush loop and writes everything still dirty."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Warning counter flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Writes dirty counters to SQLite. Returns how many were written."""
+        if not await self.redis.set(FLUSH_LOCK_KEY, self._lock_token, nx=True, ex=FLUSH_LOCK_TTL):
+            return 0  # Another instance is flushing
+        written = 0
+        try:
+            await self._merge_offline()
+            while True:
+                members = await self.redis.spop(DIRTY_KEY, FLUSH_BATCH)
+                if not members:
+                    break
+                try:
+                    written += await self._write_batch(members)
+                except Exception:
+                    await self.redis.sadd(DIRTY_KEY, *members)  # Try again next time
+                    raise
+        finally:
+            if await self.redis.get(FLUSH_LOCK_KEY) == self._lock_token:
+                await self.redis.delete(FLUSH_LOCK_KEY)
+        return written
+
+    async def _write_batch(self, members: List[str]) -> int:
+        pairs: List[Tuple[int, int]] = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for member in members:
+                chat_id, user_id = member.split(':')
+                pairs.append((int(chat_id), int(user_id)))
+                pipe.hget(HASH_KEY.format(chat_id=chat_id), user_id)
+            counts = await pipe.execute()
+
+        upserts = [(c, u, int(n)) for (c, u), n in zip(pairs, counts) if n is not None and int(n) > 0]
+        deletes = [(c, u) for (c, u), n in zip(pairs, counts) if n is None or int(n) <= 0]
+
+        def _write(conn):
+            if upserts:
+                conn.executemany(SQL_UPSERT, upserts)
+            if deletes:
+                conn.executemany(SQL_DELETE, deletes)
+        await self.storage.write(_write)
+
+        # SQLite no longer has these rows, so a missing field now seeds correctly as 0
+        zeros = [(c, u) for (c, u), n in zip(pairs, counts) if n is not None and int(n) <= 0]
+        if zeros:
+            await run(self.redis, *(script_command(self._drop_zero_script, [HASH_KEY.format(chat_id=c)], [u])
+                                    for c, u in zeros))
+        return len(pairs)
+
+
+warning_counter = WarningCounter()
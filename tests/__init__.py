@@ -0,0 +1,2 @@
+# tests/__init__.py
+# Run the tests with: python -m unittest discover tests
@@ -0,0 +1,47 @@
+import unittest
+
+from services.abuse_matcher import AbuseMatcher, normalize
+
+TERMS = ("fuck", "sex", "bc", "mc", "asshole", "ullu ke pathe")
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_spelled_out_words_are_joined(self):
+        self.assertEqual(normalize("f.u.c.k"), " fuck ")
+        self.assertEqual(normalize("you are a f.u.c.k"), " you are a fuck ")
+        self.assertEqual(normalize("f-u-c-k off"), " fuck off ")
+
+    def test_short_or_spaced_letter_runs_are_not_joined(self):
+        self.assertEqual(normalize("b/c it rained"), " b c it rained ")
+        self.assertEqual(normalize("300 B.C."), " 300 b c ")
+        self.assertEqual(normalize("a b c"), " a b c ")
+
+    def test_repeats_never_collapse_to_two_letters(self):
+        self.assertEqual(normalize("fuuuuck"), " fuck ")
+        self.assertEqual(normalize("cc: team, bcc: hr"), " cc team bcc hr ")
+        self.assertEqual(normalize("MCC"), " mcc ")
+
+    def test_numbers_are_not_leetspeak(self):
+        self.assertEqual(normalize("100 5 3 x"), " 100 5 3 x ")
+        self.assertEqual(normalize("s3x"), " sex ")
+
+
+class AbuseMatcherTest(unittest.TestCase):
+    matcher = AbuseMatcher(TERMS)
+
+    def test_ordinary_text_is_clean(self):
+        for text in ("I left early b/c it rained", "Founded in 300 B.C.", "cc: team, bcc: hr",
+                     "Melbourne MCC ground", "I scored 100 5 3 x", "a classic class"):
+            with self.subTest(text=text):
+                self.assertEqual(self.matcher.find(text), [])
+
+    def test_evasions_are_found(self):
+        for text, term in (("you are a f.u.c.k", "fuck"), ("fuuuuck you", "fuck"), ("s.3.x", "sex"),
+                           ("a$$hole", "asshole"), ("ASSHOLE", "asshole"), ("bc bhai", "bc"),
+                           ("ullu  ke PATHE", "ullu ke pathe")):
+            with self.subTest(text=text):
+                self.assertEqual(self.matcher.find(text), [term])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+import fakeredis
+import fakeredis.aioredis
+
+from services import deletion_scheduler as module
+from services.deletion_scheduler import REDIS_KEY, DeletionScheduler, delete_messages
+
+
+class _Bot:
+    def __init__(self):
+        self.calls = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls.append((chat_id, list(message_ids)))
+
+
+class DeletionSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.aioredis.FakeRedis(server=self.server, decode_responses=True)
+        self.scheduler = DeletionScheduler()
+        self.scheduler.setup(self.redis)
+        self.bot = self.scheduler.bot = _Bot()
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    def deleted(self):
+        return sorted((chat_id, sorted(ids)) for chat_id, ids in self.bot.calls)
+
+    async def test_due_deletions_go_out_in_one_call_per_chat(self):
+        for message_id in (1, 2, 3):
+            await self.scheduler.schedule(-1, message_id, 0)
+        await self.scheduler.schedule(-2, 9, 0)
+        await self.scheduler.schedule(-2, 10, 3600)
+        await self.scheduler._drain()
+        self.assertEqual(self.deleted(), [(-2, [9]), (-1, [1, 2, 3])])
+        self.assertEqual(await self.scheduler.pending(), 1)
+
+    async def test_deletions_kept_locally_are_delivered_while_redis_is_down(self):
+        self.server.connected = False
+        with self.assertLogs("services.deletion_scheduler", "WARNING"):
+            await self.scheduler.schedule(-1, 5, 0)
+            await self.scheduler._drain()
+        self.assertEqual(self.deleted(), [(-1, [5])])
+
+    async def test_failed_batch_is_scheduled_again(self):
+        await self.scheduler.schedule(-1, 5, 0)
+        with mock.patch.object(module, "delete_messages", side_effect=RuntimeError("boom")), \
+                self.assertLogs("services.deletion_scheduler", "WARNING"):
+            await self.scheduler._drain()
+        self.assertEqual(await self.redis.zrange(REDIS_KEY, 0, -1), ["-1:5"])
+
+    async def test_failed_batch_stays_local_while_redis_is_down(self):
+        self.scheduler.redis = None
+        await self.scheduler.schedule(-1, 5, 0)
+        with mock.patch.object(module, "delete_messages", side_effect=RuntimeError("boom")), \
+                self.assertLogs("services.deletion_scheduler", "WARNING"):
+            await self.scheduler._drain()
+        self.assertEqual(await self.scheduler.pending(), 1)
+
+    async def test_delete_messages_splits_into_chunks_of_100(self):
+        self.assertEqual(await delete_messages(self.bot, -1, list(range(250))), 250)
+        self.assertEqual([len(ids) for _, ids in self.bot.calls], [100, 100, 50])
+
+
+if __name__ == "__main__":
+    unittest.main()
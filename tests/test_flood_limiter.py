@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+import fakeredis.aioredis
+
+from services.flood_limiter import FloodLimiter
+
+
+class FloodLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.limiter = FloodLimiter(limit=5, period=5.0)
+        self.limiter.setup(self.redis)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def hits(self, limiter, stamps, chat_id=1, user_id=2):
+        counts = []
+        for stamp in stamps:
+            with mock.patch("services.flood_limiter.time.time", return_value=1_000_000 + stamp):
+                counts.append(await limiter.hit(chat_id, user_id))
+        return counts
+
+    async def test_unsynced_messages_older_than_the_window_are_not_counted(self):
+        counts = await self.hits(self.limiter, [0, 2.6, 5.2, 7.8, 10.4, 10.5])
+        self.assertEqual(counts[-1], 3)
+        self.assertFalse(self.limiter.is_flood(counts[-1]))
+
+    async def test_flood_is_detected_and_the_window_starts_fresh(self):
+        counts = await self.hits(self.limiter, [0, 0.5, 1, 1.5, 2, 2.5, 3])
+        self.assertEqual(counts[5], 6)
+        self.assertTrue(self.limiter.is_flood(counts[5]))
+        self.assertEqual(counts[6], 1)
+        self.assertEqual(await self.redis.exists("flood:1:2"), 0)
+
+    async def test_instances_share_the_window(self):
+        other = FloodLimiter(limit=5, period=5.0)
+        other.setup(self.redis)
+        await self.hits(self.limiter, [0, 0.1, 0.2])
+        counts = await self.hits(other, [0.3, 0.4, 0.5])
+        self.assertTrue(other.is_flood(counts[-1]))
+
+    async def test_shared_window_slides_and_expires(self):
+        limiter = FloodLimiter(limit=3, period=5.0, sync_fraction=0)  # Every message goes to Redis
+        limiter.setup(self.redis)
+        self.assertEqual(await self.hits(limiter, [0, 1, 2, 6, 6.5]), [1, 2, 3, 2, 3])
+        with mock.patch("services.flood_limiter.time.time", return_value=1_000_006.5):  # fakeredis' clock too
+            ttl = await self.redis.pttl("flood:1:2")
+        self.assertTrue(0 < ttl <= 5000)
+
+    async def test_chats_and_users_have_separate_windows(self):
+        await self.hits(self.limiter, [0, 0.1, 0.2, 0.3, 0.4])
+        self.assertEqual(await self.hits(self.limiter, [0.5], chat_id=9), [1])
+        self.assertEqual(await self.hits(self.limiter, [0.5], user_id=9), [1])
+
+    async def test_local_window_enforces_the_limit_while_redis_fails(self):
+        self.limiter.redis = mock.Mock()
+        with mock.patch("services.flood_limiter.run", side_effect=ConnectionError("down")), \
+                self.assertLogs("services.flood_limiter", "WARNING"):
+            counts = await self.hits(self.limiter, [0, 0.5, 1, 1.5, 2, 2.5])
+        self.assertTrue(self.limiter.is_flood(counts[-1]))
+
+    async def test_without_redis_only_the_local_window_counts(self):
+        limiter = FloodLimiter(limit=2, period=5.0)
+        self.assertEqual(await self.hits(limiter, [0, 1, 2, 8]), [1, 2, 3, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
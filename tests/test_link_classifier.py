@@ -0,0 +1,32 @@
+import unittest
+
+from services.link_classifier import extract_hosts, parse_domain
+
+
+class ExtractHostsTest(unittest.TestCase):
+    def test_missing_space_before_a_word_tld_is_not_a_link(self):
+        for text in ("ok.so what now", "I was there.me too", "See you.in the morning", "name.my name"):
+            with self.subTest(text=text):
+                self.assertEqual(extract_hosts(text), [])
+
+    def test_email_address_is_not_a_link(self):
+        self.assertEqual(extract_hosts("mail me at bob@gmail.com"), [])
+
+    def test_word_tld_counts_with_scheme_path_or_entity(self):
+        self.assertEqual(extract_hosts("go to http://ok.so"), ["ok.so"])
+        self.assertEqual(extract_hosts("join spam.me/x"), ["spam.me"])
+        self.assertEqual(extract_hosts("ok.so", ["ok.so"]), ["ok.so"])
+
+    def test_links(self):
+        self.assertEqual(extract_hosts("spam.xyz and www.example.com"), ["spam.xyz", "example.com"])
+        self.assertEqual(extract_hosts("https://user:pw@evil.com/x"), ["evil.com"])
+        self.assertEqual(extract_hosts("t.me/channel"), ["channel.t.me"])
+        self.assertEqual(extract_hosts("see v1.2 notes in changelog.txt, e.g. here"), [])
+
+    def test_parse_domain(self):
+        self.assertEqual(parse_domain("GitHub.com"), "github.com")
+        self.assertEqual(parse_domain("t.me/foo"), "foo.t.me")
+
+
+if __name__ == "__main__":
+    unittest.main()
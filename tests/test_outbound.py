@@ -0,0 +1,88 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, GetMe, SendMessage
+
+from services import outbound
+from services.outbound import OutboundDropped, OutboundScheduler, TokenBucket, low_priority
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.scheduler = OutboundScheduler()
+        self.sent = []
+
+    async def make_request(self, bot, method):
+        self.sent.append(method)
+        return True
+
+    async def send(self, method, low=False):
+        if low:
+            with low_priority():
+                return await self.scheduler(self.make_request, None, method)
+        return await self.scheduler(self.make_request, None, method)
+
+    async def test_queued_calls_go_out_by_priority(self):
+        self.scheduler.global_bucket = TokenBucket(rate=50, capacity=1)
+        self.scheduler.global_bucket.take()  # Everything below has to queue
+        calls = [asyncio.create_task(self.send(SendMessage(chat_id=-1, text="welcome"), low=True)),
+                 asyncio.create_task(self.send(SendMessage(chat_id=-2, text="reply"))),
+                 asyncio.create_task(self.send(DeleteMessage(chat_id=-3, message_id=1)))]
+        await asyncio.gather(*calls)
+        self.assertEqual([type(m).__name__ for m in self.sent], ["DeleteMessage", "SendMessage", "SendMessage"])
+        self.assertEqual(self.sent[2].text, "welcome")
+
+    async def test_low_priority_calls_are_dropped_when_the_queue_is_deep(self):
+        self.scheduler.global_bucket = TokenBucket(rate=50, capacity=1)
+        self.scheduler.global_bucket.take()
+        with mock.patch.object(outbound, "LOW_DROP_DEPTH", 1):
+            queued_low = asyncio.create_task(self.send(SendMessage(chat_id=-1, text="old"), low=True))
+            await asyncio.sleep(0)
+            with self.assertRaises(OutboundDropped):
+                await self.send(SendMessage(chat_id=-1, text="new"), low=True)
+            normal = asyncio.create_task(self.send(SendMessage(chat_id=-2, text="reply")))
+            with self.assertRaises(OutboundDropped) as dropped:
+                await queued_low  # Evicted to make room for the normal call
+            self.assertEqual(dropped.exception.method.text, "old")
+            await normal
+        self.assertEqual(self.scheduler.dropped, 2)
+
+    async def test_retry_after_pauses_only_the_chat_it_came_from(self):
+        attempts = []
+
+        async def flaky(bot, method):
+            attempts.append((method.chat_id, time.monotonic()))
+            if method.chat_id == -1 and len([a for a in attempts if a[0] == -1]) == 1:
+                raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=0.3)
+            return True
+
+        start = time.monotonic()
+        with self.assertLogs("services.outbound", "WARNING"):
+            await asyncio.gather(self.scheduler(flaky, None, DeleteMessage(chat_id=-1, message_id=1)),
+                                 self.scheduler(flaky, None, DeleteMessage(chat_id=-2, message_id=1)))
+        retried = [t - start for chat_id, t in attempts if chat_id == -1]
+        other = [t - start for chat_id, t in attempts if chat_id == -2]
+        self.assertGreaterEqual(retried[1], 0.25)
+        self.assertLess(other[0], 0.1)
+        self.assertEqual(self.scheduler.global_bucket.wait_time(time.monotonic()), 0)
+
+    async def test_retry_after_without_a_chat_pauses_everything(self):
+        calls = 0
+
+        async def flaky(bot, method):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=0.2)
+            return True
+
+        with self.assertLogs("services.outbound", "WARNING"):
+            await self.scheduler(flaky, None, GetMe())
+        self.assertGreater(self.scheduler.global_bucket.wait_time(time.monotonic()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
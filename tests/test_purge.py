@@ -0,0 +1,69 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from handlers import moderation
+from services.message_index import MessageIndex
+
+
+class _Bot:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.deleted += message_ids
+
+
+def command(text, message_id, reply_to=None):
+    return SimpleNamespace(
+        text=text, message_id=message_id, chat=SimpleNamespace(id=-1), from_user=SimpleNamespace(id=42),
+        reply_to_message=SimpleNamespace(message_id=reply_to) if reply_to else None,
+        answer=mock.AsyncMock(), reply=mock.AsyncMock(),
+    )
+
+
+class PurgeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.index = MessageIndex()
+        self.audit = mock.Mock()
+        for target, value in (("message_index", self.index), ("audit_log", self.audit),
+                              ("is_admin", mock.AsyncMock(return_value=True)), ("delete_later", mock.AsyncMock())):
+            patcher = mock.patch.object(moderation, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.bot = _Bot()
+
+    def reply_text(self, message):
+        return message.answer.await_args.args[0]
+
+    async def test_purge_count_deletes_the_recorded_messages_and_the_command(self):
+        for message_id in (10, 11, 12, 13):
+            self.index.record(-1, message_id, 7)
+        message = command("/purge 3", 14)
+        self.index.record(-1, 14, 42)
+        await moderation.cmd_purge(message, self.bot)
+        self.assertEqual(self.bot.deleted, [14, 13, 12, 11])
+        self.assertEqual(self.reply_text(message), "🧹 Removed up to 3 messages.")
+
+    async def test_purge_in_reply_covers_the_range_and_reports_an_upper_bound(self):
+        message = command("/purge", 120, reply_to=100)
+        await moderation.cmd_purge(message, self.bot)
+        self.assertEqual(sorted(self.bot.deleted), list(range(100, 121)))
+        self.assertEqual(self.reply_text(message), "🧹 Removed up to 20 messages.")
+        self.assertEqual(self.audit.record.call_args.args[3], "up to 20 messages")
+
+    async def test_purge_refuses_ranges_beyond_the_limit(self):
+        message = command("/purge", 5000, reply_to=10)
+        await moderation.cmd_purge(message, self.bot)
+        self.assertEqual(self.bot.deleted, [])
+        message.reply.assert_awaited()
+
+    async def test_purge_needs_an_admin(self):
+        moderation.is_admin.return_value = False
+        message = command("/purge 5", 20)
+        await moderation.cmd_purge(message, self.bot)
+        self.assertEqual(self.bot.deleted, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
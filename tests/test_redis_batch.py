@@ -0,0 +1,80 @@
+import unittest
+from unittest import mock
+
+import fakeredis.aioredis
+from redis.exceptions import ResponseError
+
+from services import redis_batch
+from services.redis_batch import RedisBatch, active_batch, command, current_batch, defer, run, script_command
+
+
+class RedisBatchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(redis_batch, "_pipeline", wraps=redis_batch._pipeline)
+        self.round_trips = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    def open_batch(self) -> RedisBatch:
+        batch = RedisBatch(self.redis)
+        token = current_batch.set(batch)
+        self.addCleanup(current_batch.reset, token)
+        return batch
+
+    async def test_prefetched_reads_and_deferred_writes_share_round_trips(self):
+        await self.redis.set("a", "1")
+        batch = self.open_batch()
+        seen = []
+        batch.prefetch("a", command('GET', 'a'), seen.append)
+        batch.prefetch("missing", command('GET', 'missing'))
+        await batch.execute()
+        self.assertEqual((batch.result("a"), batch.result("missing"), seen), ("1", None, ["1"]))
+        self.assertIs(batch.result("never"), redis_batch.MISSING)
+
+        await defer(self.redis, command('SET', 'b', '2'))
+        self.assertIsNone(await self.redis.get("b"))  # Waits for the update's next call
+        self.assertEqual(await run(self.redis, command('INCR', 'n')), [1])  # Only its own replies
+        self.assertEqual(await self.redis.get("b"), "2")
+        await defer(self.redis, command('SET', 'c', '3'))
+        await batch.close()
+        self.assertEqual(await self.redis.get("c"), "3")
+        self.assertIsNone(active_batch())
+        self.assertEqual(self.round_trips.call_count, 3)
+
+    async def test_failed_deferred_write_goes_to_its_handler_not_the_caller(self):
+        await self.redis.set("text", "x")
+        self.open_batch()
+        errors = []
+        await defer(self.redis, command('INCR', 'text'), on_error=errors.append)
+        with self.assertLogs("services.redis_batch", "WARNING"):
+            self.assertEqual(await run(self.redis, command('INCR', 'n')), [1])
+        self.assertIsInstance(errors[0], ResponseError)
+
+    async def test_failed_read_is_kept_per_key(self):
+        await self.redis.set("text", "x")
+        batch = self.open_batch()
+        batch.prefetch("bad", command('INCR', 'text'))
+        batch.prefetch("good", command('GET', 'text'))
+        await batch.execute()
+        self.assertIsInstance(batch.result("bad"), ResponseError)
+        self.assertEqual(batch.result("good"), "x")
+
+    async def test_run_outside_an_update_raises_command_errors(self):
+        await self.redis.set("text", "x")
+        with self.assertRaises(ResponseError):
+            await run(self.redis, command('SET', 'a', '1'), command('INCR', 'text'))
+
+    async def test_script_missing_from_the_server_is_loaded_and_rerun(self):
+        script = self.redis.register_script("return redis.call('INCRBY', KEYS[1], ARGV[1])")
+        self.assertEqual(await run(self.redis, script_command(script, ["n"], [5]), command('SET', 'a', '1')),
+                         [5, True])  # Never loaded: NOSCRIPT, loaded, and only the script runs again
+        await self.redis.script_flush()
+        self.assertEqual(await run(self.redis, script_command(script, ["n"], [2])), [7])
+        self.assertEqual(await self.redis.get("a"), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
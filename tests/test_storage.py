@@ -0,0 +1,51 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from services import storage as module
+from services.storage import Storage
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);"
+
+
+def insert(name):
+    return lambda conn: conn.execute("INSERT INTO items (name) VALUES (?)", (name,)).lastrowid
+
+
+class StorageTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.db")
+        self.storage = Storage(self.path, SCHEMA)
+        await self.storage.open()
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+
+    async def names(self):
+        return await self.storage.read(lambda conn: [name for name, in conn.execute("SELECT name FROM items")])
+
+    async def test_concurrent_writes_share_a_commit_and_fail_alone(self):
+        results = await asyncio.gather(self.storage.write(insert("a")),
+                                       self.storage.write(insert("a")), self.storage.write(insert("b")),
+                                       return_exceptions=True)
+        self.assertIsInstance(results[1], sqlite3.IntegrityError)
+        self.assertEqual(sorted(await self.names()), ["a", "b"])
+
+    async def test_close_commits_queued_writes_and_cancels_the_timer(self):
+        write = asyncio.ensure_future(self.storage.write(insert("late")))
+        await asyncio.sleep(0)  # Queued, its group-commit timer armed
+        self.assertIsNotNone(self.storage._flush_handle)
+        await self.storage.close()
+        self.assertEqual(await write, 1)
+        self.assertIsNone(self.storage._flush_handle)
+        await asyncio.sleep(module.GROUP_COMMIT_WINDOW * 5)  # Nothing fires after the thread is gone
+        with sqlite3.connect(self.path) as conn:
+            self.assertEqual(conn.execute("SELECT name FROM items").fetchall(), [("late",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import fakeredis.aioredis
+
+from services import update_queue
+from services.update_queue import CONSUMER_GROUP, UpdateQueue, update_chat_id
+
+
+def message(update_id, chat_id, text="hi"):
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "chat": {"id": chat_id}, "from": {"id": 7}, "text": text}}
+
+
+class UpdateQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        patcher = mock.patch.object(update_queue, "READ_BLOCK_MS", None)  # fakeredis blocks the loop
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.queue = UpdateQueue(self.redis, partitions=1)
+        await self.queue.ensure_groups()
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def consume_until(self, handle, done, consumer="worker-0"):
+        task = asyncio.create_task(self.queue.consume(0, consumer, handle))
+        async def settled():
+            await done.wait()
+            while await self.pending():  # Acks follow the handler
+                await asyncio.sleep(0.01)
+        try:
+            await asyncio.wait_for(settled(), timeout=5)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def pending(self) -> int:
+        return (await self.redis.xpending(self.queue.key(0), CONSUMER_GROUP))["pending"]
+
+    def test_update_chat_id(self):
+        self.assertEqual(update_chat_id(message(1, -5)), -5)
+        self.assertEqual(update_chat_id({"update_id": 3, "inline_query": {"from": {"id": 9}}}), 9)
+
+    async def test_slow_chat_does_not_hold_up_other_chats_of_its_partition(self):
+        await self.queue.publish([message(1, -1), message(2, -2), message(3, -1), message(4, -2)])
+        handled, done = [], asyncio.Event()
+
+        async def handle(update):
+            chat_id = update_chat_id(update)
+            if chat_id == -1:
+                await asyncio.sleep(0.2)
+            handled.append((chat_id, update["update_id"]))
+            if len(handled) == 4:
+                done.set()
+        await self.consume_until(handle, done)
+        self.assertEqual(handled[:2], [(-2, 2), (-2, 4)])  # Not behind chat -1
+        self.assertEqual([u for c, u in handled if c == -1], [1, 3])  # Order kept within the chat
+
+    async def test_failing_update_is_acked_and_the_chat_goes_on(self):
+        await self.queue.publish([message(1, -1, "boom"), message(2, -1)])
+        handled, done = [], asyncio.Event()
+
+        async def handle(update):
+            if update["message"]["text"] == "boom":
+                raise ValueError("boom")
+            handled.append(update["update_id"])
+            done.set()
+        with self.assertLogs("services.update_queue", "ERROR"):
+            await self.consume_until(handle, done)
+        self.assertEqual(handled, [2])
+
+    async def test_entries_left_pending_by_a_dead_worker_are_reclaimed(self):
+        await self.queue.publish([message(1, -1)])
+        await self.redis.xreadgroup(CONSUMER_GROUP, "worker-dead", {self.queue.key(0): ">"})
+        handled, done = [], asyncio.Event()
+
+        async def handle(update):
+            handled.append(update["update_id"])
+            done.set()
+        with mock.patch.object(update_queue, "RECLAIM_IDLE_MS", 0):
+            await self.consume_until(handle, done)
+        self.assertEqual(handled, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
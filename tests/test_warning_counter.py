@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import fakeredis.aioredis
+
+from services.storage import Storage
+from services.warning_counter import HASH_KEY, SQL_UPSERT, WarningCounter
+from utils import SCHEMA
+
+SQL_COUNT = "SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?"
+
+
+class WarningCounterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = Storage(os.path.join(directory.name, "test.db"), SCHEMA)
+        await self.storage.open()
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.counter = WarningCounter()
+        self.counter.setup(self.redis, self.storage)
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        await self.redis.aclose()
+
+    async def sqlite_count(self, chat_id, user_id):
+        row = await self.storage.read(lambda conn: conn.execute(SQL_COUNT, (chat_id, user_id)).fetchone())
+        return row[0] if row else None
+
+    async def test_sqlite_is_read_only_when_redis_has_no_counter(self):
+        await self.storage.write(lambda conn: conn.execute(SQL_UPSERT, (1, 2, 4)))
+        with mock.patch.object(self.counter, "_read_sqlite", wraps=self.counter._read_sqlite) as read:
+            self.assertEqual(await self.counter.increment(1, 2), 5)
+            self.assertEqual(await self.counter.increment(1, 2), 6)
+            self.assertEqual(await self.counter.increment(1, 3), 1)
+        self.assertEqual(read.call_count, 2)  # The two misses only
+        self.assertGreater(await self.redis.ttl(HASH_KEY.format(chat_id=1)), 0)
+
+    async def test_flush_writes_counters_to_sqlite(self):
+        await self.counter.increment(1, 2)
+        await self.counter.increment(1, 2)
+        self.assertEqual(await self.counter.flush(), 1)
+        self.assertEqual(await self.sqlite_count(1, 2), 2)
+
+    async def test_reset_leaves_neither_side_with_the_counter(self):
+        for _ in range(3):
+            await self.counter.increment(1, 2)
+        await self.counter.flush()
+        await self.counter.reset(1, 2)
+        self.assertEqual(await self.counter.get(1, 2), 0)
+        await self.counter.flush()
+        self.assertIsNone(await self.sqlite_count(1, 2))
+        self.assertFalse(await self.redis.hexists(HASH_KEY.format(chat_id=1), "2"))
+        self.assertEqual(await self.counter.increment(1, 2), 1)
+
+    async def test_warning_after_reset_is_kept_by_the_flush(self):
+        await self.counter.increment(1, 2)
+        await self.counter.reset(1, 2)
+        await self.counter.increment(1, 2)
+        await self.counter.flush()
+        self.assertEqual(await self.sqlite_count(1, 2), 1)
+        self.assertEqual(await self.counter.get(1, 2), 1)
+
+    async def test_offline_warnings_are_merged_into_the_redis_counter(self):
+        for _ in range(3):
+            await self.counter.increment(1, 2)
+        await self.counter.flush()
+        self.assertEqual(await self.counter.record_offline(1, 2), 4)
+        self.assertEqual(await self.counter.record_offline(1, 2), 5)
+        await self.counter.flush()
+        self.assertEqual(await self.counter.get(1, 2), 5)
+        self.assertEqual(await self.sqlite_count(1, 2), 5)
+
+    async def test_offline_changes_of_counters_redis_lost_go_to_sqlite(self):
+        await self.storage.write(lambda conn: conn.execute(SQL_UPSERT, (1, 2, 2)))
+        await self.counter.record_offline(1, 2)
+        await self.counter.record_offline(1, 3, reset=True)
+        await self.counter.flush()
+        self.assertEqual(await self.sqlite_count(1, 2), 3)
+        self.assertIsNone(await self.sqlite_count(1, 3))
+        self.assertEqual(await self.counter.increment(1, 2), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
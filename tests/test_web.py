@@ -0,0 +1,48 @@
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from web import build_metrics_app, build_web_app
+
+
+class _Queue:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, updates):
+        self.published += updates
+
+
+class WebAppTest(unittest.IsolatedAsyncioTestCase):
+    async def client(self, app):
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        self.addAsyncCleanup(client.close)
+        return client
+
+    def test_webhook_needs_a_secret(self):
+        with self.assertRaises(ValueError):
+            build_web_app(None, None, webhook_path="/webhook", ingest_queue=_Queue())
+
+    async def test_webhook_rejects_updates_without_the_secret(self):
+        queue = _Queue()
+        client = await self.client(build_web_app(None, None, webhook_path="/webhook", secret_token="s3cret",
+                                                 ingest_queue=queue))
+        for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "guess"}):
+            response = await client.post("/webhook", json={"update_id": 1}, headers=headers)
+            self.assertEqual(response.status, 401)
+        response = await client.post("/webhook", json={"update_id": 2},
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(queue.published, [{"update_id": 2}])
+
+    async def test_metrics_are_not_on_the_public_app(self):
+        public = await self.client(build_web_app(None, None))
+        self.assertEqual((await public.get("/metrics")).status, 404)
+        self.assertEqual((await public.get("/ping")).status, 200)
+        private = await self.client(build_metrics_app())
+        self.assertEqual((await private.get("/metrics")).status, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
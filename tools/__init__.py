@@ -0,0 +1,2 @@
+# tools/__init__.py
+# Offline tools, run with: python -m tools.<name> --help
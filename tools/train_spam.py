@@ -0,0 +1,96 @@
+"""
+Trains the optional spam model from an exported JSONL of labeled messages.
+
+    python -m tools.train_spam messages.jsonl --out spam_model.npy
+
+One JSON object per line with the message text and its label:
+
+    {"text": "FREE crypto, claim now ...", "label": "spam"}
+    {"text": "see you at the meetup", "label": "ham"}
+
+`label` may also be 1/0 or true/false (or use a boolean "spam" key instead).
+Texts are normalized exactly like the bot normalizes them before scoring. A
+held-out share of the data calibrates the scores into probabilities and is
+used for the precision/recall report, so pick /setspam thresholds from it.
+Writes spam_model.npy (weights, memory-mapped by the bot) and spam_model.json.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from services.abuse_matcher import normalize
+from services.spam_scorer import MIN_CHARS, np, train
+
+SPAM_LABELS = {"spam", "1", "true"}
+HAM_LABELS = {"ham", "0", "false"}
+
+
+def read_labeled(path: str) -> list:
+    """(normalized text, 1 for spam / 0 for ham) for every usable line."""
+    examples, skipped = [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                label = str(record["label"] if "label" in record else record["spam"]).lower()
+                text = normalize(record["text"])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                skipped += 1
+                continue
+            if label not in SPAM_LABELS and label not in HAM_LABELS or len(text.strip()) < MIN_CHARS:
+                skipped += 1
+                continue
+            examples.append((text, 1 if label in SPAM_LABELS else 0))
+    if skipped:
+        print(f"skipped {skipped} lines (unreadable, unlabeled or shorter than {MIN_CHARS} characters)")
+    return examples
+
+
+def report(scores, labels) -> None:
+    labels = np.asarray(labels, dtype=bool)
+    print(f"{'threshold':>10}{'precision':>11}{'recall':>8}{'ham removed':>13}")
+    for threshold in (0.5, 0.7, 0.8, 0.9, 0.95, 0.99):
+        flagged = scores >= threshold
+        precision = (flagged & labels).sum() / max(1, flagged.sum())
+        recall = (flagged & labels).sum() / max(1, labels.sum())
+        false_positive = (flagged & ~labels).sum() / max(1, (~labels).sum())
+        print(f"{threshold:>9.0%} {precision:>10.1%}{recall:>8.1%}{false_positive:>13.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", help="Labeled messages, one JSON object per line")
+    parser.add_argument("--out", default="spam_model.npy")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share kept out for calibration and the report")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Additive smoothing of n-gram counts")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if np is None:
+        sys.exit("NumPy is required: pip install numpy")
+
+    examples = read_labeled(args.data)
+    spam = sum(label for _, label in examples)
+    if not spam or spam == len(examples):
+        sys.exit(f"Need both spam and ham examples (got {spam} spam of {len(examples)}).")
+    random.Random(args.seed).shuffle(examples)
+    split = max(1, int(len(examples) * args.holdout))
+    held_out, training = examples[:split], examples[split:]
+    print(f"{len(examples)} messages ({spam} spam): training on {len(training)}, calibrating on {len(held_out)}")
+
+    start = time.perf_counter()
+    texts, labels = zip(*training)
+    check_texts, check_labels = zip(*held_out)
+    model = train(texts, labels, (check_texts, check_labels), alpha=args.alpha)
+    print(f"trained in {time.perf_counter() - start:.1f}s (scale {model.scale:.3f}, bias {model.bias:.3f})")
+
+    report(model.score_batch(check_texts), check_labels)
+    model.save(args.out, trained_on=len(training), spam_share=round(spam / len(examples), 4))
+    print(f"wrote {args.out}; set SPAM_MODEL to its path and restart the bot")
+
+
+if __name__ == "__main__":
+    main()
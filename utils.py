@@ -1,119 +1,208 @@
 import asyncio
+import hashlib
+import logging
 import re
-import sqlite3
 from datetime import timedelta, datetime
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List
 
 from aiogram import Bot
 from aiogram.types import Message, ChatMemberAdministrator, ChatMemberOwner, ChatPermissions
 from aiogram.exceptions import TelegramBadRequest
 
+from services.admin_cache import admin_cache
+from services.abuse_matcher import AbuseMatcher, NORMALIZE_VERSION, normalize
+from services.storage import Storage
+from services.deletion_scheduler import deletion_scheduler
+from services.username_index import username_index
+from services.audit_log import audit_log
+from services.warning_counter import warning_counter
+from services.settings import chat_settings, migrate as migrate_settings
+from services.notice_aggregator import notice_aggregator
+from services.reputation import reputation, KICK_VIOLATION
+from services.link_classifier import LinkPolicy, PATTERN_VERSION, extract_hosts
+
+logger = logging.getLogger(__name__)
+
 # --- CONFIGURATION ---
 DB_NAME = 'bot_data.db'
-WARNING_THRESHOLD = 3
-DEFAULT_WELCOME = "👋 Welcome to the group, {user_name}! Please read the rules."
 ABUSIVE = {
     "fuck", "fucker", "motherfucker", "bitch", "bastard", "asshole", "slut", "whore", "porn", "nude", "sex", "horny",
     "madarchod", "behenchod", "bhosdike", "chutiya", "gandu", "lund", "randi", "gaand", "tatti", "kutte", "suar",
     "rakhail", "harami", "bsdk", "mc", "bc", "chod", "chodu", "lavde", "laude", "launde", "randwa", "randipana",
     "bhosdapan", "madarchodgiri", "bhenchodgiri", "ullu ke pathe", "ullu ka bacha", "maa ke lode", "behen ke laude"
 }
-_link_re = re.compile(r"https?://|t\.me/|telegram\.me/|\.\w{2,3}/", re.IGNORECASE)
+_abuse_matcher = AbuseMatcher(ABUSIVE)  # Compiled once; grows with the list at no per-message cost
+# Changes whenever the word list, normalization or link pattern does, so cached verdicts from older filters are not reused
+FILTER_VERSION = hashlib.blake2b(
+    "\0".join([PATTERN_VERSION, NORMALIZE_VERSION, *sorted(ABUSIVE)]).encode(), digest_size=4
+).hexdigest()
 
 # --- DATABASE SETUP ---
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS warnings (
-            chat_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            count INTEGER NOT NULL DEFAULT 0,
-            PRIMARY KEY (chat_id, user_id)
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            chat_id INTEGER PRIMARY KEY,
-            welcome_msg TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS warnings (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (chat_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS warning_deltas (  -- Changes made while Redis was unreachable
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        delta INTEGER NOT NULL DEFAULT 0,
+        reset INTEGER NOT NULL DEFAULT 0,  -- 1: the count was reset, then `delta` warnings
+        PRIMARY KEY (chat_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS settings (
+        chat_id INTEGER PRIMARY KEY,
+        welcome_msg TEXT,
+        flood_limit INTEGER,
+        flood_period INTEGER,
+        warn_limit INTEGER,
+        raid_limit INTEGER,
+        link_version INTEGER,
+        spam_threshold INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS link_rules (
+        chat_id INTEGER NOT NULL,  -- 0: rules for every chat
+        domain TEXT NOT NULL,
+        action TEXT NOT NULL,      -- 'allow' or 'deny'
+        PRIMARY KEY (chat_id, domain)
+    );
+"""
+storage = Storage(DB_NAME, SCHEMA)
+
+async def init_db():
+    """Opens the shared connection and creates the tables. Called once at startup."""
+    await storage.open()
+    await migrate_settings(storage)
 
 # --- ADMIN CHECK ---
 async def is_admin(bot: Bot, chat_id: int, user_id: int) -> bool:
+    # Private chats (positive ids) have no administrators
+    if chat_id > 0:
+        return False
     try:
-        member = await bot.get_chat_member(chat_id, user_id)
-        return member.status in ('administrator', 'creator')
+        roster = await admin_cache.get_roster(bot, chat_id)
+        return user_id in roster.ids
     except Exception:
         return False
 
 # --- FILTER CHECKS ---
+def message_text(message: Message) -> str:
+    return (getattr(message, 'text', '') or '') + ' ' + (getattr(message, 'caption', '') or '')
+
+def has_link(message: Message, text: str) -> bool:
+    return bool(extract_hosts(text, entity_urls(message)))
+
+def entity_urls(message: Message) -> List[str]:
+    """URLs Telegram marked in the message: autolinked text and hidden text_link targets."""
+    source = message.text if message.entities else message.caption
+    urls = []
+    for entity in message.entities or message.caption_entities or ():
+        if entity.type == 'url':
+            urls.append(entity.extract_from(source))
+        elif entity.type == 'text_link':
+            urls.append(entity.url)
+    return urls
+
 def contains_link(message: Message) -> bool:
-    text = (getattr(message, 'text', '') or '') + ' ' + (getattr(message, 'caption', '') or '')
-    if bool(_link_re.search(text)): return True
-    entities = message.entities or message.caption_entities
-    if entities:
-        for entity in entities:
-            if entity.type in ('url', 'text_link'): return True
-    return False
+    return has_link(message, message_text(message))
+
+def forward_origin(message: Message) -> Optional[str]:
+    """Origin type of a forwarded message ('user', 'hidden_user', 'chat', 'channel') or None."""
+    origin = getattr(message, 'forward_origin', None)
+    if origin is not None:
+        return origin.type
+    if getattr(message, 'forward_from', None): return 'user'
+    if getattr(message, 'forward_sender_name', None): return 'hidden_user'
+    if getattr(message, 'forward_from_chat', None): return 'chat'
+    return None
 
 def is_forwarded(message: Message) -> bool:
-    return getattr(message, 'forward_from', None) or getattr(message, 'forward_sender_name', None) or getattr(message, 'forward_from_chat', None)
+    return forward_origin(message) is not None
+
+def find_abuse(normalized_text: str) -> List[str]:
+    """Abusive terms in text already passed through `normalize`."""
+    return _abuse_matcher.find_normalized(normalized_text)
 
 def contains_abuse(message: Message) -> bool:
-    text = (getattr(message, 'text', '') or '') + ' ' + (getattr(message, 'caption', '') or '')
-    words = re.findall(r"[\w']+", text.lower())
-    return any(w in ABUSIVE for w in words)
+    return _abuse_matcher.contains(message_text(message))
+
+def scan_text(text: str, policy: Optional[LinkPolicy] = None, urls: List[str] = (),
+              normalized: Optional[str] = None) -> Tuple[bool, Tuple[str, ...]]:
+    """
+    Full text verdict: (contains a forbidden link, abusive terms). The expensive part the verdict cache skips.
+    `urls` are the message's entity URLs. Without a policy every link counts as forbidden.
+    `normalized` is `normalize(text)` if the caller already has it.
+    """
+    hosts = extract_hosts(text, urls)
+    forbidden = policy.forbidden(hosts) if policy is not None else bool(hosts)
+    if normalized is None:
+        normalized = normalize(text)
+    return forbidden, tuple(_abuse_matcher.find_normalized(normalized))
+
+def media_unique_id(message: Message) -> Optional[str]:
+    """file_unique_id of the message's media (largest photo size), or None."""
+    if message.photo:
+        return message.photo[-1].file_unique_id
+    for media in (message.video, message.animation, message.document, message.sticker):
+        if media is not None:
+            return media.file_unique_id
+    return None
 
 # --- DELETE MESSAGE LATER ---
 async def delete_later(message: Message, delay: int = 10):
+    """Schedules the deletion and returns immediately; the deletion worker does the rest."""
     try:
-        await asyncio.sleep(delay)
-        await message.delete()
+        await deletion_scheduler.schedule(message.chat.id, message.message_id, delay)
     except Exception:
         pass
 
 # --- WARN SYSTEM (PERSISTENT) ---
-def _update_warning_db(chat_id: int, user_id: int, reset: bool = False) -> int:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    if reset:
-        cursor.execute("DELETE FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-        conn.commit()
-        conn.close()
-        return 0
-
-    cursor.execute("SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-    result = cursor.fetchone()
-    current_warns = result[0] if result else 0
-    new_warns = current_warns + 1
-
-    if result:
-        cursor.execute("UPDATE warnings SET count = ? WHERE chat_id = ? AND user_id = ?", (new_warns, chat_id, user_id))
-    else:
-        cursor.execute("INSERT INTO warnings (chat_id, user_id, count) VALUES (?, ?, ?)", (chat_id, user_id, new_warns))
-
-    conn.commit()
-    conn.close()
-    return new_warns
+SQL_INCREMENT_WARNING = """
+    INSERT INTO warnings (chat_id, user_id, count) VALUES (?, ?, 1)
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET count = count + 1
+    RETURNING count
+"""
+SQL_RESET_WARNINGS = "DELETE FROM warnings WHERE chat_id = ? AND user_id = ?"
+SQL_GET_WARNINGS = "SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?"
 
 async def warn_user(chat_id: int, user_id: int, reset: bool = False) -> int:
-    return await asyncio.to_thread(_update_warning_db, chat_id, user_id, reset)
+    # Hot path: one atomic Redis increment, flushed to SQLite in batches
+    if warning_counter.enabled:
+        try:
+            if reset:
+                await warning_counter.reset(chat_id, user_id)
+                return 0
+            return await warning_counter.increment(chat_id, user_id)
+        except Exception as e:
+            # Recorded as a delta the next flush merges into the Redis counter, instead of
+            # a direct SQLite write that flush would overwrite
+            logger.warning(f"Redis warning counter unavailable, recording the change offline: {e}")
+            return await warning_counter.record_offline(chat_id, user_id, reset)
+
+    if reset:
+        await storage.write(lambda conn: conn.execute(SQL_RESET_WARNINGS, (chat_id, user_id)))
+        return 0
+    return await storage.write(lambda conn: conn.execute(SQL_INCREMENT_WARNING, (chat_id, user_id)).fetchone()[0])
 
 async def get_warn_count(chat_id: int, user_id: int) -> int:
-    def _get():
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT count FROM warnings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-        result = cursor.fetchone()
-        conn.close()
+    if warning_counter.enabled:
+        try:
+            return await warning_counter.get(chat_id, user_id)
+        except Exception as e:
+            logger.warning(f"Redis warning counter unavailable, using SQLite directly: {e}")
+            return await warning_counter.get_offline(chat_id, user_id)
+
+    def _get(conn):
+        result = conn.execute(SQL_GET_WARNINGS, (chat_id, user_id)).fetchone()
         return result[0] if result else 0
-    return await asyncio.to_thread(_get)
+    return await storage.read(_get)
 
-async def check_for_kick(message: Message, new_warns: int):
-    if new_warns >= WARNING_THRESHOLD:
+async def check_for_kick(message: Message, new_warns: int, strict: bool = False):
+    """Kicks at the chat's warning limit, or on any warning when `strict`."""
+    warn_limit = (await chat_settings.get(message.chat.id)).warn_limit
+    if new_warns >= warn_limit or strict:
         user_id = message.from_user.id
         chat_id = message.chat.id
         bot = message.bot
@@ -125,35 +214,20 @@ async def check_for_kick(message: Message, new_warns: int):
             # Immediately unban to allow rejoin
             await bot.unban_chat_member(chat_id, user_id) 
             await warn_user(chat_id, user_id, reset=True)
-            await message.answer(
-                f"🚨 **{message.from_user.full_name}** was KICKED for reaching the warning limit ({WARNING_THRESHOLD} warns). Warnings reset.",
-                parse_mode="Markdown"
-            )
+            await reputation.record(user_id, KICK_VIOLATION)
+            reason = f"the warning limit ({warn_limit} warns)" if new_warns >= warn_limit else "a record of abuse across our chats (this one included)"
+            audit_log.record(chat_id, user_id, "kick", reason)
+            notice_aggregator.report(bot, chat_id, user_id, message.from_user.full_name,
+                                     f"🚨 KICKED for {reason}, warnings reset")
         except Exception as e:
             await message.answer(f"⚠️ KICK FAILED. Bot lacks permission or error: {e}")
 
 # --- WELCOME MESSAGE UTILITIES ---
 async def get_welcome_message(chat_id: int) -> str:
-    def _get():
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT welcome_msg FROM settings WHERE chat_id = ?", (chat_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else DEFAULT_WELCOME
-    return await asyncio.to_thread(_get)
+    return (await chat_settings.get(chat_id)).welcome_msg
 
 async def set_welcome_message(chat_id: int, message: str):
-    def _set():
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT OR REPLACE INTO settings (chat_id, welcome_msg) VALUES (?, ?)",
-            (chat_id, message)
-        )
-        conn.commit()
-        conn.close()
-    await asyncio.to_thread(_set)
+    await chat_settings.update(chat_id, welcome_msg=message)
 
 # --- PARSE TIME AND EXTRACT USER ---
 def parse_time(time_str: str) -> int:
@@ -166,7 +240,11 @@ def parse_time(time_str: str) -> int:
     if unit == 'd': return value * 86400
     return 3600
 
-def extract_target_user(message: Message) -> Optional[Tuple[int, int]]:
+async def extract_target_user(message: Message) -> Optional[Tuple[int, int]]:
+    """
+    (user_id, until timestamp) from a reply, a numeric id, a text_mention or an
+    @username the bot has seen before (see services/username_index.py).
+    """
     parts = message.text.strip().split()
     target_user_id = None
     mute_time_seconds = 3600
@@ -182,10 +260,17 @@ def extract_target_user(message: Message) -> Optional[Tuple[int, int]]:
             mute_time_seconds = parse_time(parts[2])
         if target_part.isdigit():
             target_user_id = int(target_part)
-        elif message.entities and message.entities[0].type == 'text_mention' and message.entities[0].user:
-            target_user_id = message.entities[0].user.id
         else:
-            return None 
+            # The first entity is the command itself; the target is the first mention after it
+            for entity in message.entities or ():
+                if entity.type == 'text_mention' and entity.user:
+                    target_user_id = entity.user.id
+                    break
+                if entity.type == 'mention':
+                    target_user_id = await username_index.resolve(entity.extract_from(message.text))
+                    break
+            if not target_user_id:
+                return None
 
     if target_user_id:
         return (target_user_id, int((datetime.now() + timedelta(seconds=mute_time_seconds)).timestamp()))
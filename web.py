@@ -0,0 +1,74 @@
+import logging
+import secrets
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from services.metrics import REGISTRY
+from services.update_queue import REDIS_FAILURES, UpdateQueue
+
+logger = logging.getLogger(__name__)
+
+# --- ROUTES ---
+async def ping(request: web.Request) -> web.Response:
+    """Health check for the hosting platform."""
+    return web.Response(text="pong")
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Prometheus scrape endpoint."""
+    body = await REGISTRY.render()
+    return web.Response(body=body.encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def ingest_handler(queue: UpdateQueue, secret_token: str):
+    """Webhook route for the ingest role: appends the raw update to the streams and returns."""
+    async def handle(request: web.Request) -> web.Response:
+        if not secrets.compare_digest(
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token):
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            await queue.publish([await request.json()])
+        except REDIS_FAILURES as e:
+            logger.error(f"Publishing a webhook update failed: {e}")
+            return web.Response(status=503, text="Unavailable")  # Telegram delivers it again later
+        return web.json_response({})
+    return handle
+
+
+def build_web_app(dp: Dispatcher, bot: Bot, webhook_path: Optional[str] = None,
+                  secret_token: Optional[str] = None,
+                  ingest_queue: Optional[UpdateQueue] = None) -> web.Application:
+    """
+    Builds the public aiohttp app: always /ping, plus the Telegram webhook route when
+    `webhook_path` is given. The webhook needs `secret_token`: requests without the matching
+    X-Telegram-Bot-Api-Secret-Token header are rejected with 401.
+    With `ingest_queue` the webhook only enqueues updates for the worker processes.
+    """
+    if webhook_path and not secret_token:
+        raise ValueError("The webhook route needs a secret token")
+    app = web.Application()
+    app.router.add_get("/ping", ping)
+
+    if webhook_path and ingest_queue is not None:
+        app.router.add_post(webhook_path, ingest_handler(ingest_queue, secret_token))
+    elif webhook_path:
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=webhook_path)
+
+    return app
+
+
+def build_metrics_app() -> web.Application:
+    """/metrics on its own app, served on a separate (by default loopback-only) listener."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+async def start_web_app(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner